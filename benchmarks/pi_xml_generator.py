@@ -0,0 +1,138 @@
+"""Generate synthetic PI XML files for benchmarking.
+
+Usage: python -m benchmarks.pi_xml_generator OUT [options]
+
+The output only depends on the arguments (including the seed), so that
+benchmark results of different commits can be compared.
+
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tslib.writers.pi_xml_writer import format_datetimes
+
+PROLOG = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<TimeSeries xmlns="http://www.wldelft.nl/fews/PI" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.wldelft.nl/fews/PI '
+    'http://fews.wldelft.nl/schemas/version1.0/pi-schemas/pi_timeseries.xsd" '
+    'version="1.2">\n'
+)
+
+HEADER = '''    <series>
+        <header>
+            <type>instantaneous</type>
+            <locationId>{location}</locationId>
+            <parameterId>{parameter}</parameterId>
+            <timeStep unit="second" multiplier="{step}"/>
+            <startDate date="{start_date}" time="{start_time}"/>
+            <endDate date="{end_date}" time="{end_time}"/>
+            <missVal>{miss_val}</missVal>
+            <stationName>Station {location}</stationName>
+            <lat>{lat:.5f}</lat>
+            <lon>{lon:.5f}</lon>
+            <units>m</units>
+        </header>
+'''
+
+ATTRIBUTES = ('flag', 'flagSource', 'comment', 'user')
+MISS_VAL = '-999.0'
+STEP = 900
+
+
+def generate(path, series=10, events=1000, attributes=('flag',),
+             miss_val_density=0.0, tz=1.0, seed=0):
+    """Write a synthetic PI XML file.
+
+    Args:
+        path(str): the output file
+        series(int): the number of series
+        events(int): the number of events per series
+        attributes(tuple): optional event attributes, see ATTRIBUTES
+        miss_val_density(float): the fraction of missing values
+        tz(float): the timeZone, or None to omit it
+        seed(int): the seed of the random generator
+
+    Returns:
+        the total number of events
+    """
+    rng = np.random.RandomState(seed)
+    index = pd.date_range('2020-01-01', periods=events, freq='%ss' % STEP)
+    dates, times = format_datetimes(index)
+    template = '        <event date="%s" time="%s" value="%s"{}/>\n'.format(
+        ''.join(' {}="%s"'.format(name) for name in attributes))
+
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write(PROLOG)
+        if tz is not None:
+            out.write('    <timeZone>{}</timeZone>\n'.format(tz))
+        for i in range(series):
+            out.write(HEADER.format(
+                location='loc{:05d}'.format(i // 4),
+                parameter='par{}'.format(i % 4),
+                step=STEP,
+                start_date=dates[0] if events else '2020-01-01',
+                start_time=times[0] if events else '00:00:00',
+                end_date=dates[-1] if events else '2020-01-01',
+                end_time=times[-1] if events else '00:00:00',
+                miss_val=MISS_VAL,
+                lat=rng.uniform(50, 54),
+                lon=rng.uniform(3, 7),
+            ))
+            values = rng.standard_normal(events).round(3).astype(str)
+            values[rng.rand(events) < miss_val_density] = MISS_VAL
+            columns = [dates, times, values]
+            for name in attributes:
+                if name == 'flag':
+                    columns.append(rng.randint(0, 10, events).astype(str))
+                elif name == 'comment':
+                    columns.append(np.char.add(
+                        'comment ', rng.randint(0, 100, events).astype(str)))
+                else:
+                    columns.append(np.full(events, name))
+            out.write(''.join(map(
+                template.__mod__, zip(*[c.tolist() for c in columns]))))
+            out.write('    </series>\n')
+        out.write('</TimeSeries>\n')
+
+    return series * events
+
+
+def generate_list(series=10, events=1000, seed=0):
+    """Return a synthetic input of ListReader."""
+    rng = np.random.RandomState(seed)
+    index = pd.date_range('2020-01-01', periods=events, freq='%ss' % STEP)
+    datetimes = index.strftime('%Y-%m-%dT%H:%M:%SZ').tolist()
+    serieslist = []
+    for i in range(series):
+        values = rng.standard_normal(events).round(3).tolist()
+        flags = rng.randint(0, 10, events).tolist()
+        serieslist.append({'uuid': 'uuid{}'.format(i), 'events': [
+            {'datetime': dt, 'value': value, 'flag': flag}
+            for dt, value, flag in zip(datetimes, values, flags)
+        ]})
+    return serieslist
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--series', type=int, default=10)
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--attributes', nargs='*', default=['flag'],
+                        choices=ATTRIBUTES)
+    parser.add_argument('--miss-val-density', type=float, default=0.0)
+    parser.add_argument('--tz', type=float, default=1.0)
+    parser.add_argument('--no-tz', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.path, args.series, args.events, tuple(args.attributes),
+             args.miss_val_density, None if args.no_tz else args.tz,
+             args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark PiXmlWriter.set_series against the former iterrows version.
+
+Usage: python -m benchmarks.pi_xml_writer_bench [number of rows]
+
+Both implementations serialize the same series and the resulting
+documents are compared byte for byte. The header has no missVal,
+so that NaN values are rendered identically by both. The events span
+daylight saving time changes, which both convert to the fixed offset
+of the writer.
+
+"""
+import sys
+import time
+
+from lxml import etree
+import numpy as np
+import pandas as pd
+import xmltodict
+
+from tslib.writers import PiXmlWriter
+from tslib.writers.pi_xml_writer import DATE_FMT
+from tslib.writers.pi_xml_writer import TIME_FMT
+from tslib.writers.pi_xml_writer import set_datetime
+
+
+class LegacyPiXmlWriter(PiXmlWriter):
+    """PiXmlWriter.set_series as it was before the columnar serializer."""
+
+    def set_series(self, metadata, dataframe):
+        series = etree.SubElement(self.root, 'series')
+
+        if not dataframe.empty:
+            dataframe = dataframe.tz_convert(self.tz)
+            set_datetime(metadata, dataframe)
+
+        header = xmltodict.unparse(metadata)
+        header = bytes(bytearray(header, encoding='utf-8'))
+        header = etree.XML(header)
+        series.append(header)
+
+        if dataframe.empty:
+            return
+
+        for idx, row in dataframe.iterrows():
+            event = etree.SubElement(series, 'event')
+            event.attrib['date'] = idx.strftime(DATE_FMT)
+            event.attrib['time'] = idx.strftime(TIME_FMT)
+            for col in dataframe.columns.tolist():
+                event.attrib[col] = str(row[col])
+
+
+def metadata():
+    return {'header': {
+        'type': 'instantaneous',
+        'locationId': 'bench',
+        'parameterId': 'H',
+        'timeStep': {'@unit': 'second', '@multiplier': '900'},
+        'startDate': {'@date': '', '@time': ''},
+        'endDate': {'@date': '', '@time': ''},
+    }}
+
+
+def dataframe(rows):
+    rng = np.random.RandomState(0)
+    index = pd.date_range(
+        '2021-03-27', periods=rows, freq='15min', tz='Europe/Amsterdam')
+    value = rng.standard_normal(rows) * 10.0 ** rng.randint(-6, 18, rows)
+    value[rng.rand(rows) < 0.05] = np.nan
+    flag = rng.randint(0, 9, rows)
+    comment = np.where(rng.rand(rows) < 0.01, 'a "quoted" <&>\n', None)
+    return pd.DataFrame(
+        {'value': value, 'flag': flag, 'comment': comment}, index=index)
+
+
+def run(writer_class, df):
+    writer = writer_class(offset_in_hours=1.0)
+    start = time.perf_counter()
+    writer.set_series(metadata(), df)
+    elapsed = time.perf_counter() - start
+    return elapsed, etree.tostring(writer.root, pretty_print=True)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    df = dataframe(rows)
+    legacy_time, legacy = run(LegacyPiXmlWriter, df)
+    columnar_time, columnar = run(PiXmlWriter, df)
+    print('rows: {}'.format(rows))
+    print('iterrows: {:.3f} s'.format(legacy_time))
+    print('columnar: {:.3f} s'.format(columnar_time))
+    print('speedup: {:.1f}x'.format(legacy_time / columnar_time))
+    print('identical: {}'.format(legacy == columnar))
+    return 0 if legacy == columnar else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
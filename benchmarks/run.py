@@ -0,0 +1,198 @@
+"""Benchmark the readers and writers on synthetic PI XML files.
+
+Usage: python -m benchmarks.run [--output results.json] [options]
+
+Every case runs in a fresh Python process, so that its peak resident
+set size (RSS) is its own. The results are written as JSON, which makes
+it possible to compare commits, e.g. by running the suite on both and
+comparing the events_per_second of every case.
+
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import lxml.etree
+import numpy as np
+import pandas as pd
+
+from benchmarks.pi_xml_generator import generate
+from benchmarks.pi_xml_generator import generate_list
+
+CASES = [
+    'get_series',
+    'bulk_get_series',
+    'list_reader',
+    'pi_xml_writer',
+    'pi_xml_stream_writer',
+]
+
+# (name, arguments of `generate`)
+DATASETS = [
+    ('many_short', dict(series=2000, events=100)),
+    ('few_long', dict(series=10, events=50000)),
+    ('all_attributes', dict(
+        series=100, events=5000,
+        attributes=('flag', 'flagSource', 'comment', 'user'))),
+    ('missing_values', dict(series=100, events=5000, miss_val_density=0.2)),
+    ('no_tz', dict(series=100, events=5000, tz=None)),
+]
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def consume(chunks, count):
+    """Iterate chunks, return the number of events and time to first."""
+    start = time.perf_counter()
+    first = None
+    events = 0
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+        events += count(chunk)
+    return events, first
+
+
+def run_case(case, path, dataset):
+    """Run a single case in this process and return its measurements."""
+    from tslib.readers import ListReader
+    from tslib.readers import PiXmlReader
+    from tslib.writers import PiXmlStreamWriter
+    from tslib.writers import PiXmlWriter
+
+    def length(chunk):
+        return 0 if chunk[1] is None else len(chunk[1])
+
+    if case in ('pi_xml_writer', 'pi_xml_stream_writer'):
+        offset = dataset.get('tz', 1.0)
+        tz = 'Etc/GMT{:+d}'.format(-int(offset or 0))
+        series = []
+        for metadata, dataframe in PiXmlReader(path).get_series():
+            if dataframe is None:
+                continue
+            # the frames are localized if the file has a timeZone
+            if dataframe.index.tz is None:
+                dataframe = dataframe.tz_localize(tz)
+            else:
+                dataframe = dataframe.tz_convert(tz)
+            series.append((metadata, dataframe))
+    elif case == 'list_reader':
+        serieslist = generate_list(
+            dataset.get('series', 10), dataset.get('events', 1000))
+
+    rss_before = peak_rss()
+    start = time.perf_counter()
+
+    if case == 'get_series':
+        events, first = consume(PiXmlReader(path).get_series(), length)
+    elif case == 'bulk_get_series':
+        events, first = consume(PiXmlReader(path).bulk_get_series(), length)
+    elif case == 'list_reader':
+        events, first = consume(ListReader(serieslist).get_series(), length)
+    elif case == 'pi_xml_writer':
+        writer = PiXmlWriter(offset or 0.0)
+        events, first = consume(
+            (writer.set_series(*item) or item for item in series), length)
+        with open(os.devnull, 'wb') as out:
+            writer.write(out)
+    elif case == 'pi_xml_stream_writer':
+        with open(os.devnull, 'wb') as out:
+            with PiXmlStreamWriter(out, offset or 0.0) as writer:
+                events, first = consume(
+                    (writer.set_series(*item) or item for item in series),
+                    length)
+    else:
+        raise ValueError('unknown case: {}'.format(case))
+
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'events': events,
+        'events_per_second': events / seconds if seconds else None,
+        'time_to_first_chunk': first,
+        'peak_rss_bytes': peak_rss(),
+        'peak_rss_before_bytes': rss_before,
+    }
+
+
+def run_in_subprocess(case, path, dataset):
+    output = subprocess.check_output([
+        sys.executable, '-m', 'benchmarks.run', '--worker',
+        json.dumps([case, path, dataset]),
+    ])
+    return json.loads(output)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='JSON file (default: stdout)')
+    parser.add_argument('--cases', nargs='*', default=CASES, choices=CASES)
+    parser.add_argument('--datasets', nargs='*',
+                        default=[name for name, _ in DATASETS],
+                        choices=[name for name, _ in DATASETS])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the number of events per series')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_case(*json.loads(args.worker)), sys.stdout)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, dataset in DATASETS:
+            if name not in args.datasets:
+                continue
+            dataset = dict(dataset)
+            dataset['events'] = int(dataset['events'] * args.scale)
+            path = os.path.join(tmpdir, name + '.xml')
+            generate(path, **dataset)
+            dataset['bytes'] = os.path.getsize(path)
+            for case in args.cases:
+                for run in range(args.repeat):
+                    result = run_in_subprocess(case, path, dataset)
+                    result.update(case=case, dataset=name, run=run,
+                                  parameters=dataset)
+                    results.append(result)
+                    sys.stderr.write('{} {} {:.0f} events/s\n'.format(
+                        case, name, result['events_per_second'] or 0))
+
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'lxml': '.'.join(map(str, lxml.etree.LXML_VERSION)),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,15 @@ tests_require = [
     'pytest-cov',
     ]
 
+parquet_require = [
+    # ParquetWriter.add_key_value_metadata
+    'pyarrow>=17.0.0',
+    ]
+
+zstd_require = [
+    'zstandard',
+    ]
+
 setup(name='tslib',
       version=version,
       description="A library for manipulating time series",
@@ -38,7 +47,8 @@ setup(name='tslib',
       zip_safe=False,
       install_requires=install_requires,
       tests_require=tests_require,
-      extras_require={'test': tests_require},
+      extras_require={'test': tests_require, 'parquet': parquet_require,
+                      'zstd': zstd_require},
       entry_points={
           'console_scripts': [
           ]},
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = ('mean', 'min', 'max', 'sum', 'count', 'last')
+
+# The origins of the bins that are not a timestamp, see `Resampler`
+ORIGINS = ('epoch', 'start_day', 'start')
+
+DAY = 24 * 3600 * 10 ** 9
+
+# The partial results of a group, which can be combined across chunks
+PARTIALS = ('count', 'sum', 'min', 'max', 'last')
+
+INDEX_NAMES = ['code', 'location_code', 'timestamp']
+
+
+class Resampler(object):
+    """Resample all series of bulk chunks at once.
+
+    The chunks are dataframes as returned by `PiXmlReader.bulk_get_series`,
+    i.e. having a (code, location_code, timestamp) index and a value
+    column (and optionally a flag column). The events are aggregated per
+    series and per bin of a fixed frequency, for all series at once by
+    NumPy instead of a `DataFrame.resample` per series.
+
+    Missing values (NaN, which the reader makes of the missVal) are left
+    out, as are events having a flag above max_flag. A bin of which all
+    events are left out has a count and sum of 0 and NaN otherwise. Bins
+    without any events are not in the result (as in a groupby).
+
+    Chunks are aggregated one by one. The last bin of a chunk may continue
+    in the next chunk, so its partial results are carried over until the
+    next chunk (or `flush`). Usage:
+
+    resampler = Resampler('1h', how=['mean', 'max'], max_flag=5)
+    for dataframe in resampler.chunks(reader.bulk_get_series()):
+        store(dataframe)
+
+    The events of a chunk are sorted by series and time if needed, which
+    they already are in bulk chunks. A series must not continue in the
+    next chunk other than with its next events.
+
+    """
+
+    def __init__(self, freq, how=('mean',), max_flag=None, closed='left',
+                 label='left', origin='epoch'):
+        """docstring
+
+        Args:
+            freq: a fixed frequency, e.g. '15min', '1h', '1D' or a Timedelta
+            how: the aggregations, a subset of 'mean', 'min', 'max', 'sum',
+                'count' and 'last' (the columns of the result, in order)
+            max_flag(int): leave out events having a higher flag (e.g. 5
+                for the FEWS flags up to "completed doubtful")
+            closed(str): the closed side of the bins, 'left' or 'right'
+            label(str): the side of the bins to label them by
+            origin: the timestamp to align the bins to, as in
+                `DataFrame.resample`: 'epoch' (1970-01-01, the default),
+                'start_day' (the midnight of the first event of a series),
+                'start' (its first event) or a timestamp
+
+        Bins are aligned in the (wall) time of the time zone of the index.
+        Unlike pandas, the default origin is the epoch, so that the bins
+        of all series (and chunks) are the same.
+
+        Raises:
+            ValueError: for a frequency that is not fixed (like 'MS'), an
+                unknown aggregation or origin
+        """
+        if isinstance(how, str):
+            how = [how]
+        for name in how:
+            if name not in AGGREGATIONS:
+                raise ValueError("unknown aggregation: {!r}".format(name))
+        if closed not in ('left', 'right') or label not in ('left', 'right'):
+            raise ValueError("closed and label must be 'left' or 'right'")
+        try:
+            self.freq = pd.to_timedelta(freq).value
+        except ValueError:
+            raise ValueError("not a fixed frequency: {!r}".format(freq))
+        if self.freq <= 0:
+            raise ValueError("not a positive frequency: {!r}".format(freq))
+        if not (isinstance(origin, str) and origin in ORIGINS):
+            try:
+                origin = pd.Timestamp(origin)
+            except ValueError:
+                raise ValueError("unknown origin: {!r}".format(origin))
+        self.how = list(how)
+        self.max_flag = max_flag
+        self.closed = closed
+        self.label = label
+        self.origin = origin
+        self.tz = None
+        self._carry = None
+        # the origin (in nanoseconds) per series, for series that
+        # continue in the next chunk
+        self._origins = {}
+
+    def update(self, dataframe):
+        """Aggregate a chunk and return the bins that are complete."""
+        partials = self._partials(dataframe)
+        if self._carry is not None:
+            partials = combine(self._carry, partials)
+            self._carry = None
+        size = len(partials['bin'])
+        if size == 0:
+            return self._result(partials)
+        self._carry = {key: array[-1:] for key, array in partials.items()}
+        return self._result({key: array[:-1]
+                             for key, array in partials.items()})
+
+    def flush(self):
+        """Return the bin that was carried over, as a dataframe."""
+        partials = self._carry
+        self._carry = None
+        if partials is None:
+            partials = empty_partials()
+        return self._result(partials)
+
+    def chunks(self, chunks):
+        """Yield the aggregated chunks of (metadata, dataframe) tuples.
+
+        Empty results are left out.
+        """
+        for _, dataframe in chunks:
+            result = self.update(dataframe)
+            if len(result):
+                yield result
+        result = self.flush()
+        if len(result):
+            yield result
+
+    def _partials(self, dataframe):
+        """Return the partial results of the bins of a chunk."""
+        index = dataframe.index
+        timestamps = index.levels[2]
+        if self.tz is None and timestamps.tz is not None:
+            self.tz = timestamps.tz
+        # aggregate in local (wall) time
+        if timestamps.tz is not None:
+            timestamps = timestamps.tz_localize(None)
+        nanoseconds = timestamps.values.astype('datetime64[ns]').view(
+            'i8')[index.codes[2]]
+        codes = np.asarray(index.codes[0], dtype=np.int64)
+        locations = np.asarray(index.codes[1], dtype=np.int64)
+
+        values = np.asarray(dataframe['value'], dtype=np.float64)
+        valid = ~np.isnan(values)
+        if self.max_flag is not None and 'flag' in dataframe:
+            flags = dataframe['flag'].to_numpy(dtype=np.float64,
+                                               na_value=np.nan)
+            # events without a flag are kept
+            valid &= ~(flags > self.max_flag)
+
+        if not is_grouped(codes, locations, nanoseconds):
+            order = np.lexsort((nanoseconds, locations, codes))
+            codes, locations, nanoseconds = \
+                codes[order], locations[order], nanoseconds[order]
+            values, valid = values[order], valid[order]
+
+        origins = self._series_origins(index, codes, locations, nanoseconds)
+        bins = bin_starts(nanoseconds - origins, self.freq, self.closed)
+        bins += origins
+        starts = group_starts(codes, locations, bins)
+        partials = group_partials(values, valid, starts, bins)
+        partials['code'] = level_values(index.levels[0], codes[starts])
+        partials['location_code'] = level_values(
+            index.levels[1], locations[starts])
+        return partials
+
+    def _series_origins(self, index, codes, locations, nanoseconds):
+        """Return the origin of the bins of the (grouped) rows."""
+        if not isinstance(self.origin, str):
+            origin = self.origin
+            if origin.tz is not None:
+                origin = origin.tz_convert(self.tz).tz_localize(None)
+            return origin.as_unit('ns').value
+        if self.origin == 'epoch':
+            return 0
+        starts = group_starts(codes, locations)
+        keys = zip(level_values(index.levels[0], codes[starts]),
+                   level_values(index.levels[1], locations[starts]))
+        firsts = nanoseconds[starts]
+        if self.origin == 'start_day':
+            firsts = firsts // DAY * DAY
+        origins = np.array([
+            self._origins.setdefault(key, first)
+            for key, first in zip(keys, firsts.tolist())
+        ], dtype=np.int64)
+        return np.repeat(origins, np.diff(np.append(starts, len(codes))))
+
+    def _result(self, partials):
+        """Return the dataframe of the (complete) bins."""
+        count = partials['count']
+        empty = count == 0
+        data = {}
+        for name in self.how:
+            if name == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    column = partials['sum'] / count
+            elif name == 'count':
+                column = count
+            else:
+                column = partials[name]
+            if name in ('mean', 'min', 'max', 'last'):
+                column = np.where(empty, np.nan, column)
+            data[name] = column
+
+        bins = partials['bin']
+        if self.label == 'right':
+            bins = bins + self.freq
+        timestamps = pd.DatetimeIndex(bins.astype('datetime64[ns]'))
+        if self.tz is not None:
+            timestamps = timestamps.tz_localize(self.tz)
+        index = pd.MultiIndex.from_arrays([
+            pd.Categorical(partials['code']),
+            pd.Categorical(partials['location_code']),
+            timestamps,
+        ], names=INDEX_NAMES)
+        return pd.DataFrame(data, index=index, columns=self.how)
+
+
+def resample(dataframe, freq, how=('mean',), max_flag=None, closed='left',
+             label='left', origin='epoch'):
+    """Resample all series of a bulk dataframe at once.
+
+    See `Resampler` for the arguments and result.
+    """
+    resampler = Resampler(freq, how, max_flag, closed, label, origin)
+    return pd.concat([resampler.update(dataframe), resampler.flush()])
+
+
+def bin_starts(nanoseconds, freq, closed='left'):
+    """Return the start of the bins of int64 timestamps, in nanoseconds.
+
+    The bins are [start, start + freq) if closed on the left, or
+    (start, start + freq] if on the right.
+    """
+    if closed == 'left':
+        return nanoseconds // freq * freq
+    return -(-nanoseconds // freq) * freq - freq
+
+
+def is_grouped(*keys):
+    """Return whether the rows of a series are consecutive and sorted.
+
+    Args:
+        keys: the int arrays of the code, location and time of the rows
+    """
+    *series, times = keys
+    if len(times) < 2:
+        return True
+    same = np.ones(len(times) - 1, dtype=bool)
+    for key in series:
+        same &= key[1:] == key[:-1]
+    if np.any(same & (times[1:] < times[:-1])):
+        return False
+    # every series must have a single run
+    runs = np.flatnonzero(~same) + 1
+    pairs = set(zip(*(key[np.r_[0, runs]].tolist() for key in series)))
+    return len(pairs) == len(runs) + 1
+
+
+def group_starts(*keys):
+    """Return the positions where the (consecutive) keys change."""
+    size = len(keys[0])
+    if size == 0:
+        return np.empty(0, dtype=np.intp)
+    new = np.zeros(size, dtype=bool)
+    new[0] = True
+    for key in keys:
+        new[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(new)
+
+
+def empty_partials():
+    """Return the partial results of no groups at all."""
+    partials = {key: np.empty(0) for key in PARTIALS}
+    partials['count'] = np.empty(0, dtype=np.int64)
+    partials['bin'] = np.empty(0, dtype=np.int64)
+    partials['code'] = np.empty(0, dtype=object)
+    partials['location_code'] = np.empty(0, dtype=object)
+    return partials
+
+
+def group_partials(values, valid, starts, bins):
+    """Return the partial results of the groups starting at starts.
+
+    Args:
+        values: the float ndarray of the values of the (grouped) rows
+        valid: the bool ndarray of the rows to be aggregated
+        starts: the positions of the first rows of the groups
+        bins: the int64 ndarray of the bins of the rows
+    """
+    if len(starts) == 0:
+        return empty_partials()
+    positions = np.where(valid, np.arange(len(values)), -1)
+    last = np.maximum.reduceat(positions, starts)
+    return {
+        'bin': bins[starts],
+        'count': np.add.reduceat(valid.astype(np.int64), starts),
+        'sum': np.add.reduceat(np.where(valid, values, 0.0), starts),
+        'min': np.minimum.reduceat(np.where(valid, values, np.inf), starts),
+        'max': np.maximum.reduceat(np.where(valid, values, -np.inf), starts),
+        'last': np.where(last >= 0, values[last], np.nan),
+    }
+
+
+def combine(carry, partials):
+    """Put the partial results of a carried bin before those of a chunk.
+
+    If the chunk starts with the same bin (of the same series), the two
+    are combined.
+    """
+    if len(partials['bin']) and all(
+            carry[key][0] == partials[key][0]
+            for key in ('code', 'location_code', 'bin')):
+        partials = {key: array.copy() for key, array in partials.items()}
+        partials['count'][0] += carry['count'][0]
+        partials['sum'][0] += carry['sum'][0]
+        partials['min'][0] = min(partials['min'][0], carry['min'][0])
+        partials['max'][0] = max(partials['max'][0], carry['max'][0])
+        if np.isnan(partials['last'][0]):
+            partials['last'][0] = carry['last'][0]
+        return partials
+    return {key: np.concatenate([carry[key], partials[key]])
+            for key in partials}
+
+
+def level_values(level, codes):
+    """Return the values of index level codes (None for -1) as objects."""
+    values = np.append(np.asarray(level, dtype=object), None)
+    return values[codes]
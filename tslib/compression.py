@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import gzip
+import io
+import queue
+import threading
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+# The compression of a file is recognized by its first bytes
+MAGIC = [
+    (b'\x1f\x8b', GZIP),
+    (b'\x28\xb5\x2f\xfd', ZSTD),
+]
+
+# The size of the blocks that are decompressed ahead of the parser
+BLOCK_SIZE = 256 * 1024
+
+
+def detect(head):
+    """Return the compression of the first bytes of a file, or None."""
+    for magic, compression in MAGIC:
+        if bytes(head[:len(magic)]) == magic:
+            return compression
+    return None
+
+
+def source_compression(source):
+    """Return the compression of a source, or None if not compressed.
+
+    A source can be a path, bytes, a memory map or a binary file object.
+    A file object is rewound after peeking (and assumed uncompressed if
+    it cannot be).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)) or \
+            hasattr(source, 'madvise'):
+        return detect(source[:4])
+    if hasattr(source, 'read'):
+        if hasattr(source, 'peek'):
+            return detect(source.peek(4))
+        try:
+            position = source.tell()
+            head = source.read(4)
+            source.seek(position)
+        except (AttributeError, OSError):
+            return None
+        return detect(head)
+    with open(source, 'rb') as f:
+        return detect(f.read(4))
+
+
+def decompressor(fileobj, compression):
+    """Return a file object of the decompressed bytes of fileobj."""
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ImportError("zstd compression requires zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(
+            fileobj, read_across_frames=True, closefd=False)
+    raise ValueError("unknown compression: {!r}".format(compression))
+
+
+def compressor(out, compression, level=None):
+    """Return a file object that writes compressed bytes to out.
+
+    Closing it finishes the compressed stream, but leaves out open.
+
+    Args:
+        out: a binary file object
+        compression(str): 'gzip' or 'zstd'
+        level(int): the compression level (default 6 for gzip and 3
+            for zstd)
+    """
+    if compression == GZIP:
+        return gzip.GzipFile(
+            fileobj=out, mode='wb', compresslevel=6 if level is None
+            else level)
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ImportError("zstd compression requires zstandard")
+        return zstandard.ZstdCompressor(
+            level=3 if level is None else level).stream_writer(
+                out, closefd=False)
+    raise ValueError("unknown compression: {!r}".format(compression))
+
+
+def compress(data, compression, level=None):
+    """Return data compressed, see `compressor`."""
+    out = io.BytesIO()
+    with compressor(out, compression, level) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+class DecompressingReader(object):
+    """A file object of the decompressed bytes of a source.
+
+    The source is decompressed by a background thread, in blocks that
+    are passed through a bounded queue, so that decompression overlaps
+    with parsing while no more than queue_size blocks are kept in
+    memory. Exceptions of the thread are raised by `read`.
+
+    Usage:
+
+    with DecompressingReader('export.xml.gz') as f:
+        for event, element in etree.iterparse(f, tag=SERIES):
+            pass
+
+    """
+
+    def __init__(self, source, compression=None, queue_size=4,
+                 block_size=BLOCK_SIZE):
+        """docstring
+
+        Args:
+            source: a path, bytes or binary file object (left open)
+            compression(str): 'gzip' or 'zstd' (default: detected)
+            queue_size(int): the number of blocks decompressed ahead
+            block_size(int): the size of the (decompressed) blocks
+        """
+        if compression is None:
+            compression = source_compression(source)
+        if isinstance(source, (bytes, bytearray, memoryview)) or \
+                hasattr(source, 'madvise'):
+            self._file = io.BytesIO(source)
+            self._owned = True
+        elif hasattr(source, 'read'):
+            self._file = source
+            self._owned = False
+        else:
+            self._file = open(source, 'rb')
+            self._owned = True
+        self._reader = decompressor(self._file, compression)
+        self._block_size = block_size
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._block = b''
+        self._offset = 0
+        self._eof = False
+        self.position = 0
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # wait for room, unless the consumer has stopped
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                block = self._reader.read(self._block_size)
+                if not block:
+                    break
+                self._put((block, None))
+        except BaseException as error:
+            self._put((None, error))
+        else:
+            self._put((b'', None))
+
+    def read(self, size=-1):
+        """Return at most size decompressed bytes (all if negative)."""
+        if size is None or size < 0:
+            parts = []
+            while True:
+                part = self.read(self._block_size)
+                if not part:
+                    return b''.join(parts)
+                parts.append(part)
+        if self._offset >= len(self._block):
+            if self._eof:
+                return b''
+            block, error = self._queue.get()
+            if error is not None:
+                self._eof = True
+                raise error
+            if not block:
+                self._eof = True
+                return b''
+            self._block, self._offset = block, 0
+        start = self._offset
+        self._offset = min(start + size, len(self._block))
+        self.position += self._offset - start
+        return self._block[start:self._offset]
+
+    def tell(self):
+        """Return the number of decompressed bytes read."""
+        return self.position
+
+    def close(self):
+        """Stop the thread and close the source, if opened here."""
+        self._stop.set()
+        self._thread.join()
+        self._reader.close()
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@contextmanager
+def open_source(source):
+    """Yield the source itself, or a decompressing reader if compressed."""
+    compression = source_compression(source)
+    if compression is None:
+        yield source
+    else:
+        with DecompressingReader(source, compression) as reader:
+            yield reader
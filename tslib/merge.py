@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pytz import FixedOffset
+
+from tslib.readers.ingest import expand_paths
+from tslib.readers.pi_xml_reader import OPTIONAL_ATTRIBUTES
+from tslib.readers.pi_xml_reader import dataframe_from_bulk
+from tslib.readers.pi_xml_reader import get_code
+from tslib.readers.pi_xml_reader import iter_bulk_series
+from tslib.readers.pi_xml_reader import select_attributes
+from tslib.readers.pi_xml_reader import series_metadata
+from tslib.writers.pi_xml_writer import PiXmlStreamWriter
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('last', 'first', 'best_flag')
+
+# The order of the elements of a PI XML series header
+PI_HEADER = ['type', 'locationId', 'parameterId', 'timeStep', 'startDate',
+             'endDate', 'missVal', 'stationName', 'lat', 'lon', 'units']
+
+# The sort keys of the rows of a run, least significant first
+SORT_KEYS = ['tie', 'rank', 'time', 'series']
+
+# The bits of the row order that hold the position of a row in its file
+ROW_BITS = 40
+
+
+class PiXmlMerge(object):
+    """Merge the series of many PI XML files into one deduplicated set.
+
+    Events of the same series (code and location_code) and timestamp are
+    conflicts, of which one wins, according to the policy:
+
+    - 'last': the event of the last file (in the order of the paths)
+    - 'first': the event of the first file
+    - 'best_flag': the event having the lowest (i.e. best) FEWS flag, or
+      of the last file if equal. A missing flag counts as 0.
+
+    The merge is done out of core: the events are read file by file and
+    spilled to disk in sorted runs of at most run_rows events, which are
+    merged by a k-way merge in blocks of block_rows events. Memory use
+    is therefore bounded by run_rows and the number of runs times
+    block_rows, not by the size of the files.
+
+    The merged series are in the order in which they first appear, their
+    events are sorted by time. Timestamps of files in different time
+    zones are compared in UTC (those without a timeZone are taken as
+    UTC). The result has the timeZone of the first file having one.
+
+    Usage:
+
+    merge = PiXmlMerge(['forecast_1.xml', 'forecast_2.xml'], policy='last')
+    for metadata, dataframe in merge.chunks():
+        store(metadata, dataframe)
+
+    with open('merged.xml', 'wb') as out:
+        merge.write(out)
+
+    """
+
+    def __init__(self, paths, policy='last', attributes=('flag',),
+                 run_rows=1000000, block_rows=65536, tmpdir=None):
+        """docstring
+
+        Args:
+            paths: a glob pattern, or a list of paths and/or patterns
+            policy(str): 'last' (default), 'first' or 'best_flag'
+            attributes: the optional event attributes to keep (default
+                flag only, None for all)
+            run_rows(int): the number of events per sorted run
+            block_rows(int): the number of events per block of a run
+            tmpdir(str): the directory of the runs (default: the system's)
+        """
+        if policy not in POLICIES:
+            raise ValueError(
+                "policy must be one of {}".format(', '.join(POLICIES)))
+        self.paths = expand_paths(paths)
+        self.policy = policy
+        self.attributes = select_attributes(attributes)
+        self.run_rows = run_rows
+        self.block_rows = block_rows
+        self.tmpdir = tmpdir
+
+    def chunks(self, chunk_size=250000):
+        """Yield (metadata, dataframe) tuples of the merged events.
+
+        The chunks are those of `PiXmlReader.bulk_get_series`, except that
+        the code and location_code levels of all chunks have the same
+        categories.
+        """
+        for merged in self._merged():
+            for block in regroup(merged.blocks(), chunk_size):
+                yield merged.chunk(block)
+
+    def write(self, out, offset_in_hours=None, **options):
+        """Write the merged series as a PI XML to a binary file object.
+
+        The series are streamed by a `PiXmlStreamWriter`, having the
+        timeZone of the merged series unless offset_in_hours is given.
+        The other options (e.g. compression) are those of the writer.
+
+        An attribute is only written for the events of a series if all
+        its events have it.
+        """
+        for merged in self._merged():
+            if offset_in_hours is None:
+                offset_in_hours = merged.offset_in_hours or 0.0
+            with PiXmlStreamWriter(out, offset_in_hours=offset_in_hours,
+                                   **options) as writer:
+                for metadata, dataframe in merged.series(offset_in_hours):
+                    writer.set_series(metadata, dataframe)
+
+    def _merged(self):
+        """Yield a `MergedRuns` of the files, in a temporary directory."""
+        directory = tempfile.mkdtemp(prefix='tslib-merge-', dir=self.tmpdir)
+        try:
+            merged = MergedRuns(self.attributes, self.block_rows)
+            runs = RunWriter(directory, self.run_rows, self.block_rows)
+            for index, path in enumerate(self.paths):
+                merged.spill(index, path, self.policy, runs)
+            runs.flush()
+            merged.runs = runs.paths
+            logger.debug('Merging %d runs of %d files', len(runs.paths),
+                         len(self.paths))
+            yield merged
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class RunWriter(object):
+    """Collect rows and write them to disk in sorted runs."""
+
+    def __init__(self, directory, run_rows, block_rows):
+        self.directory = directory
+        self.run_rows = run_rows
+        self.block_rows = block_rows
+        self.paths = []
+        self.parts = []
+        self.size = 0
+
+    def add(self, rows):
+        """Add a dict of arrays, a run is written if enough are added."""
+        self.parts.append(rows)
+        self.size += len(rows['time'])
+        if self.size >= self.run_rows:
+            self.flush()
+
+    def flush(self):
+        """Sort the rows collected so far and write them as a run."""
+        if not self.parts:
+            return
+        rows = concatenate(self.parts)
+        rows = take(rows, np.lexsort([rows[key] for key in SORT_KEYS]))
+        path = os.path.join(self.directory, 'run-{}'.format(len(self.paths)))
+        with open(path, 'wb') as f:
+            for start in range(0, self.size, self.block_rows):
+                pickle.dump(
+                    {key: array[start:start + self.block_rows]
+                     for key, array in rows.items()},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.paths.append(path)
+        self.parts = []
+        self.size = 0
+
+
+class MergedRuns(object):
+    """The series of the files and the k-way merge of their runs."""
+
+    def __init__(self, attributes, block_rows):
+        self.attributes = attributes
+        self.block_rows = block_rows
+        self.runs = []
+        # the series, in order of appearance, and their headers
+        self.positions = {}
+        self.headers = []
+        self.offset_in_hours = None
+
+    def spill(self, index, path, policy, runs):
+        """Add the events of a file to the runs."""
+        seq = 0
+        for header, _, events, tz_offset in iter_bulk_series(
+                path, duplicate_check_set=set(), name=path,
+                attributes=self.attributes):
+            key = (get_code(header), header['locationId'])
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = len(self.headers)
+                self.headers.append(header)
+            elif policy != 'first':
+                self.headers[position] = header
+
+            offset = 0
+            if tz_offset is not None:
+                hours = tz_offset.utcoffset(None).total_seconds() / 3600
+                if self.offset_in_hours is None:
+                    self.offset_in_hours = hours
+                offset = int(hours * 3600 * 10 ** 9)
+
+            n = len(events['value'])
+            if n == 0:
+                continue
+            order = (index << ROW_BITS) + seq + np.arange(n, dtype=np.int64)
+            seq += n
+            if policy == 'best_flag':
+                flags = events.get('flag', np.zeros(n))
+                rank = np.nan_to_num(flags, nan=0).astype(np.int64)
+            else:
+                rank = np.zeros(n, dtype=np.int64)
+
+            rows = {
+                'series': np.full(n, position, dtype=np.int32),
+                'time': events['timestamp'].astype(
+                    'datetime64[ns]').view('i8') - offset,
+                'rank': rank,
+                'tie': order if policy == 'first' else -order,
+            }
+            # all runs have the same columns, whatever the file has
+            for key, attribute, _ in OPTIONAL_ATTRIBUTES:
+                if attribute not in self.attributes:
+                    continue
+                column = events.get(key)
+                if column is None:
+                    column = np.full(n, np.nan if key == 'flag' else None)
+                rows[key] = column
+            rows['value'] = events['value']
+            runs.add(rows)
+
+    def blocks(self):
+        """Yield the merged (and deduplicated) rows in blocks."""
+        readers = [read_blocks(path) for path in self.runs]
+        buffers = [None] * len(readers)
+        exhausted = [False] * len(readers)
+
+        def load(i):
+            block = next(readers[i], None)
+            if block is None:
+                exhausted[i] = True
+            elif buffers[i] is None or not len(buffers[i]['time']):
+                buffers[i] = block
+            else:
+                buffers[i] = concatenate([buffers[i], block])
+
+        for i in range(len(readers)):
+            load(i)
+
+        while True:
+            for i in range(len(readers)):
+                if not exhausted[i] and not len(buffers[i]['time']):
+                    load(i)
+            active = [i for i in range(len(readers)) if not exhausted[i]]
+            if active:
+                # All rows before the smallest last key of the buffers of
+                # the runs having more blocks are in memory.
+                frontier = min(last_key(buffers[i]) for i in active)
+                ends = [0 if buffers[i] is None else
+                        key_position(buffers[i], frontier)
+                        for i in range(len(readers))]
+                if not any(ends):
+                    for i in active:
+                        if last_key(buffers[i]) == frontier:
+                            load(i)
+                    continue
+            else:
+                ends = [0 if buffer is None else len(buffer['time'])
+                        for buffer in buffers]
+                if not any(ends):
+                    break
+
+            parts = []
+            for i, end in enumerate(ends):
+                if end:
+                    parts.append(take(buffers[i], slice(0, end)))
+                    buffers[i] = take(buffers[i], slice(end, None))
+            rows = concatenate(parts)
+            rows = take(rows, np.lexsort([rows[key] for key in SORT_KEYS]))
+            yield take(rows, first_of_keys(rows['series'], rows['time']))
+
+    def chunk(self, rows):
+        """Return the (metadata, dataframe) tuple of a chunk of rows."""
+        codes, locations = self._categories()
+        data = {
+            'code': pd.Categorical.from_codes(
+                codes[0][rows['series']], categories=codes[1]),
+            'location_code': pd.Categorical.from_codes(
+                locations[0][rows['series']], categories=locations[1]),
+            'timestamp': self._wall_times(rows['time'], self.offset_in_hours),
+        }
+        for key, _, _ in OPTIONAL_ATTRIBUTES + [('value', None, None)]:
+            if key in rows:
+                data[key] = rows[key]
+        tz_offset = None if self.offset_in_hours is None else \
+            FixedOffset(self.offset_in_hours * 60)
+        dataframe = dataframe_from_bulk(data, tz_offset)
+        series = pd.unique(rows['series'])
+        metadata = pd.DataFrame(
+            [series_metadata(self.headers[i]) for i in series])
+        return metadata, dataframe
+
+    def series(self, offset_in_hours):
+        """Yield the (metadata, dataframe) tuples of the merged series.
+
+        The dataframes are in the time zone of offset_in_hours, for a
+        `PiXmlStreamWriter`.
+        """
+        parts = []
+        current = None
+        for block in self.blocks():
+            series = block['series']
+            starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], len(series)]):
+                position = series[start]
+                if position != current and parts:
+                    yield self._series(current, concatenate(parts),
+                                       offset_in_hours)
+                    parts = []
+                current = position
+                parts.append(take(block, slice(start, end)))
+        if parts:
+            yield self._series(current, concatenate(parts), offset_in_hours)
+
+    def _series(self, position, rows, offset_in_hours):
+        index = pd.DatetimeIndex(self._wall_times(
+            rows['time'], offset_in_hours)).tz_localize(
+                FixedOffset(offset_in_hours * 60))
+        data = {'value': rows['value']}
+        for key, attribute, _ in OPTIONAL_ATTRIBUTES:
+            if key not in rows:
+                continue
+            column = rows[key]
+            if key == 'flag':
+                if not np.isnan(column).any():
+                    data[attribute] = column.astype(int)
+            elif all(value is not None for value in column):
+                data[attribute] = column
+        return pi_header(self.headers[position]), pd.DataFrame(
+            data, index=index)
+
+    def _categories(self):
+        """Return the (positions, categories) of the codes and locations."""
+        result = []
+        for values in zip(*self.positions):
+            categories = sorted(set(values) - {None})
+            lookup = {value: i for i, value in enumerate(categories)}
+            positions = np.array([lookup.get(value, -1) for value in values],
+                                 dtype=np.int32)
+            result.append((positions, categories))
+        return result
+
+    @staticmethod
+    def _wall_times(times, offset_in_hours):
+        offset = int((offset_in_hours or 0) * 3600 * 10 ** 9)
+        return (times + offset).astype('datetime64[ns]')
+
+
+def pi_header(header):
+    """Return the metadata of a series for `PiXmlStreamWriter`.
+
+    Args:
+        header(dict): the header fields, see `header_fields`
+    """
+    result = {}
+    for key in PI_HEADER:
+        if key in ('startDate', 'endDate'):
+            # set by the writer
+            result[key] = {'@date': '', '@time': ''}
+        elif key == 'type':
+            result[key] = header.get(key) or 'instantaneous'
+        elif header.get(key) is not None:
+            result[key] = header[key]
+    return {'header': result}
+
+
+def read_blocks(path):
+    """Yield the blocks of a run."""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def regroup(blocks, size):
+    """Yield the rows of blocks in blocks of size rows (except the last)."""
+    parts = []
+    length = 0
+    for block in blocks:
+        parts.append(block)
+        length += len(block['time'])
+        while length >= size:
+            rows = concatenate(parts)
+            yield take(rows, slice(0, size))
+            parts = [take(rows, slice(size, None))]
+            length -= size
+    if length:
+        yield concatenate(parts)
+
+
+def last_key(rows):
+    """Return the (series, time) of the last row."""
+    return rows['series'][-1], rows['time'][-1]
+
+
+def key_position(rows, key):
+    """Return the position of the first row having a key not below key."""
+    series, time = key
+    start = np.searchsorted(rows['series'], series, 'left')
+    end = np.searchsorted(rows['series'], series, 'right')
+    return start + np.searchsorted(rows['time'][start:end], time, 'left')
+
+
+def first_of_keys(series, times):
+    """Return the positions of the first rows of equal keys."""
+    new = np.ones(len(times), dtype=bool)
+    new[1:] = (series[1:] != series[:-1]) | (times[1:] != times[:-1])
+    return np.flatnonzero(new)
+
+
+def concatenate(parts):
+    """Concatenate dicts of arrays having the same keys."""
+    if len(parts) == 1:
+        return parts[0]
+    return {key: np.concatenate([part[key] for part in parts])
+            for key in parts[0]}
+
+
+def take(rows, positions):
+    """Return the rows at positions (an index array or slice)."""
+    return {key: array[positions] for key, array in rows.items()}
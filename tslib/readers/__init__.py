@@ -1,3 +1,6 @@
 # package
 from tslib.readers.pi_xml_reader import PiXmlReader # NOQA
 from tslib.readers.list_reader import ListReader # NOQA
+from tslib.readers.parquet_reader import ParquetReader # NOQA
+from tslib.readers.pi_xml_index import PiXmlIndex # NOQA
+from tslib.readers.ingest import PiXmlIngest # NOQA
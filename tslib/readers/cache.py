@@ -0,0 +1,199 @@
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Bump this to invalidate existing cache entries when parsing changes.
+CACHE_VERSION = 1
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ParseCache(object):
+    """An in-memory and (optional) on-disk cache of parse results.
+
+    Entries are keyed by the content hash of the source (`key='content'`)
+    or by its path, modification time and size (`key='stat'`), plus the
+    method and arguments that produced them. Both the memory and the disk
+    cache have a size limit in bytes, beyond which the least recently used
+    entries are evicted. Results are stored pickled, so every hit returns
+    fresh objects.
+
+    Usage:
+
+    cache = ParseCache(directory='/var/cache/tslib')
+    reader = PiXmlReader(source, cache=cache)
+    for metadata, dataframe in reader.bulk_get_series():
+        pass
+    cache.cache_info()
+
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 ** 2,
+                 max_disk_bytes=4 * 1024 ** 3, key='content'):
+        """docstring
+
+        Keyword arguments:
+        directory -- where to store entries on disk (default: memory only)
+        max_bytes -- the size limit of the memory cache
+        max_disk_bytes -- the size limit of the disk cache
+        key -- 'content' (default) or 'stat', see above
+
+        """
+        if key not in ('content', 'stat'):
+            raise ValueError("key must be 'content' or 'stat'")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def cache_info(self):
+        """Return the hits, misses, size limit and size of the memory cache.
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.max_bytes,
+                             self._memory_bytes)
+
+    def clear(self):
+        """Remove all entries, from memory and disk."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path in self._disk_entries():
+                os.remove(path)
+
+    def make_key(self, source, *args):
+        """Return the cache key of a source and the arguments of a parse.
+
+        A source can be a path, bytes, a memory map or a seekable binary
+        file object (which is rewound after hashing).
+        """
+        digest = hashlib.sha256(repr((CACHE_VERSION, args)).encode('utf-8'))
+        if isinstance(source, (bytes, bytearray, memoryview)) or \
+                hasattr(source, 'madvise'):
+            digest.update(source)
+        elif hasattr(source, 'read'):
+            position = source.tell()
+            for block in iter(lambda: source.read(1024 ** 2), b''):
+                digest.update(block)
+            source.seek(position)
+        elif self.key == 'stat':
+            stat = os.stat(source)
+            digest.update(repr(
+                (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+            ).encode('utf-8'))
+        else:
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1024 ** 2), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            elif self.directory is not None:
+                path = self._path(key)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    self._remember(key, data)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, result):
+        """Store a result."""
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, data)
+            if self.directory is not None:
+                path = self._path(key)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+                self._evict_disk()
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def _disk_entries(self):
+        if self.directory is None:
+            return []
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith('.pickle')]
+
+    def _evict_disk(self):
+        entries = []
+        for path in self._disk_entries():
+            stat = os.stat(path)
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            logger.debug('Evicting %s from the parse cache.', path)
+            os.remove(path)
+            total -= size
+
+
+def cached(method):
+    """Serve the results of a reader method from the reader's cache.
+
+    The decorated method must be a generator. On a miss, its results are
+    collected and stored before they are yielded.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.cache
+        if cache is None:
+            for item in method(self, *args, **kwargs):
+                yield item
+            return
+        source = self.source
+        if cache.key == 'content' and self.mmap is not None:
+            source = self.mmap
+        key = cache.make_key(
+            source, method.__name__, args, sorted(kwargs.items()))
+        result = cache.get(key)
+        if result is None:
+            result = list(method(self, *args, **kwargs))
+            cache.put(key, result)
+        for item in result:
+            yield item
+    return wrapper
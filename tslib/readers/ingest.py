@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import glob
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from queue import Empty
+
+from tslib.compression import source_compression
+from tslib.readers.pi_xml_reader import SERIES
+from tslib.readers.pi_xml_reader import bulk_chunks
+from tslib.readers.pi_xml_reader import fast_iterparse
+from tslib.readers.pi_xml_reader import get_code
+from tslib.readers.pi_xml_reader import header_fields
+from tslib.readers.pi_xml_reader import iter_bulk_series
+from tslib.readers.pi_xml_reader import map_file
+from tslib.readers.pi_xml_reader import scan_headers
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('first', 'last')
+
+# The seconds to wait for a chunk before checking the workers
+POLL_SECONDS = 1.0
+
+FileReport = namedtuple(
+    'FileReport', ['path', 'seconds', 'series', 'rows', 'error', 'missing'])
+
+
+class PiXmlIngest(object):
+    """Read the bulk series of many PI XML files on a process pool.
+
+    Iterating over an ingest yields (path, metadata, dataframe) tuples,
+    where metadata and dataframe are those of `PiXmlReader.bulk_get_series`.
+    The chunks are streamed from the worker processes as they are read,
+    file by file in the order of the paths (or as soon as they are read
+    if not `ordered`). No more than `max_pending` files are read at the
+    same time, each holding about one chunk ahead of the consumer.
+
+    Duplicate (code, location_code) pairs are skipped across files: the
+    series of the first file that has a pair wins, or the series of the
+    last one (`policy='last'`). To know which file wins, the headers of
+    all files are scanned first. Within a file, the first series wins,
+    as in `bulk_get_series`.
+
+    A file that cannot be read does not stop the others. The chunks read
+    before the error have been yielded. The pairs that it would have won
+    but were not read are read from the next file that has them (which
+    gets a report of its own for that), and the pairs that no other file
+    has are in the `missing` of its report. After iterating, `reports`
+    has a `FileReport` per file read, with the time that reading it took,
+    the number of series and rows and the error, if any.
+
+    Usage:
+
+    ingest = PiXmlIngest('/data/dropbox/*.xml', policy='last')
+    for path, metadata, dataframe in ingest:
+        store(metadata, dataframe)
+    for report in ingest.reports:
+        print(report)
+
+    """
+
+    def __init__(self, paths, policy='first', max_workers=None,
+                 max_pending=None, ordered=True, chunk_size=250000,
+                 **options):
+        """docstring
+
+        Args:
+            paths: a glob pattern, or a list of paths and/or patterns
+            policy(str): 'first' (default) or 'last', see above
+            max_workers(int): the number of processes (default: all cores)
+            max_pending(int): the number of files read ahead (default:
+                twice the number of processes)
+            ordered(bool): yield the chunks in the order of the paths
+            chunk_size(int): see `PiXmlReader.bulk_get_series`
+            options: `compact`, `chunk_bytes` or `split_series`, see
+                `PiXmlReader.bulk_get_series`
+        """
+        if policy not in POLICIES:
+            raise ValueError("policy must be 'first' or 'last'")
+        self.paths = expand_paths(paths)
+        self.policy = policy
+        self.max_workers = max_workers or os.cpu_count()
+        self.max_pending = max_pending or 2 * self.max_workers
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.options = options
+        self.reports = []
+
+    def __iter__(self):
+        self.reports = []
+        # The manager (of the queues) is shut down first, so that workers
+        # waiting to put a chunk fail when the consumer stops early.
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor, \
+                multiprocessing.Manager() as manager:
+            scans = list(executor.map(_scan_file, self.paths))
+            pairs = [file_pairs for file_pairs, _, _ in scans]
+            skips = skip_sets(pairs, self.policy)
+            # (index, path, seconds, skip) per file to be read
+            tasks = deque()
+            failed = set()
+            for index, (path, (_, seconds, error), skip) in enumerate(
+                    zip(self.paths, scans, skips)):
+                if error is None:
+                    tasks.append((index, path, seconds, skip))
+                else:
+                    failed.add(index)
+                    self._report(FileReport(path, seconds, 0, 0, error, []))
+
+            # the chunks go through a queue per file, or a shared one
+            shared = None if self.ordered else manager.Queue(
+                self.max_pending)
+            pending = {}
+            keys = count()
+
+            def submit():
+                if tasks:
+                    task = tasks.popleft()
+                    key = next(keys)
+                    queue = shared or manager.Queue(1)
+                    future = executor.submit(
+                        _read_file, key, queue, task[1], task[2], task[3],
+                        self.chunk_size, self.options)
+                    pending[key] = task, future, queue
+
+            for _ in range(self.max_pending):
+                submit()
+
+            try:
+                while pending:
+                    if self.ordered:
+                        queue = pending[next(iter(pending))][2]
+                    else:
+                        queue = shared
+                    key, chunk = _receive(
+                        queue, [future for _, future, _ in pending.values()])
+                    task = pending[key][0]
+                    if chunk is not None:
+                        yield (task[1],) + chunk
+                        continue
+
+                    _, future, _ = pending.pop(key)
+                    report, read = future.result()
+                    if report.error is not None:
+                        failed.add(task[0])
+                        owned = set(pairs[task[0]]) - task[3] - read
+                        owners, missing = next_owners(
+                            pairs, owned, task[0], self.policy, failed)
+                        for index, wanted in owners.items():
+                            tasks.append((index, self.paths[index], 0.0,
+                                          set(pairs[index]) - wanted))
+                        report = report._replace(missing=sorted(missing))
+                    self._report(report)
+                    submit()
+            finally:
+                for _, future, _ in pending.values():
+                    future.cancel()
+
+    def _report(self, report):
+        if report.error is not None:
+            logger.warning('PiXML ingest of "%s" failed: %s',
+                           report.path, report.error)
+        self.reports.append(report)
+
+
+def expand_paths(paths):
+    """Return the paths that a pattern, or list of them, stands for.
+
+    The matches of a pattern are sorted. A path that does not exist is
+    kept, so that it is reported as an error.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    result = []
+    for path in paths:
+        result.extend(sorted(glob.glob(path)) or [path])
+    return result
+
+
+def skip_sets(pairs, policy):
+    """Return per file the (code, location_code) pairs that another wins.
+
+    Args:
+        pairs: per file the list of pairs of its series (None if unknown)
+        policy(str): 'first' or 'last'
+    """
+    owners = {}
+    order = range(len(pairs))
+    if policy == 'last':
+        order = reversed(order)
+    for index in order:
+        for pair in pairs[index] or ():
+            owners.setdefault(pair, index)
+    return [
+        {pair for pair in file_pairs or () if owners[pair] != index}
+        for index, file_pairs in enumerate(pairs)
+    ]
+
+
+def next_owners(pairs, lost, index, policy, failed=()):
+    """Return which files have the pairs that a file failed to read.
+
+    Args:
+        pairs: per file the list of pairs of its series (None if unknown)
+        lost: the pairs that file index would have won, but did not read
+        index: the index of the file that failed
+        policy(str): 'first' or 'last'
+        failed: the indices of the files that are not to be read
+
+    Returns:
+        a (owners, missing) tuple, where owners maps the index of a file
+        to the lost pairs that it wins now, and missing is the set of the
+        pairs that no other file has.
+    """
+    if policy == 'last':
+        order = range(index - 1, -1, -1)
+    else:
+        order = range(index + 1, len(pairs))
+    owners = {}
+    missing = set(lost)
+    for other in order:
+        if other in failed:
+            continue
+        found = missing.intersection(pairs[other] or ())
+        if found:
+            owners[other] = found
+            missing -= found
+    return owners, missing
+
+
+def _scan_file(path):
+    """Return the (code, location_code) pairs of a file, the time and error.
+
+    A compressed file cannot be scanned, so its headers are parsed.
+    """
+    started = time.perf_counter()
+    try:
+        if source_compression(path) is None:
+            with map_file(path) as mm:
+                headers = list(scan_headers(mm))
+        else:
+            headers = [header_fields(series[0]) for _, series in
+                       fast_iterparse(path, tag=SERIES)]
+        pairs = [(get_code(header), header['locationId'])
+                 for header in headers]
+    except Exception as e:
+        return None, time.perf_counter() - started, _error(e)
+    return pairs, time.perf_counter() - started, None
+
+
+def _read_file(key, queue, path, seconds, skip, chunk_size, options):
+    """Put the chunks of a file on a queue, return its `FileReport`.
+
+    This is the task of a worker process. Every chunk is put as a
+    (key, (metadata, dataframe)) tuple, followed by (key, None) when the
+    file is done. An error is reported, not raised: the chunks put
+    before it stand.
+
+    Returns:
+        a (report, read) tuple, where read is the set of the (code,
+        location_code) pairs of the series in the chunks put
+    """
+    started = time.perf_counter()
+    series = [0]
+    rows = 0
+    read = set()
+    error = None
+
+    def items():
+        for item in iter_bulk_series(
+                path, duplicate_check_set=set(skip), name=path):
+            series[0] += 1
+            yield item
+
+    try:
+        for metadata, dataframe in bulk_chunks(
+                items(), chunk_size, **options):
+            queue.put((key, (metadata, dataframe)))
+            rows += len(dataframe)
+            read.update(zip(metadata['code'], metadata['location_code']))
+    except Exception as e:
+        error = _error(e)
+    finally:
+        queue.put((key, None))
+
+    seconds += time.perf_counter() - started
+    return FileReport(path, seconds, series[0], rows, error, []), read
+
+
+def _receive(queue, futures):
+    """Return the next message of the queue of `_read_file` tasks.
+
+    Raises:
+        the exception of a task that ended without its last message,
+        e.g. BrokenProcessPool
+    """
+    while True:
+        try:
+            return queue.get(timeout=POLL_SECONDS)
+        except Empty:
+            # a task that is done has put its last message already
+            for future in futures:
+                if future.done():
+                    future.result()
+
+
+def _error(exception):
+    return '{}: {}'.format(type(exception).__name__, exception)
@@ -2,6 +2,7 @@
 
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import pytz
 
@@ -11,6 +12,9 @@ INTERNAL_TIMEZONE = pytz.UTC
 COLNAME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 COLNAME_FORMAT_MS = '%Y-%m-%dT%H:%M:%S.%fZ'
 
+# The lengths of strings in these formats (%f having 1 to 6 digits)
+WIDTHS = {20, 22, 23, 24, 25, 26, 27}
+
 
 class ListReader(TimeSeriesReader):
     """docstring"""
@@ -24,33 +28,77 @@ class ListReader(TimeSeriesReader):
         """
 
         for series in self.serieslist:
-            datetimes = []
-            data = {}
-            keys = []
-            for event in series.get('events'):
-                dt = event.get('datetime')
-                try:
-                    dt = datetime.strptime(dt, COLNAME_FORMAT)
-                except ValueError:
-                    dt = datetime.strptime(dt, COLNAME_FORMAT_MS)
-                dt = INTERNAL_TIMEZONE.localize(dt)
-                for key in event.keys():
-                    if key != 'datetime':
-                        if key not in keys:
-                            keys.append(key)
-                        if not dt in data.keys():
-                            data[dt] = {}
-                        data[dt][key] = event.get(key)
+            # Only events having other keys than datetime yield a row.
+            events = [event for event in series.get('events')
+                      if any(key != 'datetime' for key in event)]
+
+            # The keys in order of appearance.
+            keys = list(dict.fromkeys(
+                key for event in events for key in event
+                if key != 'datetime'))
+
+            datetimes = parse_datetimes(
+                [event.get('datetime') for event in events])
+
+            if datetimes.has_duplicates:
+                # Merge the events per datetime: per key, the last wins.
+                rows = {}
+                for dt, event in zip(datetimes, events):
+                    rows.setdefault(dt, {}).update(event)
+                datetimes = pd.DatetimeIndex(list(rows.keys()))
+                events = list(rows.values())
 
             # Flatten the dataset by key.
             # Missing values are converted to None.
-            datetimes = (data.keys())
-            data_flat = {key: [] for key in keys}
-            for dt in datetimes:
-                row = data[dt]
-                for key in keys:
-                    data_flat[key].append(row.get(key))
+            data_flat = {
+                key: [event.get(key) for event in events] for key in keys
+            }
+
+            if not events:
+                datetimes = []
 
             dataframe = pd.DataFrame(data=data_flat, index=datetimes)
 
             yield series.get('uuid'), dataframe
+
+
+def parse_datetimes(strings):
+    """Return a UTC DatetimeIndex for a list of datetime strings.
+
+    Strings in COLNAME_FORMAT or COLNAME_FORMAT_MS are parsed at once by
+    NumPy. If any string does not look like that (see `has_fixed_format`),
+    every string is tried in the first format and then in the second, as
+    datetime.strptime remains the authority on the formats. The index has
+    a resolution of microseconds either way.
+    """
+    try:
+        if all(has_fixed_format(dt) for dt in strings):
+            datetimes = np.array([dt[:-1] for dt in strings],
+                                 dtype='datetime64[us]')
+            return pd.DatetimeIndex(datetimes).tz_localize(INTERNAL_TIMEZONE)
+    except (TypeError, ValueError):
+        pass
+
+    datetimes = []
+    for dt in strings:
+        try:
+            dt = datetime.strptime(dt, COLNAME_FORMAT)
+        except ValueError:
+            dt = datetime.strptime(dt, COLNAME_FORMAT_MS)
+        datetimes.append(INTERNAL_TIMEZONE.localize(dt))
+    return pd.DatetimeIndex(datetimes).as_unit('us')
+
+
+def has_fixed_format(dt):
+    """Return whether a string has the separators and digits of the formats.
+
+    That is COLNAME_FORMAT or COLNAME_FORMAT_MS, so that NumPy does not
+    parse anything else (like a UTC offset) that strptime would reject.
+    """
+    return (
+        len(dt) in WIDTHS and dt[-1] == 'Z' and
+        dt[4] + dt[7] + dt[10] + dt[13] + dt[16] == '--T::' and
+        (dt[:4] + dt[5:7] + dt[8:10] + dt[11:13] + dt[14:16] +
+         dt[17:19]).isdigit() and
+        (len(dt) == 20 or dt[19] == '.' and dt[20:-1].isdigit())
+    )
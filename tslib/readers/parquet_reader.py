@@ -0,0 +1,88 @@
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import json
+
+import pandas as pd
+from pytz import BaseTzInfo
+from pytz import FixedOffset
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pq = None
+
+from tslib.readers.ts_reader import TimeSeriesReader
+from tslib.writers.parquet_writer import COLUMNS_KEY
+from tslib.writers.parquet_writer import METADATA_KEY
+
+
+class ParquetReader(TimeSeriesReader):
+    """Read the chunks written by `tslib.writers.ParquetWriter`.
+
+    This is a columnar cache of `PiXmlReader.bulk_get_series`: the file
+    is memory-mapped and only the requested columns are decoded, which
+    is orders of magnitude faster than parsing the PI XML again.
+
+    """
+
+    def __init__(self, source, memory_map=True):
+        """docstring"""
+        if pq is None:
+            raise ImportError("ParquetReader requires pyarrow")
+        self.source = source
+        self.memory_map = memory_map
+
+    def bulk_get_series(self, columns=None):
+        """Return a (metadata, dataframe) tuple per stored chunk.
+
+        Keyword arguments:
+        columns -- the columns to read, e.g. ['value', 'flag'] (default
+        all). The index (code, location_code, timestamp) is always read.
+        A chunk only has the columns that it was written with.
+
+        See `PiXmlReader.bulk_get_series` for the return values.
+        """
+        parquet_file = pq.ParquetFile(
+            self.source, memory_map=self.memory_map)
+        key_value_metadata = parquet_file.metadata.metadata
+        metadata = json.loads(key_value_metadata[METADATA_KEY])
+        # files of former versions have the same columns in every chunk
+        chunk_columns = json.loads(key_value_metadata.get(
+            COLUMNS_KEY, 'null')) or [columns] * len(metadata)
+
+        for i in range(parquet_file.num_row_groups):
+            selected = chunk_columns[i]
+            if columns is not None and selected is not None:
+                selected = [name for name in selected if name in columns]
+            table = parquet_file.read_row_group(
+                i, columns=selected, use_pandas_metadata=True)
+            yield pd.DataFrame(metadata[i]), restore_chunk(table)
+
+
+def restore_chunk(table):
+    """Return the dataframe of a row group as `PiXmlReader` made it.
+
+    Depending on the versions of pandas and pyarrow, object columns are
+    read as strings having NaN for None, and a fixed offset time zone as
+    a `datetime.timezone` instead of a pytz offset. These are converted
+    back, so that the chunks read equal those written.
+    """
+    dataframe = table.to_pandas()
+    pandas_metadata = table.schema.pandas_metadata or {}
+    for column in pandas_metadata.get('columns', []):
+        name = column['name']
+        if column['numpy_type'] == 'object' and name in dataframe and \
+                dataframe[name].dtype != object:
+            dataframe[name] = dataframe[name].to_numpy(
+                dtype=object, na_value=None)
+
+    index = dataframe.index
+    if isinstance(index, pd.MultiIndex) and 'timestamp' in index.names:
+        level = index.names.index('timestamp')
+        timestamps = index.levels[level]
+        tz = timestamps.tz
+        if tz is not None and not isinstance(tz, BaseTzInfo):
+            minutes = tz.utcoffset(None).total_seconds() / 60
+            dataframe.index = index.set_levels(
+                timestamps.tz_convert(FixedOffset(minutes)), level=level)
+    return dataframe
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import json
+import logging
+import os
+import re
+
+from lxml import etree
+
+from tslib.readers.pi_xml_reader import HEADER_END
+from tslib.readers.pi_xml_reader import NS
+from tslib.readers.pi_xml_reader import SERIES_BOUNDARY
+from tslib.readers.pi_xml_reader import _header_text
+from tslib.readers.pi_xml_reader import get_element_code
+from tslib.readers.pi_xml_reader import map_file
+from tslib.readers.pi_xml_reader import scan_series
+
+logger = logging.getLogger(__name__)
+
+# Bump this to invalidate existing sidecar files when the format changes.
+INDEX_VERSION = 1
+
+EVENT_START = re.compile(rb'<(?:[\w.-]+:)?event[\s/>]')
+
+
+class PiXmlIndex(object):
+    """The series of a PI XML file and where to find them.
+
+    Every entry of `series` is a dict having the code (see `get_code`),
+    location_code, parameter_id, start and end (the raw 'dateTtime' strings
+    of the startDate and endDate of the header), event_count, and the
+    offset and length in bytes of the series element.
+
+    Usage:
+
+    index = PiXmlIndex.load(source)  # builds and saves it if needed
+    for entry in index.series:
+        print(entry['code'], entry['location_code'])
+
+    """
+
+    def __init__(self, series, prolog_length, epilog, size, mtime_ns):
+        self.series = series
+        self.prolog_length = prolog_length
+        self.epilog = epilog
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._lookup = {}
+        for position, entry in enumerate(series):
+            # the first of duplicate series wins, as in bulk_get_series
+            self._lookup.setdefault(
+                (entry['code'], entry['location_code']), position)
+
+    @classmethod
+    def build(cls, path):
+        """Scan a PI XML file once and return its index.
+
+        Only the bytes of the headers are parsed (all at once, in a single
+        document); the events are merely counted.
+        """
+        stat = os.stat(path)
+        with map_file(path) as mm:
+            prolog, epilog, ranges = scan_series(mm)
+            parts = [prolog]
+            counts = []
+            for offset, length in ranges:
+                # e.g. b'<series>' or b'<pi:series ' -> b'</series>'
+                name = SERIES_BOUNDARY.match(mm, offset).group()[1:-1]
+                end = HEADER_END.search(mm, offset, offset + length).end()
+                parts.extend([mm[offset:end], b'</', name, b'>'])
+                counts.append(sum(
+                    1 for _ in EVENT_START.finditer(mm, end, offset + length)))
+            parts.append(epilog)
+
+        root = etree.fromstring(b''.join(parts))
+        series = []
+        for element, (offset, length), count in zip(
+                root.iterchildren('{%s}series' % NS), ranges, counts):
+            header = element[0]
+            series.append({
+                'code': get_element_code(header),
+                'location_code': _header_text(header, 'locationId'),
+                'parameter_id': _header_text(header, 'parameterId'),
+                'start': _date(header, 'startDate'),
+                'end': _date(header, 'endDate'),
+                'event_count': count,
+                'offset': offset,
+                'length': length,
+            })
+
+        return cls(series, len(prolog), epilog.decode('utf-8'),
+                   stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, path, rebuild=False):
+        """Return the index of a PI XML file, from its sidecar if possible.
+
+        The sidecar is (re)written if it is missing or stale, i.e. if the
+        size or modification time of the file differ from when the index
+        was built. A sidecar that cannot be written is logged, not raised.
+        """
+        sidecar = sidecar_path(path)
+        if not rebuild:
+            index = cls.read(sidecar)
+            if index is not None and index.is_fresh(path):
+                return index
+        index = cls.build(path)
+        try:
+            index.write(sidecar)
+        except OSError as e:
+            logger.warning('Cannot write PI XML index "%s": %s', sidecar, e)
+        return index
+
+    @classmethod
+    def read(cls, sidecar):
+        """Return the index in a sidecar file, or None if unusable."""
+        try:
+            with open(sidecar) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION:
+            return None
+        return cls(data['series'], data['prolog_length'], data['epilog'],
+                   data['size'], data['mtime_ns'])
+
+    def write(self, sidecar):
+        """Save the index as JSON (atomically)."""
+        data = {
+            'version': INDEX_VERSION,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'prolog_length': self.prolog_length,
+            'epilog': self.epilog,
+            'series': self.series,
+        }
+        temp = sidecar + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, sidecar)
+
+    def is_fresh(self, path):
+        """Return True if the file has not changed since it was indexed."""
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def find(self, code, location_code):
+        """Return the entry of a series, or None."""
+        position = self._lookup.get((code, location_code))
+        return None if position is None else self.series[position]
+
+    def categories(self):
+        """Return the (sorted) codes and location codes of the series.
+
+        The result can be passed to `PiXmlReader.bulk_get_series` as the
+        categories of the index levels of the chunks.
+        """
+        return {
+            key: sorted({entry[key] for entry in self.series} - {None})
+            for key in ['code', 'location_code']
+        }
+
+    def extract(self, source, entry):
+        """Return a PI XML document having the series of entry only.
+
+        Args:
+            source: the path or memory map of the indexed PI XML
+            entry(dict): an entry of `series`
+        """
+        offset, length = entry['offset'], entry['length']
+        if hasattr(source, 'madvise'):
+            prolog = source[:self.prolog_length]
+            element = source[offset:offset + length]
+        else:
+            with open(source, 'rb') as f:
+                prolog = f.read(self.prolog_length)
+                f.seek(offset)
+                element = f.read(length)
+        return b''.join([prolog, element, self.epilog.encode('utf-8')])
+
+
+def sidecar_path(path):
+    """Return the path of the index of a PI XML file."""
+    return path + '.index.json'
+
+
+def _date(header, tag):
+    element = header.find('{%s}%s' % (NS, tag))
+    if element is None:
+        return None
+    return '{}T{}'.format(element.get('date'), element.get('time'))
@@ -1,16 +1,32 @@
 # -*- coding: utf-8 -*-
 # (c) Nelen & Schuurmans, see LICENSE.rst.
 
+import io
+import json
 import logging
+import mmap
+import os
+import re
+import sys
+from collections import namedtuple
+from contextlib import closing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from itertools import chain
+from itertools import compress
 
 import numpy as np
 import pandas as pd
-import xmltodict
 from ciso8601 import parse_datetime
 from lxml import etree
 from pytz import FixedOffset
 
+from tslib.compression import detect
+from tslib.compression import open_source
+from tslib.readers.cache import cached
 from tslib.readers.ts_reader import TimeSeriesReader
+from tslib.stats import NULL_STATS
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +35,117 @@ TIMEZONE = '{%s}timeZone' % NS
 SERIES = '{%s}series' % NS
 EVENT = '{%s}event' % NS
 COMMENT = '{%s}comment' % NS
+HEADER = '{%s}header' % NS
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+# The header fields that `bulk_get_series` uses, see `header_fields`
+HEADER_FIELDS = ['type', 'parameterId', 'locationId', 'timeStep', 'missVal',
+                 'units', 'stationName', 'lat', 'lon']
+
+# The layouts of fixed-width event dates and times (with the delimiter
+# that joins them), see `_fixed_width_fields`. XOR-ing a string with its
+# layout gives the values of its digits and 0 for the other bytes, which
+# are at most the limits if the string fits the layout (the tens of the
+# months, days, minutes and seconds included).
+DELIMITER = '|'
+DATE_LAYOUT = np.frombuffer(b'0000-00-00|', dtype=np.uint8)
+DATE_LIMITS = np.array([9, 9, 9, 9, 0, 1, 9, 0, 3, 9, 0], dtype=np.uint8)
+TIME_LAYOUT = np.frombuffer(b'00:00:00|', dtype=np.uint8)
+TIME_LIMITS = np.array([2, 9, 0, 5, 9, 0, 5, 9, 0], dtype=np.uint8)
+
+# The weights of the digits of the (year, month, day) of a date, and of
+# the seconds since midnight of a time
+DATE_WEIGHTS = np.array([
+    [1000, 0, 0], [100, 0, 0], [10, 0, 0], [1, 0, 0], [0, 0, 0],
+    [0, 10, 0], [0, 1, 0], [0, 0, 0], [0, 0, 10], [0, 0, 1], [0, 0, 0],
+])
+TIME_WEIGHTS = np.array([36000, 3600, 0, 600, 60, 0, 10, 1, 0])
+
+# The whole years that fit into int64 nanoseconds
+FIRST_YEAR, LAST_YEAR = 1678, 2261
+
+
+def _month_tables():
+    """Return the days since the epoch of the months, and their lengths.
+
+    Both are indexed by [year - FIRST_YEAR + 1, month] for months 0-19.
+    The months that do not exist (of other years as well) have length 0.
+    """
+    months = np.arange('{}-01'.format(FIRST_YEAR),
+                       '{}-01'.format(LAST_YEAR + 1), dtype='datetime64[M]')
+    starts = months.astype('datetime64[D]').astype(np.int64)
+    ends = (months + 1).astype('datetime64[D]').astype(np.int64)
+    shape = (LAST_YEAR - FIRST_YEAR + 3, 20)
+    tables = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+    tables[0][1:-1, 1:13] = starts.reshape(-1, 12)
+    tables[1][1:-1, 1:13] = (ends - starts).reshape(-1, 12)
+    return tables
+
+
+MONTH_STARTS, MONTH_LENGTHS = _month_tables()
+
+# Below this number of events, parsing them one by one is faster, see
+# `parse_event_datetimes`
+FIXED_WIDTH_EVENTS = 64
+
+# Regular expressions for a fast scan of the raw bytes of a PI XML. Note
+# that series elements within XML comments or CDATA sections are not
+# recognized as such (which is not expected to happen in practice).
+SERIES_BOUNDARY = re.compile(
+    rb'<(?:[\w.-]+:)?series[\s>]|</(?:[\w.-]+:)?series\s*>')
+HEADER_END = re.compile(rb'</(?:[\w.-]+:)?header\s*>')
+ROOT_START = re.compile(rb'<((?:[\w.-]+:)?TimeSeries)[\s>]')
+
+# The size of a None in an object column, see `row_nbytes`
+NONE_NBYTES = sys.getsizeof(None)
+
+# The size of a code in the index apart from its string (a pointer and a
+# code of its level, at most), see `code_nbytes`
+CODE_NBYTES = 16
+
+# The default size of the batches of series parsed in parallel
+BATCH_BYTES = 16 * 1024 * 1024
+
+# The number of events of consecutive series that are decoded together,
+# see `decode_batches`
+BATCH_EVENTS = 65536
+
+# Compiled XPath expressions that collect an attribute of all events of a
+# series. Plain strings are returned, no references to the elements.
+NSMAP = {'pi': NS}
+
+
+def _event_attribute(name):
+    return etree.XPath('pi:event/@' + name, namespaces=NSMAP,
+                       smart_strings=False)
+
+
+EVENT_DATES = _event_attribute('date')
+EVENT_TIMES = _event_attribute('time')
+EVENT_VALUES = _event_attribute('value')
+OPTIONAL_ATTRIBUTES = [
+    ('flag', 'flag', _event_attribute('flag')),
+    ('flag_source', 'flagSource', _event_attribute('flagSource')),
+    ('comment', 'comment', _event_attribute('comment')),
+    ('user', 'user', _event_attribute('user')),
+]
+ATTRIBUTES = [attribute for _, attribute, _ in OPTIONAL_ATTRIBUTES]
+
+# The raw attribute strings of the events of a series, see `raw_events`
+RawEvents = namedtuple(
+    'RawEvents', ['dates', 'times', 'values', 'optional', 'bounds'])
+
+
+def iterparse(source, **kwargs):
+    """lxml.etree.iterparse of a source that may be compressed.
+
+    A gzip or zstd compressed source (recognized by its first bytes) is
+    decompressed by a background thread while it is parsed, see
+    `tslib.compression.DecompressingReader`.
+    """
+    with open_source(source) as xml:
+        for item in etree.iterparse(xml, **kwargs):
+            yield item
 
 
 def fast_iterparse(source, **kwargs):
@@ -27,7 +154,7 @@ def fast_iterparse(source, **kwargs):
     See also:
         https://www.ibm.com/developerworks/xml/library/x-hiperfparse/
     """
-    for event, elem in etree.iterparse(source, **kwargs):
+    for event, elem in iterparse(source, **kwargs):
         yield event, elem
 
         # It's safe to call clear here because no descendants will be accessed
@@ -51,9 +178,71 @@ class PiXmlReader(TimeSeriesReader):
 
     """
 
-    def __init__(self, source):
-        """docstring"""
+    def __init__(self, source, use_mmap=False, cache=None, stats=None):
+        """docstring
+
+        Keyword arguments:
+        use_mmap -- map the source file into memory once (default False)
+        cache -- a `tslib.readers.cache.ParseCache` (default None)
+        stats -- a `tslib.stats.Stats` to be filled (default None)
+
+        The source can be a path or a binary file object. A gzip or zstd
+        compressed source (zstd requires zstandard) is decompressed while
+        it is parsed, without a temporary file. Compressed sources cannot
+        be memory-mapped, nor be read by the methods that scan the raw
+        bytes (the parallel ones and those using the index).
+
+        A memory-mapped source is shared by all methods of the reader:
+        the timeZone lookup and the series scan work on the mapped bytes
+        directly, without reading the file again. The source must be a
+        path in that case. Call `close` (or use the reader as a context
+        manager) to release the map.
+
+        If a cache is given, the results of `get_series` and
+        `bulk_get_series` are looked up in (or added to) the cache.
+        Note that on a miss, all results are collected before the first
+        one is returned.
+
+        If stats are given, `get_series`, `get_new_series` and
+        `bulk_get_series` add the time of their stages (parse, header,
+        events, dataframe and tz_localize, which is part of dataframe),
+        the number of series, events and chunks, the bytes read and the
+        peak memory of a chunk to them. A cache hit is not counted.
+
+        """
         self.source = source
+        self.mmap = map_file(source) if use_mmap else None
+        self.cache = cache
+        self.stats = stats or NULL_STATS
+        self.index = None
+
+    def close(self):
+        """Release the memory map, if any."""
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        """Return the source to be parsed by lxml."""
+        if self.mmap is not None:
+            return MappedFile(self.mmap)
+        return self.source
+
+    @contextmanager
+    def _mapped(self):
+        """Return the memory map of the source, if needed a temporary one.
+        """
+        if self.mmap is not None:
+            yield self.mmap
+        else:
+            with map_file(self.source) as mm:
+                yield mm
 
     def get_tz(self):
         """Return the offset in hours from UTC as a float.
@@ -64,12 +253,94 @@ class PiXmlReader(TimeSeriesReader):
         A return value of None means that no `timeZone` element is present.
         An empty `timeZone` will return the default value, i.e. `0.0`.
 
+        According to the schema, the `timeZone` element precedes the first
+        `series`, so parsing stops as soon as a `series` element starts.
+
         """
-        for _, element in etree.iterparse(self.source):
-            if element.tag == TIMEZONE:
+        if self.mmap is not None:
+            root = etree.fromstring(scan_prolog(self.mmap))
+            for element in root.iterchildren(tag=TIMEZONE):
                 return float(element.text or 0.0)
+            return None
+
+        with closing(iterparse(self.source, events=('start', 'end'),
+                               tag=(TIMEZONE, SERIES))) as events:
+            for event, element in events:
+                if element.tag == SERIES:
+                    return None
+                if event == 'end':
+                    return float(element.text or 0.0)
+
+    @cached
+    def get_series(self, parameters=None, locations=None, codes=None,
+                   start=None, end=None, attributes=None):
+        """Return a (metadata, dataframe) tuple.
 
-    def get_series(self):
+        Metadata is returned as a dict:
+        https://github.com/martinblech/xmltodict
+        http://www.xml.com/pub/a/2006/05/31/⏎
+        converting-between-xml-and-json.html
+
+        The dataframe's DatetimeIndex has the same time zone (offset)
+        as the PI XML, which is generally not UTC. If you need UTC,
+        the returned data frame can be converted as follows:
+
+        df.tz_convert('UTC', copy=False)
+
+        Caveat: the PI XML timeZone element is optional. In that
+        case, the DatetimeIndex has no time zone information.
+
+        Keyword arguments:
+        parameters -- only read series having one of these parameterIds
+        locations -- only read series having one of these locationIds
+        codes -- only read series having one of these codes, see `get_code`
+        start -- drop events before this datetime (default None)
+        end -- drop events at or after this datetime (default None)
+        attributes -- the optional event attributes to read, a subset of
+            'flag', 'flagSource', 'comment' and 'user' (default all)
+
+        Series that do not match are skipped before their header is
+        converted to a dict. See `window_bounds` for start and end.
+
+        """
+        matches = series_filter(parameters, locations, codes)
+        for item in iter_series(self._open(), matches, start, end,
+                                attributes, stats=self.stats):
+            yield item
+
+    def get_new_series(self, marks, parameters=None, locations=None,
+                       codes=None, start=None, end=None, attributes=None):
+        """Return (metadata, dataframe) tuples of new events only.
+
+        The marks are a dict of the last timestamp read per series, keyed
+        by (code, location_code) and having raw 'dateTtime' strings (or
+        datetimes) as values. Events at or before the mark of their series
+        are skipped by comparing the raw date and time attributes, i.e.
+        without converting them. Series without new events are left out.
+
+        The marks are updated in place as the series are read, so they
+        can be passed to the next call, also after `save_marks` and
+        `load_marks`. The other arguments are those of `get_series`.
+
+        Usage:
+
+        marks = load_marks(path) if os.path.exists(path) else {}
+        for metadata, dataframe in reader.get_new_series(marks):
+            store(metadata, dataframe)
+        save_marks(marks, path)
+
+        """
+        matches = series_filter(parameters, locations, codes)
+        for item in iter_series(self._open(), matches, start, end,
+                                attributes, marks, stats=self.stats):
+            yield item
+
+    @cached
+    def bulk_get_series(self, chunk_size=250000, compact=False,
+                        parameters=None, locations=None, codes=None,
+                        start=None, end=None, attributes=None,
+                        chunk_bytes=None, split_series=True,
+                        categories=None):
         """Return a (metadata, dataframe) tuple.
 
         Metadata is returned as a dict:
@@ -86,235 +357,1497 @@ class PiXmlReader(TimeSeriesReader):
         Caveat: the PI XML timeZone element is optional. In that
         case, the DatetimeIndex has no time zone information.
 
+        Pass `compact=True` for a smaller memory footprint per chunk:
+        the code and location_code levels are built from integer codes
+        (the categories of the whole file so far), flags are a nullable
+        Int32 and the flag, flagSource, comment and user columns are left
+        out of chunks that have no such values. Chunks may thus differ in
+        their columns (which `ParquetWriter` takes into account).
+
+        The series and events can be filtered, and the attribute columns
+        selected, by the keyword arguments of `get_series`. Events outside
+        [start, end) are dropped before their timestamps and values are
+        converted. A series that does not match is not taken into account
+        for the duplicate check either.
+
+        Chunks can be limited by a memory budget in bytes (`chunk_bytes`)
+        besides a number of rows. Pass `split_series=False` to close a
+        chunk before a series that does not fit, instead of dividing the
+        series over two chunks. The (deep) memory usage of every chunk is
+        in `dataframe.attrs['memory_usage']`.
+
+        By default, the code and location_code levels of a chunk have the
+        codes of its own rows as categories. Pass `categories=True` to have
+        the same categories in all chunks, those of the whole file (see
+        `PiXmlIndex.categories`), so that chunks can be concatenated
+        without the levels becoming object. Or pass them as a dict of
+        lists, in which case other codes raise a ValueError.
+        """
+        attributes = select_attributes(attributes)
+        if categories is True:
+            categories = self.get_index().categories()
+        items = iter_bulk_series(
+            self._open(), duplicate_check_set=set(), name=self.source,
+            matches=series_filter(parameters, locations, codes),
+            start=start, end=end, attributes=attributes, stats=self.stats)
+        for chunk in bulk_chunks(items, chunk_size, compact=compact,
+                                 attributes=attributes,
+                                 chunk_bytes=chunk_bytes,
+                                 split_series=split_series,
+                                 categories=categories,
+                                 stats=self.stats):
+            yield chunk
+
+    def parse(self, on_series=None, on_chunk=None, on_tz=None,
+              chunk_size=250000, compact=False, parameters=None,
+              locations=None, codes=None, start=None, end=None,
+              attributes=None, chunk_bytes=None, split_series=True,
+              categories=None):
+        """Parse the source once, for get_tz, get_series and bulk_get_series.
+
+        Each of these methods parses the whole source. Instead, this parses
+        it once and passes the results to callbacks, which are called in
+        document order: on_tz(tz) once, before any series, on_series(
+        metadata, dataframe) per series as returned by `get_series`, and
+        on_chunk(metadata, dataframe) per chunk as returned by
+        `bulk_get_series`. A chunk is passed when it is full, i.e. after
+        the series of its last rows (and those decoded along with them,
+        see `decode_batches`). The other arguments are those of
+        `bulk_get_series` (and `get_series`).
+
+        Usage:
+
+        def store_chunk(metadata, dataframe):
+            ...
+
+        tz = reader.parse(on_series=store_series, on_chunk=store_chunk)
+
+        Returns:
+            the timeZone, see `get_tz`
         """
-        for _, series in etree.iterparse(self.source, tag=SERIES):
+        attributes = select_attributes(attributes)
+        if categories is True:
+            categories = self.get_index().categories()
+        matches = series_filter(parameters, locations, codes)
+        stats = self.stats
+        result = []
+
+        def tz_found(tz):
+            result.append(tz)
+            if on_tz is not None:
+                on_tz(tz)
+
+        def items():
+            bounds = None
+            duplicate_check_set = set()
+            for tz, series in iter_series_elements(
+                    self._open(), on_tz=tz_found, stats=stats):
+                if bounds is None:
+                    bounds = window_bounds(start, end, tz)
+                    tz_offset = None if tz is None else FixedOffset(tz * 60)
+                if matches is not None and not matches(series[0]):
+                    continue
+                if on_series is not None:
+                    metadata, dataframe = series_item(
+                        series, tz, bounds, attributes, stats=stats)
+                    stats.count('series')
+                    stats.count('events', frame_length(dataframe))
+                    on_series(metadata, dataframe)
+                if on_chunk is not None:
+                    item = bulk_item(series, tz_offset, bounds, attributes,
+                                     duplicate_check_set, self.source, stats)
+                    if item is not None:
+                        yield item
+
+        def decoded():
+            for item in decode_batches(items(), stats=stats):
+                if on_series is None:
+                    stats.count('series')
+                    stats.count('events', len(item[2]['value']))
+                yield item
+
+        chunks = bulk_chunks(decoded(), chunk_size, compact=compact,
+                             attributes=attributes, chunk_bytes=chunk_bytes,
+                             split_series=split_series,
+                             categories=categories, stats=stats)
+        for metadata, dataframe in chunks:
+            on_chunk(metadata, dataframe)
+
+        return result[0]
+
+    def get_index(self, rebuild=False):
+        """Return the `PiXmlIndex` of the source (a path).
+
+        The index is kept in a sidecar file next to the source, see
+        `PiXmlIndex.load`, and by the reader itself.
+        """
+        from tslib.readers.pi_xml_index import PiXmlIndex
 
-            header = series[0]
-            metadata = xmltodict.parse(etree.tostring(header))
+        if rebuild or self.index is None:
+            self.index = PiXmlIndex.load(self.source, rebuild=rebuild)
+        return self.index
 
-            missVal = metadata['header']['missVal']
+    def read_series(self, code, location_code):
+        """Return the (metadata, dataframe) tuple of a single series.
 
-            datetimes = []
-            values = []
-            flags = []
-            flag_sources = []
-            comments = []
-            users = []
+        Instead of parsing the file up to the series, the index is used
+        to read the bytes of the series element only. See `get_series`
+        for the return values and `get_code` for the code. If the file
+        has duplicates, the first series is returned.
 
-            iterator = series.iterchildren(tag=EVENT)
+        Raises:
+            KeyError: if the file has no such series
+        """
+        index = self.get_index()
+        entry = index.find(code, location_code)
+        if entry is None:
+            raise KeyError((code, location_code))
+        source = self.mmap if self.mmap is not None else self.source
+        document = index.extract(source, entry)
+        return next(PiXmlReader(io.BytesIO(document)).get_series())
+
+    def parallel_get_series(self, max_workers=None, ordered=True,
+                            batch_bytes=BATCH_BYTES):
+        """Return (metadata, dataframe) tuples, parsed by a process pool.
+
+        The byte ranges of the series elements are found by a fast scan
+        of the file, after which batches of consecutive series are parsed
+        by `get_series` in worker processes. The source must be a path.
+
+        Args:
+            max_workers(int): the number of processes (default: all cores)
+            ordered(bool): yield the series in document order (default)
+                or as soon as their batch has been parsed
+            batch_bytes(int): the (approximate) size of the batches
+
+        See `get_series` for the return values.
+        """
+        for result in self._parallel(_get_series, max_workers, ordered,
+                                     batch_bytes):
+            for item in result:
+                yield item
 
-            for event in iterator:
-                d = event.attrib['date']
-                t = event.attrib['time']
-                datetimes.append(parse_datetime("{}T{}".format(d, t)))
-                value = event.attrib['value']
-                values.append(value if value != missVal else "NaN")
-                flags.append(event.attrib.get('flag', None))
-                flag_sources.append(event.attrib.get('flagSource', None))
-                comments.append(event.attrib.get('comment', None))
-                users.append(event.attrib.get('user', None))
+    def parallel_bulk_get_series(self, chunk_size=250000, max_workers=None,
+                                 ordered=True, batch_bytes=BATCH_BYTES,
+                                 chunk_bytes=None, split_series=True):
+        """Return (metadata, dataframe) tuples, parsed by a process pool.
 
-            if values:
+        Like `parallel_get_series`, but the events are gathered in chunks
+        as done by `bulk_get_series`. Duplicate (code, location_code) pairs
+        are skipped in document order, also if `ordered` is False.
+        See `bulk_get_series` for chunk_bytes and split_series.
 
-                # Construct a pandas DataFrame from the events.
+        """
+        duplicate_check_set = set()
 
-                # NB: np.float is shorthand for np.float64. This matches the
-                # "double" type of the "value" attribute in the XML Schema
-                # (an IEEE double-precision 64-bit floating-point number).
+        if not ordered:
+            # Let only the first occurrence of a pair be parsed at all.
+            skip = set()
+            with self._mapped() as mm:
+                for index, header in enumerate(scan_headers(mm)):
+                    if is_duplicate(header, duplicate_check_set, self.source):
+                        skip.add(index)
+            duplicate_check_set = None
+        else:
+            skip = None
+
+        def items():
+            for result in self._parallel(_iter_bulk_series, max_workers,
+                                         ordered, batch_bytes, skip):
+                for header, comment, events, tz_offset in result:
+                    if duplicate_check_set is not None and is_duplicate(
+                            header, duplicate_check_set, self.source):
+                        continue
+                    yield header, comment, events, tz_offset
+
+        for chunk in bulk_chunks(items(), chunk_size, chunk_bytes=chunk_bytes,
+                                 split_series=split_series):
+            yield chunk
+
+    def _parallel(self, function, max_workers, ordered, batch_bytes,
+                  skip=None):
+        """Yield the results of function for batches of series."""
+        with self._mapped() as mm:
+            prolog, epilog, ranges = scan_series(mm)
+        if skip:
+            ranges = [r for i, r in enumerate(ranges) if i not in skip]
+        batches = batch_ranges(ranges, batch_bytes)
+        max_workers = max_workers or os.cpu_count()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Keep a limited number of batches in flight to bound memory.
+            pending = []
+
+            def submit():
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.append(executor.submit(
+                        _parse_batch, function, self.source, prolog, epilog,
+                        batch))
+
+            for _ in range(2 * max_workers):
+                submit()
+
+            while pending:
+                if ordered:
+                    future = pending.pop(0)
+                else:
+                    future = next(as_completed(pending))
+                    pending.remove(future)
+                result = future.result()
+                submit()
+                yield result
+
+
+def iter_series_elements(source, on_tz=None, stats=NULL_STATS):
+    """Yield a (tz, series) tuple per series element of a PI XML.
+
+    The timeZone (in hours, or None) precedes the first series according
+    to the schema. It is captured once, from its own end event, instead of
+    being looked up through the parent of every series. A series is
+    cleared (and removed from the document) when the next one is asked
+    for, so the consumer must be done with it by then.
 
-                data = {'value': np.array(values, float)}
+    Args:
+        source: path or file object of a PI XML
+        on_tz: called with the timeZone once it is known, i.e. before the
+            first series is yielded (or at the end, if there is none)
+        stats: a `tslib.stats.Stats`, for the parse time and bytes read
+    """
+    tz = None
+    first = True
+    started = stats.clock()
 
-                # The "flag" attribute in the XML Schema is of type "int".
-                # This corresponds to a signed 32-bit integer. NB: this
-                # is not the same as the "integer" type, which is an
-                # infinite set. TODO: should we bother casting or
-                # leave flags as strings?
+    for _, element in iterparse(source, tag=(TIMEZONE, SERIES)):
+        if element.tag == TIMEZONE:
+            # only the timeZone of the root element counts
+            if element.getparent().getparent() is None:
+                tz = float(element.text or 0)
+            continue
+        started = stats.add_time('parse', started)
 
-                if any(flags):
-                    data['flag'] = flags
+        if first:
+            first = False
+            if on_tz is not None:
+                on_tz(tz)
 
-                # The other attributes are of type "string".
+        yield tz, element
 
-                if any(flag_sources):
-                    data['flagSource'] = flag_sources
-                if any(comments):
-                    data['comment'] = comments
-                if any(users):
-                    data['user'] = users
+        # see `fast_iterparse`
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+        started = stats.clock()
 
-                dataframe = pd.DataFrame(data=data, index=datetimes)
+    if first and on_tz is not None:
+        on_tz(tz)
 
-                if series.getparent()[0].tag == TIMEZONE:
-                    offset = float(series.getparent()[0].text or 0)
-                    tz_localize(dataframe, offset, copy=False)
+    if stats.enabled:
+        stats.count('bytes_read', source_nbytes(source))
 
-            else:
 
-                # No events. The `minOccurs` attribute of the
-                # `event` element is 0, so this valid XML.
+def iter_series(source, matches=None, start=None, end=None,
+                attributes=None, marks=None, stats=NULL_STATS):
+    """Yield a (metadata, dataframe) tuple per series.
 
-                dataframe = None
+    See `PiXmlReader.get_series`, which this is the implementation of.
 
-            if series[-1].tag == COMMENT:
-                comment = series[-1]
-                if comment.text is not None:
-                    metadata[u'comment'] = comment.text
+    Args:
+        source: path or file object of a PI XML
+        matches: predicate on the header element, see `series_filter`
+        start, end: the time window of the events, see `window_bounds`
+        attributes: the optional event attributes to read (default all)
+        marks(dict): if not None, the high-water marks of the series, see
+            `PiXmlReader.get_new_series`. Only events after the mark of
+            their series are read and series without such events are
+            skipped. The marks are updated in place.
+        stats: a `tslib.stats.Stats` to be filled
+    """
+    attributes = select_attributes(attributes)
+    bounds = None
 
-            series.clear()
+    for tz, series in iter_series_elements(source, stats=stats):
+        if matches is not None and not matches(series[0]):
+            continue
+        if bounds is None:
+            bounds = window_bounds(start, end, tz)
+        item = series_item(series, tz, bounds, attributes, marks, stats)
+        if item is not None:
+            stats.count('series')
+            stats.count('events', frame_length(item[1]))
+            yield item
 
-            yield metadata, dataframe
 
-    def bulk_get_series(self, chunk_size=250000):
-        """Return a (metadata, dataframe) tuple.
+def series_item(series, tz, bounds, attributes, marks=None,
+                stats=NULL_STATS):
+    """Return the (metadata, dataframe) tuple of a series element.
 
-        Metadata is returned as a dict:
-        https://github.com/martinblech/xmltodict
-        http://www.xml.com/pub/a/2006/05/31/⏎
-        converting-between-xml-and-json.html
+    Args:
+        series: lxml element of a completely parsed `series`
+        tz(float): the timeZone of the document, or None
+        bounds: the (lower, upper) bounds of `window_bounds`
+        attributes: the optional event attributes to read
+        marks(dict): the high-water marks, see `iter_series`
+        stats: a `tslib.stats.Stats` to be filled
 
-        The dataframe's DatetimeIndex has the same time zone (offset)
-        as the PI XML, which is generally not UTC. If you need UTC,
-        the returned data frame can be converted as follows:
+    Returns:
+        None if marks are given and the series has no new events
+    """
+    started = stats.clock()
+    lower, upper = bounds
+    header = series[0]
+
+    metadata = element_to_dict(header)
+    started = stats.add_time('header', started)
+
+    missVal = metadata['header']['missVal']
+
+    if marks is not None:
+        mark_key = (get_code(metadata['header']),
+                    metadata['header']['locationId'])
+        mark = window_bounds(marks.get(mark_key), None, tz)[0]
+        newest = mark
+
+    dates = []
+    times = []
+    values = []
+    flags = []
+    flag_sources = []
+    comments = []
+    users = []
+
+    iterator = series.iterchildren(tag=EVENT)
+    # the raw 'dateTtime' key of an event is only needed for comparisons
+    keyed = marks is not None or lower is not None or upper is not None
+
+    if marks is not None and mark is not None:
+        # Compare the raw strings of all events at once, so that only
+        # the new events are visited.
+        keys = np.array([d + 'T' + t for d, t in zip(
+            EVENT_DATES(series), EVENT_TIMES(series))], dtype=str)
+        iterator = compress(iterator, keys > mark)
+
+    for event in iterator:
+        d = event.attrib['date']
+        t = event.attrib['time']
+        if keyed:
+            key = "{}T{}".format(d, t)
+            if (lower is not None and key < lower) or \
+                    (upper is not None and key >= upper):
+                continue
+        dates.append(d)
+        times.append(t)
+        value = event.attrib['value']
+        values.append(value if value != missVal else "NaN")
+        flags.append(event.attrib.get('flag', None))
+        flag_sources.append(event.attrib.get('flagSource', None))
+        comments.append(event.attrib.get('comment', None))
+        users.append(event.attrib.get('user', None))
+        if marks is not None and (newest is None or key > newest):
+            newest = key
 
-        df.tz_convert('UTC', copy=False)
+    started = stats.add_time('events', started)
 
-        Caveat: the PI XML timeZone element is optional. In that
-        case, the DatetimeIndex has no time zone information.
-        """
-        duplicate_check_set = set()
-        meta_data = []
-
-        # initialize a counter to index into the 'bulk_data' array
-        i = 0
-
-        # by default, do not localize
-        tz_offset = None
-
-        for series_i, (_, series) in enumerate(
-                fast_iterparse(self.source, tag=SERIES)):
-            header = xmltodict.parse(etree.tostring(series[0]))['header']
-            series_code = get_code(header)
-            miss_val = header['missVal']
-            location_code = header['locationId']
-
-            if (series_code, location_code) in duplicate_check_set:
-                logger.info(
-                    'PiXML import skipped an entry because of duplicate for '
-                    'timeseries_code "%s", location_code "%s" and file "%s".',
-                    series_code, location_code, self.source
-                )
+    if marks is not None:
+        if not values:
+            return None
+        marks[mark_key] = newest
+
+    if values:
+
+        # Construct a pandas DataFrame from the events.
+
+        # NB: np.float is shorthand for np.float64. This matches the
+        # "double" type of the "value" attribute in the XML Schema
+        # (an IEEE double-precision 64-bit floating-point number).
+
+        data = {'value': np.array(values, float)}
+
+        # The "flag" attribute in the XML Schema is of type "int".
+        # This corresponds to a signed 32-bit integer. NB: this
+        # is not the same as the "integer" type, which is an
+        # infinite set. TODO: should we bother casting or
+        # leave flags as strings?
+
+        if any(flags) and 'flag' in attributes:
+            data['flag'] = flags
+
+        # The other attributes are of type "string".
+
+        if any(flag_sources) and 'flagSource' in attributes:
+            data['flagSource'] = flag_sources
+        if any(comments) and 'comment' in attributes:
+            data['comment'] = comments
+        if any(users) and 'user' in attributes:
+            data['user'] = users
+
+        index = pd.DatetimeIndex(
+            parse_event_datetimes(dates, times).view('datetime64[ns]'))
+        dataframe = pd.DataFrame(data=data, index=index)
+
+        if tz is not None:
+            dataframe = tz_localize(dataframe, tz, copy=False)
+
+    else:
+
+        # No events. The `minOccurs` attribute of the
+        # `event` element is 0, so this valid XML.
+
+        dataframe = None
+
+    if series[-1].tag == COMMENT:
+        comment = series[-1]
+        if comment.text is not None:
+            metadata[u'comment'] = comment.text
+
+    stats.add_time('dataframe', started)
+    return metadata, dataframe
+
+
+def iter_bulk_series(source, duplicate_check_set=None, name=None,
+                     matches=None, start=None, end=None, attributes=None,
+                     stats=NULL_STATS):
+    """Yield a (header, comment, events, tz_offset) tuple per series.
+
+    The header is the dict of the series header, see `header_fields`,
+    and events the dict of ndarrays returned by `decode_events`. The
+    events of consecutive series are decoded in batches, see
+    `decode_batches`.
+
+    Args:
+        source: path or file object of a PI XML
+        duplicate_check_set(set): (code, location_code) pairs to be skipped.
+            Pairs that are yielded will be added. Pass None to skip nothing.
+        name: the source as it should appear in log messages
+        matches: predicate on the header element, see `series_filter`
+        start, end: the time window of the events, see `window_bounds`
+        attributes: the optional event attributes to decode (default all)
+        stats: a `tslib.stats.Stats` to be filled
+    """
+    def items():
+        bounds = None
+        for tz, series in iter_series_elements(source, stats=stats):
+            if bounds is None:
+                bounds = window_bounds(start, end, tz)
+                # by default, do not localize
+                tz_offset = None if tz is None else FixedOffset(tz * 60)
+            if matches is not None and not matches(series[0]):
                 continue
+            item = bulk_item(series, tz_offset, bounds, attributes,
+                             duplicate_check_set, name or source, stats)
+            if item is not None:
+                yield item
+
+    for item in decode_batches(items(), stats=stats):
+        stats.count('series')
+        stats.count('events', len(item[2]['value']))
+        yield item
+
+
+def frame_length(dataframe):
+    """Return the number of rows of a dataframe of `series_item`."""
+    return 0 if dataframe is None else len(dataframe)
+
+
+def bulk_item(series, tz_offset, bounds, attributes,
+              duplicate_check_set=None, name=None, stats=NULL_STATS):
+    """Return the (header, comment, raw, tz_offset) tuple of a series.
+
+    See `iter_bulk_series` for the arguments and `series_item` for series
+    and bounds. The tz_offset is the pytz offset of the timeZone, or None.
+    The raw events are those of `raw_events`, to be decoded by
+    `decode_batches`.
+
+    Returns:
+        None if the series is a duplicate
+    """
+    started = stats.clock()
+    header = header_fields(series[0])
+    started = stats.add_time('header', started)
+
+    if duplicate_check_set is not None and is_duplicate(
+            header, duplicate_check_set, name):
+        return None
+
+    if series[-1].tag == COMMENT:
+        comment = series[-1].text
+    else:
+        comment = None
+
+    raw = raw_events(series, bounds, attributes)
+    stats.add_time('events', started)
+    return header, comment, raw, tz_offset
+
 
-            duplicate_check_set.add((series_code, location_code))
-
-            # get the timezone offset, only for the first entry
-            if series_i == 0 and series.getparent()[0].tag == TIMEZONE:
-                tz_offset = FixedOffset(
-                    float(series.getparent()[0].text or 0) * 60)
-
-            if series[-1].tag == COMMENT:
-                comment = series[-1].text
-            else:
-                comment = None
-
-            meta_data.append({
-                "code": series_code,
-                "location_code": location_code,
-                "pru": header['parameterId'],
-                "unit": header.get('units', None),
-                "name": header['parameterId'],
-                "location_name": (header.get('stationName', '') or '')[:80],
-                "lat": float(header.get('lat', np.nan)),
-                "lon": float(header.get('lon', np.nan)),
-                "comment": comment,
-            })
-
-            for event in series.iterchildren(tag=EVENT):
-                if i == 0:
-                    # the first in this chunk: init the bulk_data
-
-                    # NB: np.float is shorthand for np.float64. This matches the
-                    # "double" type of the "value" attribute in the XML Schema
-                    # (an IEEE double-precision 64-bit floating-point number).
-                    bulk_data = {
-                        "code": np.empty(chunk_size, dtype=object),
-                        "comment": np.empty(chunk_size, dtype=object),
-                        "timestamp": np.empty(chunk_size,
-                                              dtype='datetime64[ms]'),
-                        "flag_source": np.empty(chunk_size, dtype=object),
-                        # use float64 to allow np.nan values
-                        "flag": np.empty(chunk_size, dtype=np.float64),
-                        "location_code": np.empty(chunk_size, dtype=object),
-                        "user": np.empty(chunk_size, dtype=object),
-                        "value": np.empty(chunk_size, dtype=np.float64),
-                    }
-
-                    # check if we need the leftover metadata from the prev iter
-                    if len(meta_data) > 0:
-                        if meta_data[0]['code'] != series_code:
-                            meta_data = meta_data[1:]
-
-                # create timestamp and code rows, these will form the index
-                d = event.attrib['date']
-                t = event.attrib['time']
-                bulk_data["timestamp"][i] = "{}T{}".format(d, t)
-                bulk_data["code"][i] = series_code
-                bulk_data["location_code"][i] = location_code
-
-                # add the data
-                value = event.attrib['value']
-                bulk_data["value"][i] = value if value != miss_val else np.nan
-                bulk_data["flag"][i] = event.attrib.get('flag', np.nan)
-                bulk_data["flag_source"][i] = \
-                    event.attrib.get('flagSource', None)
-                bulk_data["comment"][i] = event.attrib.get('comment', None)
-                bulk_data["user"][i] = event.attrib.get('user', None)
-
-                i += 1
-                if i >= chunk_size:
-                    i = 0  # for next iter
-
-                    # Construct a pandas DataFrame from the events.
-                    dataframe = dataframe_from_bulk(bulk_data, tz_offset)
-
-                    yield pd.DataFrame(meta_data), dataframe
-
-                    # keep the last metadata entry
+def source_nbytes(source):
+    """Return the number of bytes read from a (completely parsed) source.
+    """
+    if isinstance(source, MappedFile):
+        return source.position
+    if hasattr(source, 'tell'):
+        return source.tell()
+    return os.path.getsize(source)
+
+
+def save_marks(marks, path):
+    """Save the high-water marks of `get_new_series` as JSON.
+
+    The marks must be raw 'dateTtime' strings, as set by `get_new_series`.
+    """
+    with open(path, 'w') as f:
+        json.dump([[code, location_code, mark] for (code, location_code),
+                   mark in sorted(marks.items())], f)
+
+
+def load_marks(path):
+    """Return the high-water marks saved by `save_marks`."""
+    with open(path) as f:
+        return {(code, location_code): mark
+                for code, location_code, mark in json.load(f)}
+
+
+def series_filter(parameters=None, locations=None, codes=None):
+    """Return a predicate on the header element of a series.
+
+    A header matches if its parameterId, locationId and code (see
+    `get_code`) are among the given ones. None means: any. The header is
+    inspected as an lxml element, before any conversion to a dict.
+
+    Returns:
+        a function of a header element, or None if all headers match
+    """
+    if parameters is None and locations is None and codes is None:
+        return None
+
+    parameters = None if parameters is None else frozenset(parameters)
+    locations = None if locations is None else frozenset(locations)
+    codes = None if codes is None else frozenset(codes)
+
+    def matches(header):
+        if parameters is not None and \
+                _header_text(header, 'parameterId') not in parameters:
+            return False
+        if locations is not None and \
+                _header_text(header, 'locationId') not in locations:
+            return False
+        if codes is not None and get_element_code(header) not in codes:
+            return False
+        return True
+
+    return matches
+
+
+def _header_text(header, tag):
+    text = header.findtext('{%s}%s' % (NS, tag))
+    return text.strip() if text is not None else None
+
+
+def get_element_code(header):
+    """Return the code of a header element, like `get_code` does."""
+    time_step = header.find('{%s}timeStep' % NS)
+    return '{}::{}::{}::{}'.format(
+        _header_text(header, 'parameterId'),
+        time_step.get('unit'),
+        time_step.get('divider', 1),
+        time_step.get('multiplier', 1)
+    )
+
+
+def select_attributes(attributes):
+    """Return the optional event attributes to read as a set."""
+    if attributes is None:
+        return set(ATTRIBUTES)
+    attributes = set(attributes)
+    unknown = attributes.difference(ATTRIBUTES)
+    if unknown:
+        raise ValueError(
+            'Unknown event attributes: {}'.format(', '.join(sorted(unknown))))
+    return attributes
+
+
+def window_bounds(start, end, offset_in_hours=None):
+    """Return a time window as raw PI XML 'dateTtime' strings.
+
+    The date and time attributes of PI XML events have a fixed width, so
+    events can be selected by comparing these strings directly, i.e.
+    without converting them first.
+
+    Args:
+        start, end: datetimes or strings like '2012-10-16T12:00:00' in
+            the time zone of the file (or None, for no bound). Time zone
+            aware datetimes are converted to the timeZone of the file.
+        offset_in_hours(float): the timeZone of the file or None
+
+    Returns:
+        a (start, end) tuple of strings or None
+    """
+    def bound(value):
+        if value is None or isinstance(value, str):
+            return value
+        if value.tzinfo is not None:
+            if offset_in_hours is not None:
+                value = value.astimezone(FixedOffset(offset_in_hours * 60))
+            value = value.replace(tzinfo=None)
+        return value.isoformat()
+
+    return bound(start), bound(end)
+
+
+def is_duplicate(header, duplicate_check_set, source):
+    """Return True if a series has been seen before, otherwise register it.
+    """
+    series_code = get_code(header)
+    location_code = header['locationId']
+
+    if (series_code, location_code) in duplicate_check_set:
+        logger.info(
+            'PiXML import skipped an entry because of duplicate for '
+            'timeseries_code "%s", location_code "%s" and file "%s".',
+            series_code, location_code, source
+        )
+        return True
+
+    duplicate_check_set.add((series_code, location_code))
+    return False
+
+
+def bulk_chunks(items, chunk_size, compact=False, attributes=None,
+                chunk_bytes=None, split_series=True, categories=None,
+                stats=NULL_STATS):
+    """Gather the events of consecutive series in chunks of chunk_size.
+
+    Args:
+        items: iterable of (header, comment, events, tz_offset) tuples,
+            see `iter_bulk_series`
+        chunk_size(int): the number of rows per chunk (except the last)
+        compact(bool): use the compact layout, see `new_compact_chunk`
+        attributes: the optional event attributes having a column
+            (default all)
+        chunk_bytes(int): the memory budget per chunk, i.e. the bound of
+            `DataFrame.memory_usage(deep=True)`. The rows are estimated by
+            `row_nbytes` and `string_nbytes`, the codes of the index levels
+            by `code_nbytes`. Chunks are closed when the budget or
+            chunk_size rows is reached, whichever comes first. The strings
+            are estimated per series (by their mean size), so that only
+            chunks holding part of a series with strings of varying size
+            may exceed the budget (besides chunks of a single row).
+        split_series(bool): whether a series may be divided over chunks.
+            If not, a chunk is closed before a series that does not fit
+            (unless it is empty: a single series may exceed the limits).
+        categories(dict): the categories of the code and location_code
+            levels of every chunk, as lists (e.g. of `PiXmlIndex.categories`)
+        stats: a `tslib.stats.Stats` to be filled
+
+    Yields:
+        (metadata, dataframe) tuples, see `PiXmlReader.bulk_get_series`.
+        The memory usage of the dataframe in bytes is in its attrs.
+    """
+    meta_data = []
+
+    # The code and location_code rows are positions in per-file
+    # dictionaries of the codes, from which the index levels are built
+    # without hashing every row. Unless the categories are given or the
+    # layout is compact, a chunk has the (sorted) codes that it holds.
+    fixed = categories is not None
+    categories = {
+        key: {code: position for position, code in
+              enumerate(categories[key] if fixed else [])}
+        for key in ("code", "location_code")
+    }
+    present = None
+
+    # The bytes of the codes of the index levels: of the dictionaries
+    # (compact or fixed categories), or of the codes in the chunk.
+    dictionary_nbytes = {
+        key: sum(code_nbytes(code) for code in categories[key])
+        for key in categories
+    }
+    sizes = {key: len(categories[key]) for key in categories}
+    if chunk_bytes is not None:
+        empty_nbytes = empty_chunk_nbytes(compact, attributes)
+
+    # initialize a counter to index into the 'bulk_data' array
+    i = 0
+
+    # by default, do not localize
+    tz_offset = None
+
+    def finish(bulk_data, size):
+        started = stats.clock()
+        if size < len(bulk_data["value"]):
+            bulk_data = {key: value[:size] for key, value in bulk_data.items()}
+        if compact:
+            bulk_data = finish_compact_chunk(bulk_data, categories, sizes)
+        else:
+            for key in ("code", "location_code"):
+                bulk_data[key] = chunk_categorical(
+                    bulk_data[key], categories[key],
+                    None if fixed else present[key])
+
+        # Construct a pandas DataFrame from the events.
+        dataframe = dataframe_from_bulk(bulk_data, tz_offset, stats)
+        dataframe.attrs["memory_usage"] = int(
+            dataframe.memory_usage(deep=True).sum())
+        stats.add_time('dataframe', started)
+        stats.count('chunks')
+        stats.peak('peak_chunk_bytes', dataframe.attrs["memory_usage"])
+        return dataframe
+
+    for series_i, (header, comment, events, offset) in enumerate(items):
+        series_code = get_code(header)
+        location_code = header['locationId']
+
+        # the timezone offset of the first entry holds for all
+        if series_i == 0:
+            tz_offset = offset
+
+        meta_data.append(series_metadata(header, comment))
+
+        names = {"code": series_code, "location_code": location_code}
+        codes = {}
+        for key, code in names.items():
+            known = len(categories[key])
+            codes[key] = category_code(categories[key], code, fixed)
+            if len(categories[key]) > known:
+                dictionary_nbytes[key] += code_nbytes(code)
+
+        n = len(events['value'])
+        start = 0
+
+        if chunk_bytes is not None and n > 0:
+            strings = string_nbytes(events) / n
+
+        while start < n:
+            if i == 0:
+                # the first in this chunk: init the bulk_data
+                if split_series:
+                    capacity = chunk_size
+                else:
+                    capacity = max(chunk_size, n)
+                if compact:
+                    bulk_data = new_compact_chunk(capacity, attributes)
+                else:
+                    bulk_data = new_chunk(capacity, attributes)
+                used_bytes = 0
+                present = {"code": set(), "location_code": set()}
+                present_nbytes = 0
+
+                # check if we need the leftover metadata from the prev iter
+                if len(meta_data) > 0:
+                    if meta_data[0]['code'] != series_code:
+                        meta_data = meta_data[1:]
+
+            # copy as many events as fit in the current chunk
+            size = min(capacity - i, n - start)
+            if chunk_bytes is not None:
+                nbytes = row_nbytes(bulk_data, events, capacity, categories)
+                nbytes += strings
+                # the None of the rows before a column that is new
+                backfill = i * sum(
+                    column.itemsize + NONE_NBYTES
+                    for key, column in events.items() if key not in bulk_data)
+                used_bytes += backfill
+                if compact or fixed:
+                    levels = sum(dictionary_nbytes.values())
+                else:
+                    levels = present_nbytes + sum(
+                        code_nbytes(names[key])
+                        for key, position in codes.items()
+                        if position >= 0 and position not in present[key])
+                size = min(size, int(
+                    (chunk_bytes - empty_nbytes - levels - used_bytes)
+                    // nbytes))
+
+            if size <= 0 or (not split_series and size < n - start):
+                if i > 0:
+                    # No room left: close the chunk, with the metadata of
+                    # this series only if some of its rows are in it.
+                    if start > 0:
+                        yield pd.DataFrame(meta_data), finish(bulk_data, i)
+                    else:
+                        yield pd.DataFrame(meta_data[:-1]), finish(
+                            bulk_data, i)
                     meta_data = meta_data[-1:]
+                    i = 0
+                    continue
+                # an empty chunk gets one row at least, or the whole series
+                size = max(size, 1) if split_series else n - start
+
+            rows = slice(i, i + size)
+            for key, column in events.items():
+                column = column[start:start + size]
+                if not compact:
+                    bulk_data[key][rows] = column
+                elif key == "flag":
+                    missing = np.isnan(column)
+                    bulk_data["flag"][rows] = np.where(missing, 0, column)
+                    bulk_data["flag_mask"][rows] = missing
+                else:
+                    if key not in bulk_data:
+                        # absent columns are only allocated when needed
+                        bulk_data[key] = np.empty(capacity, dtype=object)
+                    bulk_data[key][rows] = column
+
+            # the code rows will form the index (with the timestamps)
+            bulk_data["code"][rows] = codes["code"]
+            bulk_data["location_code"][rows] = codes["location_code"]
+            for key, position in codes.items():
+                if position >= 0 and position not in present[key]:
+                    present[key].add(position)
+                    present_nbytes += code_nbytes(names[key])
+                sizes[key] = len(categories[key])
+
+            if chunk_bytes is not None:
+                used_bytes += size * nbytes
+            i += size
+            start += size
+            if split_series and i >= capacity:
+                i = 0  # for next iter
+
+                yield pd.DataFrame(meta_data), finish(bulk_data, capacity)
+
+                # keep the last metadata entry
+                meta_data = meta_data[-1:]
+
+    if i > 0:
+        # There is still some data left smaller than the chunk size. We
+        # don't need to take care of cleaning up.
+        yield pd.DataFrame(meta_data), finish(bulk_data, i)
+
+
+def series_metadata(header, comment=None):
+    """Return the metadata of a series in a chunk of bulk data.
+
+    Args:
+        header(dict): the header fields, see `header_fields`
+        comment(str): the comment of the series, if any
+    """
+    return {
+        "code": get_code(header),
+        "location_code": header['locationId'],
+        "pru": header['parameterId'],
+        "unit": header.get('units', None),
+        "name": header['parameterId'],
+        "location_name": (header.get('stationName', '') or '')[:80],
+        "lat": float(header.get('lat', np.nan)),
+        "lon": float(header.get('lon', np.nan)),
+        "comment": comment,
+    }
+
+
+def row_nbytes(bulk_data, events, capacity, categories):
+    """Return the size of a row of a chunk in bytes.
+
+    Columns of the events that the chunk does not have yet are included.
+    The strings that object columns refer to are not, see `string_nbytes`,
+    except for the None of object columns that the events do not have.
+    Like `DataFrame.memory_usage(deep=True)`, every None is counted.
+
+    The code and location_code rows count as the codes of the index
+    levels, whose dtype pandas chooses by the size of the level (at most
+    that of the dictionary in categories). The timestamp counts as both
+    a code and an entry of its level, as if all timestamps differ (of at
+    most capacity rows).
+    """
+    nbytes = 0
+    for key, array in bulk_data.items():
+        if key in categories:
+            nbytes += code_itemsize(len(categories[key]))
+        elif key == "timestamp":
+            nbytes += array.itemsize + code_itemsize(capacity)
+        else:
+            nbytes += array.itemsize
+        if array.dtype == object and key not in events and \
+                key not in categories:
+            nbytes += NONE_NBYTES
+    for key, column in events.items():
+        if key not in bulk_data:
+            nbytes += column.itemsize
+    return nbytes
+
+
+def string_nbytes(events):
+    """Return the size of the strings of the events of a series in bytes.
+    """
+    return sum(
+        sys.getsizeof(string) for column in events.values()
+        if column.dtype == object for string in column)
+
+
+def code_nbytes(code):
+    """Return the size of a code in an index level in bytes (at most).
+    """
+    return sys.getsizeof(code) + CODE_NBYTES
+
+
+def code_itemsize(size):
+    """Return the itemsize of the codes of an index level of size entries.
+
+    Like pandas, the smallest int type that holds them (and -1).
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return np.dtype(dtype).itemsize
+    return np.dtype(np.int64).itemsize
+
+
+def empty_chunk_nbytes(compact=False, attributes=None):
+    """Return the memory usage of an empty chunk in bytes, see `bulk_chunks`.
+    """
+    if compact:
+        bulk_data = finish_compact_chunk(
+            new_compact_chunk(0, attributes),
+            {"code": {}, "location_code": {}})
+    else:
+        bulk_data = new_chunk(0, attributes)
+    dataframe = dataframe_from_bulk(bulk_data, None)
+    return int(dataframe.memory_usage(deep=True).sum())
+
+
+def new_chunk(chunk_size, attributes=None):
+    """Return the (empty) arrays of a chunk of bulk data."""
+    # NB: np.float is shorthand for np.float64. This matches the
+    # "double" type of the "value" attribute in the XML Schema
+    # (an IEEE double-precision 64-bit floating-point number).
+    bulk_data = {
+        # positions in the dictionaries of the codes, see `bulk_chunks`
+        "code": np.empty(chunk_size, dtype=np.int32),
+        "comment": np.empty(chunk_size, dtype=object),
+        "timestamp": np.empty(chunk_size, dtype='datetime64[ms]'),
+        "flag_source": np.empty(chunk_size, dtype=object),
+        # use float64 to allow np.nan values
+        "flag": np.full(chunk_size, np.nan),
+        "location_code": np.empty(chunk_size, dtype=np.int32),
+        "user": np.empty(chunk_size, dtype=object),
+        "value": np.empty(chunk_size, dtype=np.float64),
+    }
+    if attributes is not None:
+        for key, attribute, _ in OPTIONAL_ATTRIBUTES:
+            if attribute not in attributes:
+                del bulk_data[key]
+    return bulk_data
+
+
+def new_compact_chunk(chunk_size, attributes=None):
+    """Return the (empty) arrays of a chunk of bulk data, compact layout.
+
+    The code and location_code rows are int32 positions in per-file
+    dictionaries, which become categoricals without any hashing. Flags
+    are int32 with a mask of missing values, i.e. a nullable Int32 (if
+    the flag attribute is selected). The object columns comment,
+    flag_source and user are only allocated if any series in the chunk
+    has them.
+    """
+    bulk_data = {
+        "code": np.empty(chunk_size, dtype=np.int32),
+        "timestamp": np.empty(chunk_size, dtype='datetime64[ms]'),
+        "location_code": np.empty(chunk_size, dtype=np.int32),
+        "value": np.empty(chunk_size, dtype=np.float64),
+    }
+    if attributes is None or "flag" in attributes:
+        bulk_data["flag"] = np.zeros(chunk_size, dtype=np.int32)
+        bulk_data["flag_mask"] = np.ones(chunk_size, dtype=bool)
+    return bulk_data
+
+
+def finish_compact_chunk(bulk_data, categories, sizes=None):
+    """Convert the arrays of a compact chunk to pandas arrays.
+
+    The categories are the first sizes[key] codes of the dictionaries
+    (default all), e.g. those up to the last series in the chunk. The
+    flag column is left out if all flags are missing.
+    """
+    data = {}
+    for key in ["code", "comment", "timestamp", "flag_source", "flag",
+                "location_code", "user", "value"]:
+        if key in categories:
+            data[key] = chunk_categorical(
+                bulk_data[key], categories[key],
+                size=None if sizes is None else sizes[key])
+        elif key == "flag":
+            flag_mask = bulk_data.get("flag_mask")
+            if flag_mask is not None and not flag_mask.all():
+                data[key] = pd.arrays.IntegerArray(
+                    bulk_data[key], flag_mask)
+        elif key in bulk_data:
+            data[key] = bulk_data[key]
+    return data
+
+
+def category_code(categories, code, fixed=False):
+    """Return the position of a code in a dictionary of the codes.
+
+    A code that is new is added, unless the categories are fixed. A
+    missing code (None) has position -1.
+
+    Raises:
+        ValueError: if the categories are fixed and do not have the code
+    """
+    if code is None:
+        return -1
+    position = categories.get(code)
+    if position is None:
+        if fixed:
+            raise ValueError("{!r} is not in the categories".format(code))
+        position = categories[code] = len(categories)
+    return position
+
 
-        if i > 0:
-            # There is still some data left smaller than the chunk size. We
-            # don't need to take care of cleaning up.
+def chunk_categorical(positions, categories, present=None, size=None):
+    """Return the Categorical of the positions in a dictionary of codes.
 
-            for key, value in bulk_data.items():
-                bulk_data[key] = value[:i]
+    Args:
+        positions: int ndarray of the rows (-1 for missing)
+        categories(dict): the dictionary of the codes
+        present: the positions in the rows, to have only their codes as
+            (sorted) categories, like `pd.Categorical(rows)`. By default,
+            the categories are all codes of the dictionary, in its order.
+        size(int): the number of codes of the dictionary to use (default
+            all), if present is None
+    """
+    codes = list(categories)[:size]
+    if present is None:
+        return pd.Categorical.from_codes(positions, categories=codes)
+    present = sorted(present, key=codes.__getitem__)
+    # the last entry is the lookup of -1
+    lookup = np.full(len(codes) + 1, -1, dtype=np.int32)
+    lookup[present] = np.arange(len(present), dtype=np.int32)
+    return pd.Categorical.from_codes(
+        lookup[positions], categories=[codes[p] for p in present])
+
+
+def scan_series(buffer):
+    """Return the byte ranges of the series elements of a PI XML.
+
+    Args:
+        buffer: the raw bytes of a PI XML, e.g. an mmap
+
+    Returns:
+        a (prolog, epilog, ranges) tuple. The prolog holds all bytes before
+        the first series (including the timeZone element), the epilog the
+        end tag of the root element, and ranges is a list of (offset,
+        length) tuples, one for every series element.
+    """
+    ranges = []
+    offset = None
+    for match in SERIES_BOUNDARY.finditer(buffer):
+        if match.group().startswith(b'</'):
+            ranges.append((offset, match.end() - offset))
+        else:
+            offset = match.start()
+    prolog = buffer[:ranges[0][0] if ranges else buffer.rfind(b'</')]
+    root = ROOT_START.search(prolog)
+    epilog = b'</' + root.group(1) + b'>'
+    return prolog, epilog, ranges
+
+
+def scan_prolog(buffer):
+    """Return the prolog of a PI XML as a complete (series-less) document.
+
+    Only the bytes up to the first series are inspected.
+    """
+    match = SERIES_BOUNDARY.search(buffer)
+    prolog = buffer[:match.start() if match else buffer.rfind(b'</')]
+    root = ROOT_START.search(prolog)
+    return prolog + b'</' + root.group(1) + b'>'
+
+
+def scan_headers(buffer):
+    """Yield the header (see `header_fields`) of every series.
+
+    Only the bytes of the series headers are parsed, not the events.
+    """
+    prolog, epilog, ranges = scan_series(buffer)
+    for offset, length in ranges:
+        # e.g. b'<series>' or b'<pi:series ' -> b'</series>'
+        name = SERIES_BOUNDARY.match(buffer, offset).group()[1:-1]
+        end = HEADER_END.search(buffer, offset, offset + length).end()
+        fragment = b''.join([
+            prolog, buffer[offset:end], b'</', name, b'>', epilog])
+        for _, series in etree.iterparse(io.BytesIO(fragment), tag=SERIES):
+            yield header_fields(series[0])
+
+
+def map_file(path):
+    """Return a read-only memory map of a file.
+
+    Raises:
+        ValueError: if the file is compressed, for the scans of the raw
+            bytes would not find anything
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    compression = detect(mm[:4])
+    if compression is not None:
+        mm.close()
+        raise ValueError("{} is {} compressed and cannot be mapped".format(
+            path, compression))
+    return mm
+
+
+class MappedFile(object):
+    """A read-only file object over a buffer, having its own position.
+
+    Multiple parses can share a single memory map this way.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+
+    def read(self, size=-1):
+        start = self.position
+        if size is None or size < 0:
+            self.position = len(self.buffer)
+        else:
+            self.position = min(start + size, len(self.buffer))
+        return self.buffer[start:self.position]
+
+
+def batch_ranges(ranges, batch_bytes):
+    """Group consecutive ranges in batches of at least batch_bytes."""
+    batch = []
+    size = 0
+    for offset, length in ranges:
+        batch.append((offset, length))
+        size += length
+        if size >= batch_bytes:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def _parse_batch(function, source, prolog, epilog, batch):
+    """Apply function to a document having a batch of series only.
+
+    This is the task of a worker process: the series are read from the
+    source file and put between the prolog and epilog, so that the
+    resulting document has the same namespaces and timeZone.
+    """
+    parts = [prolog]
+    with open(source, 'rb') as f:
+        for offset, length in batch:
+            f.seek(offset)
+            parts.append(f.read(length))
+    parts.append(epilog)
+    return list(function(io.BytesIO(b''.join(parts))))
+
+
+def _get_series(source):
+    return PiXmlReader(source).get_series()
+
+
+def _iter_bulk_series(source):
+    return iter_bulk_series(source)
+
+
+def parse_event_datetimes(dates, times):
+    """Return the int64 nanoseconds since the epoch of event dates and times.
 
-            dataframe = dataframe_from_bulk(bulk_data, tz_offset)
-            yield pd.DataFrame(meta_data), dataframe
+    PI XML event dates and times are fixed-width 'YYYY-MM-DD' and
+    'HH:MM:SS' strings. These are joined (with a delimiter) into a single
+    bytes buffer and their digits are converted by NumPy arithmetic, so
+    that no event is parsed on its own. A date is converted only once per
+    run of events on the same date. If any date or time has another
+    format, all are parsed by ciso8601 instead, as are fewer than
+    `FIXED_WIDTH_EVENTS` events (for which the fixed cost of the NumPy
+    calls exceeds that of parsing them one by one).
 
+    Args:
+        dates, times: sequences of the date and time strings of events
+    """
+    n = len(dates)
+    days = seconds = None
+    if n >= FIXED_WIDTH_EVENTS:
+        days = _fixed_width_days(dates, n)
+        if days is not None:
+            seconds = _fixed_width_seconds(times, n)
+    if days is None or seconds is None:
+        return pd.DatetimeIndex([
+            parse_datetime("{}T{}".format(d, t)) for d, t in zip(dates, times)
+        ]).as_unit('ns').asi8
+    return (days * 86400 + seconds) * 10 ** 9
+
+
+def _fixed_width_fields(strings, n, layout, limits):
+    """Return the digits of fixed-width strings as an (n, width) array.
+
+    The strings are joined with their delimiter and XOR-ed with their
+    layout (e.g. `DATE_LAYOUT`), so that a single comparison checks all
+    bytes. Returns None unless every string has the width of the layout
+    and consists of digits and its separators.
+    """
+    try:
+        buffer = (DELIMITER.join(strings) + DELIMITER).encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if len(buffer) != n * len(layout):
+        return None
+    fields = np.frombuffer(buffer, dtype=np.uint8).reshape(n, len(layout))
+    # Digits become 0-9 and the separators (and delimiter) 0. A string of
+    # another width (or containing the delimiter) moves a delimiter to a
+    # position where a digit or separator is expected.
+    fields = fields ^ layout
+    if (fields > limits).any():
+        return None
+    return fields
+
+
+def _fixed_width_days(dates, n):
+    """Return the days since the epoch of 'YYYY-MM-DD' dates, or None."""
+    fields = _fixed_width_fields(dates, n, DATE_LAYOUT, DATE_LIMITS)
+    if fields is None:
+        return None
+    # Consecutive events mostly share their date: convert the first date
+    # of every run only.
+    new = np.ones(n, dtype=bool)
+    new[1:] = (fields[1:] != fields[:-1]).any(axis=1)
+    starts = np.flatnonzero(new)
+    year, month, day = (fields[starts] @ DATE_WEIGHTS).T
+    # other years get the rows of months of length 0
+    year = np.clip(year - (FIRST_YEAR - 1), 0, LAST_YEAR - FIRST_YEAR + 2)
+    # a day of 0 wraps around, i.e. is not below the length either
+    if not ((day - 1).astype(np.uint64) < MONTH_LENGTHS[year, month]).all():
+        return None
+    days = MONTH_STARTS[year, month] + day - 1
+    return np.repeat(days, np.diff(np.append(starts, n)))
+
+
+def _fixed_width_seconds(times, n):
+    """Return the seconds since midnight of 'HH:MM:SS' times, or None."""
+    fields = _fixed_width_fields(times, n, TIME_LAYOUT, TIME_LIMITS)
+    if fields is None:
+        return None
+    seconds = fields @ TIME_WEIGHTS
+    # the minutes and seconds are below 60 already, see TIME_LIMITS
+    if not (seconds < 86400).all():
+        return None
+    return seconds
+
+
+def raw_events(series, bounds=(None, None), attributes=None):
+    """Return the raw attribute strings of the events of a series element.
+
+    Instead of visiting the events one by one, the attributes of the whole
+    series are collected by (compiled) XPath expressions. Only optional
+    attributes that some (but not all) events have require a visit of
+    every single event.
+
+    Args:
+        series: lxml element of a completely parsed `series`
+        bounds: the (start, end) of `window_bounds`, kept for the decoding
+        attributes: the optional event attributes to collect (default all)
+
+    Returns:
+        a `RawEvents` tuple of the date, time and value strings, a dict of
+        the optional attributes that any event has (None for the events
+        that do not), keyed like the columns of the bulk data, and bounds
+    """
+    values = EVENT_VALUES(series)
+    n = len(values)
+    optional = {}
+    for key, attribute, xpath in OPTIONAL_ATTRIBUTES:
+        if attributes is not None and attribute not in attributes:
+            continue
+        found = xpath(series)
+        if len(found) == n:
+            optional[key] = found
+        elif found:
+            optional[key] = [event.get(attribute) for event in
+                             series.iterchildren(tag=EVENT)]
+    return RawEvents(EVENT_DATES(series), EVENT_TIMES(series), values,
+                     optional, tuple(bounds))
+
+
+def decode_events(series, miss_val, start=None, end=None, attributes=None):
+    """Decode all events of a series element at once.
+
+    See `raw_events` and `decode_batch`, which this combines.
 
-def dataframe_from_bulk(data, tz_offset):
+    Args:
+        series: lxml element of a completely parsed `series`
+        miss_val(str): the missVal of the series header
+        start, end(str): keep the events in [start, end) only, compared
+            as raw 'dateTtime' strings (see `window_bounds`)
+        attributes: the optional event attributes to decode (default all)
+    """
+    raw = raw_events(series, (start, end), attributes)
+    return decode_batch([raw], [miss_val])[0]
+
+
+def decode_batches(items, batch_events=BATCH_EVENTS, stats=NULL_STATS):
+    """Decode the raw events of consecutive series in batches.
+
+    Converting the events of a series has a fixed cost (NumPy arrays, the
+    date and time parsing), which dominates for short series. Therefore
+    series are gathered until they have batch_events events, after which
+    their events are decoded at once by `decode_batch`.
+
+    Args:
+        items: iterable of (header, comment, raw, tz_offset) tuples, see
+            `bulk_item`
+        batch_events(int): the number of events per batch (at least)
+        stats: a `tslib.stats.Stats`, for the time of the decoding
+
+    Yields:
+        (header, comment, events, tz_offset) tuples, in the same order
+    """
+    batch = []
+    size = 0
+
+    def decode():
+        started = stats.clock()
+        events = decode_batch([raw for _, _, raw, _ in batch],
+                              [header['missVal'] for header, _, _, _ in batch])
+        stats.add_time('events', started)
+        return [(header, comment, item_events, tz_offset) for
+                (header, comment, _, tz_offset), item_events in
+                zip(batch, events)]
+
+    for item in items:
+        if batch and item[2].bounds != batch[0][2].bounds:
+            for decoded in decode():
+                yield decoded
+            batch = []
+            size = 0
+        batch.append(item)
+        size += len(item[2].values)
+        if size >= batch_events:
+            for decoded in decode():
+                yield decoded
+            batch = []
+            size = 0
+
+    if batch:
+        for decoded in decode():
+            yield decoded
+
+
+def decode_batch(raws, miss_vals):
+    """Decode the raw events of consecutive series at once.
+
+    The strings of all series are joined, so that there is a single
+    datetime and float conversion (masking the missVal of every series)
+    per batch, after which the arrays are split into views per series.
+
+    Args:
+        raws: the `RawEvents` of the series, having the same bounds
+        miss_vals: the missVal of the header of every series
+
+    Returns:
+        a list of dicts of ndarrays, one per series, having the same keys
+        and dtypes as the columns of the bulk data (except for the codes).
+        Optional attributes that no event of a series has are left out.
+    """
+    offsets = np.zeros(len(raws) + 1, dtype=np.intp)
+    np.cumsum([len(raw.values) for raw in raws], out=offsets[1:])
+    if len(raws) == 1:
+        dates, times, values = raws[0].dates, raws[0].times, raws[0].values
+    else:
+        dates = list(chain.from_iterable(raw.dates for raw in raws))
+        times = list(chain.from_iterable(raw.times for raw in raws))
+        values = list(chain.from_iterable(raw.values for raw in raws))
+    values = np.array(values, dtype=str)
+    n = len(values)
+
+    # Drop the events outside of the time window before any conversion.
+    selection = None
+    start, end = raws[0].bounds if raws else (None, None)
+    if start is not None or end is not None:
+        keys = np.array([d + 'T' + t for d, t in zip(dates, times)],
+                        dtype=str)
+        inside = np.ones(n, dtype=bool)
+        if start is not None:
+            inside &= keys >= start
+        if end is not None:
+            inside &= keys < end
+        if not inside.all():
+            selection = np.flatnonzero(inside)
+            dates = [dates[i] for i in selection]
+            times = [times[i] for i in selection]
+            values = values[selection]
+
+    timestamps = parse_event_datetimes(dates, times).view(
+        'datetime64[ns]').astype('datetime64[ms]')
+
+    # Convert the values that are not missing, the rest becomes NaN.
+    bounds = offsets if selection is None else np.searchsorted(
+        selection, offsets)
+    if len(set(miss_vals)) <= 1:
+        missing = values == (miss_vals[0] if miss_vals else None)
+    else:
+        missing = values == np.repeat(
+            np.array(miss_vals, dtype=object), np.diff(bounds))
+    value = np.full(len(values), np.nan)
+    value[~missing] = values[~missing].astype(np.float64)
+
+    data = {"timestamp": timestamps, "value": value}
+    present = {}
+
+    for key, _, _ in OPTIONAL_ATTRIBUTES:
+        present[key] = [key in raw.optional for raw in raws]
+        if not any(present[key]):
+            continue
+        # events of series without the attribute remain None
+        column = np.empty(n, dtype=object)
+        for raw, offset in zip(raws, offsets):
+            strings = raw.optional.get(key)
+            if strings is not None:
+                column[offset:offset + len(strings)] = strings
+        if selection is not None:
+            column = column[selection]
+        if key == "flag":
+            column[column == None] = np.nan  # NOQA
+            column = column.astype(np.float64)
+        data[key] = column
+
+    return [
+        {key: column[bounds[i]:bounds[i + 1]] for key, column in data.items()
+         if key not in present or present[key][i]}
+        for i in range(len(raws))
+    ]
+
+
+def dataframe_from_bulk(data, tz_offset, stats=NULL_STATS):
     """
     Create a Timeseries dataframe from a dict of ndarrays.
 
     Args:
-        bulk_data(dict):
+        bulk_data(dict): the code and location_code are Categoricals
+            (see `chunk_categorical`) or arrays of the codes
         tz_offset: pandas Offset or None
+        stats: a `tslib.stats.Stats`, for the time of the tz_localize
 
     Returns:
         pandas DataFrame object
     """
-    timestamp = pd.DatetimeIndex(data['timestamp'])
+    # The levels and codes of the index are built directly, which saves
+    # MultiIndex.from_arrays hashing every row again. Only the unique
+    # timestamps are localized.
+    levels, codes = [], []
+    for key in ['code', 'location_code']:
+        values = data[key]
+        if not isinstance(values, pd.Categorical):
+            values = pd.Categorical(values)
+        levels.append(pd.CategoricalIndex(pd.Categorical.from_codes(
+            np.arange(len(values.categories)), dtype=values.dtype)))
+        codes.append(values.codes)
+
+    timestamp_codes, timestamps = pd.factorize(data['timestamp'], sort=True)
+    timestamps = pd.DatetimeIndex(timestamps)
     if tz_offset is not None:
-        timestamp = timestamp.tz_localize(tz_offset)
-
-    index = pd.MultiIndex.from_arrays(
-        arrays=[
-            pd.Categorical(data['code']),
-            pd.Categorical(data['location_code']),
-            timestamp,
-        ],
-        names=['code', 'location_code', 'timestamp']
+        started = stats.clock()
+        timestamps = timestamps.tz_localize(tz_offset)
+        stats.add_time('tz_localize', started)
+    levels.append(timestamps)
+    codes.append(timestamp_codes)
+
+    index = pd.MultiIndex(
+        levels=levels, codes=codes,
+        names=['code', 'location_code', 'timestamp'],
+        verify_integrity=False,
     )
     dataframe = pd.DataFrame(
         data={k: data[k] for k in data if k not in index.names},
@@ -324,6 +1857,93 @@ def dataframe_from_bulk(data, tz_offset):
     return dataframe
 
 
+def element_to_dict(element):
+    """Convert an lxml element to a dict without serializing it.
+
+    The result equals `xmltodict.parse(etree.tostring(element))`, i.e.
+    namespaces are not processed: names keep their prefix, and the
+    namespace declarations in scope are attributes of the outer element
+    (e.g. '@xmlns'). Attributes are prefixed by '@', text is stripped and
+    stored as '#text' if the element also has attributes or children.
+    Repeated children become a list.
+    """
+    # lxml declares the namespace of the element itself first
+    nsmap = {element.prefix: element.nsmap[element.prefix]} \
+        if element.prefix in element.nsmap else {}
+    nsmap.update(element.nsmap)
+    return {_qualified_name(element, element.tag): _element_value(
+        element, nsmap, {})}
+
+
+def _element_value(element, nsmap, parent_nsmap):
+    result = {}
+
+    # namespace declarations first, then attributes, as serialized
+    for prefix, uri in nsmap.items():
+        if parent_nsmap.get(prefix) != uri:
+            result['@xmlns:' + prefix if prefix else '@xmlns'] = uri
+    for name, value in element.attrib.items():
+        result['@' + _qualified_name(element, name, attribute=True)] = value
+
+    text = [element.text or '']
+    for child in element:
+        text.append(child.tail or '')
+        if not isinstance(child.tag, str):
+            continue  # a comment or processing instruction
+        name = _qualified_name(child, child.tag)
+        value = _element_value(child, child.nsmap, nsmap)
+        if name not in result:
+            result[name] = value
+        elif isinstance(result[name], list):
+            result[name].append(value)
+        else:
+            result[name] = [result[name], value]
+
+    text = ''.join(text).strip() or None
+    if not result:
+        return text
+    if text is not None:
+        result['#text'] = text
+    return result
+
+
+def _qualified_name(element, name, attribute=False):
+    if name[0] != '{':
+        return name
+    uri, local_name = name[1:].split('}', 1)
+    if uri == XML_NS:
+        return 'xml:' + local_name
+    if not attribute and element.prefix is not None:
+        return element.prefix + ':' + local_name
+    if not attribute:
+        return local_name
+    for prefix, value in element.nsmap.items():
+        if value == uri and prefix is not None:
+            return prefix + ':' + local_name
+    return local_name
+
+
+def header_fields(header):
+    """Return the fields of a header that `bulk_get_series` uses.
+
+    Like `element_to_dict(header)['header']`, but only for the fields in
+    HEADER_FIELDS (and faster).
+    """
+    result = {}
+    for child in header:
+        if not isinstance(child.tag, str):
+            continue
+        name = child.tag.rpartition('}')[2]
+        if name not in HEADER_FIELDS or name in result:
+            continue
+        if name == 'timeStep':
+            result[name] = {'@' + key: value
+                            for key, value in child.attrib.items()}
+        else:
+            result[name] = (child.text or '').strip() or None
+    return result
+
+
 def get_code(header):
     """Construct an ID from a PI XML time series header.
 
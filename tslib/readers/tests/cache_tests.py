@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from tslib.readers import PiXmlReader
+from tslib.readers.cache import ParseCache
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit(self):
+        """A hit returns the same results without parsing."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        cache = ParseCache()
+        expected = list(PiXmlReader(source, cache=cache).bulk_get_series())
+        with mock.patch('tslib.readers.pi_xml_reader.iterparse',
+                        side_effect=AssertionError):
+            result = list(PiXmlReader(source, cache=cache).bulk_get_series())
+        self.assertEqual((1, 1), cache.cache_info()[:2])
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertTrue(md1.equals(md2))
+            self.assertTrue(df1.equals(df2))
+
+    def test_arguments(self):
+        """Results are cached per method and arguments."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        reader = PiXmlReader(source, cache=ParseCache())
+        list(reader.get_series())
+        list(reader.bulk_get_series(chunk_size=1))
+        list(reader.bulk_get_series(chunk_size=2))
+        list(reader.bulk_get_series(chunk_size=1))
+        self.assertEqual(1, reader.cache.hits)
+        self.assertEqual(3, reader.cache.misses)
+
+    def test_disk(self):
+        """Entries on disk survive the cache object."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        for key in ('content', 'stat'):
+            list(PiXmlReader(
+                source, cache=ParseCache(self.tmpdir, key=key)).get_series())
+            cache = ParseCache(self.tmpdir, key=key)
+            list(PiXmlReader(source, cache=cache).get_series())
+            self.assertEqual(1, cache.hits)
+
+    def test_eviction(self):
+        """The least recently used entries are evicted."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        cache = ParseCache(max_bytes=1)
+        list(PiXmlReader(source, cache=cache).get_series())
+        self.assertEqual(0, cache.cache_info().currsize)
+        cache = ParseCache(self.tmpdir, max_disk_bytes=1)
+        list(PiXmlReader(source, cache=cache).get_series())
+        self.assertEqual([], os.listdir(self.tmpdir))
+        cache = ParseCache()
+        cache.put('a', 'a' * 100)
+        cache.put('b', 'b' * 100)
+        cache.get('a')
+        cache.max_bytes = cache.cache_info().currsize
+        cache.put('c', 'c' * 100)
+        self.assertEqual('a' * 100, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tslib.readers import PiXmlIngest
+from tslib.readers import PiXmlReader
+from tslib.readers.ingest import next_owners
+from tslib.readers.ingest import skip_sets
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestPiXmlIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["a.xml", "b.xml"]:
+            shutil.copy(os.path.join(DATA_DIR, "time_series.xml"),
+                        os.path.join(self.tmpdir, name))
+        shutil.copy(os.path.join(DATA_DIR, "GDresults_dam.xml"),
+                    os.path.join(self.tmpdir, "c.xml"))
+        with open(os.path.join(self.tmpdir, "d.xml"), 'w') as f:
+            f.write("<TimeSeries><series>")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_first(self):
+        """The series of the first file win, errors are reported."""
+        ingest = PiXmlIngest(os.path.join(self.tmpdir, '*.xml'),
+                             max_workers=2)
+        result = list(ingest)
+        self.assertEqual(['a.xml', 'c.xml'], sorted(
+            {os.path.basename(path) for path, _, _ in result}))
+        expected = list(PiXmlReader(ingest.paths[0]).bulk_get_series())
+        _, md, df = result[0]
+        self.assertTrue(expected[0][0].equals(md))
+        self.assertTrue(expected[0][1].equals(df))
+
+        reports = {os.path.basename(r.path): r for r in ingest.reports}
+        self.assertEqual(4, len(reports))
+        self.assertEqual((25, 8785), (reports['a.xml'].series,
+                                      reports['a.xml'].rows))
+        self.assertEqual((0, 0), (reports['b.xml'].series,
+                                  reports['b.xml'].rows))
+        self.assertIsNone(reports['c.xml'].error)
+        self.assertIn('XMLSyntaxError', reports['d.xml'].error)
+
+    def test_last(self):
+        """The series of the last file win, in any order."""
+        paths = [os.path.join(self.tmpdir, name)
+                 for name in ["a.xml", "b.xml", "c.xml", "e.xml"]]
+        ingest = PiXmlIngest(paths, policy='last', ordered=False,
+                             max_workers=2, max_pending=1, chunk_size=1000)
+        result = list(ingest)
+        self.assertEqual(['b.xml', 'c.xml'], sorted(
+            {os.path.basename(path) for path, _, _ in result}))
+        values = np.concatenate([df['value'].values for path, _, df in result
+                                 if path.endswith('b.xml')])
+        self.assertEqual(8785, len(values))
+        self.assertIn('FileNotFoundError', ingest.reports[0].error)
+
+    def test_failed(self):
+        """The pairs of a file that fails are read from the next one."""
+        with open(os.path.join(DATA_DIR, "time_series.xml"), 'rb') as f:
+            source = f.read()
+        end = 0
+        for _ in range(10):
+            end = source.index(b'</series>', end) + len(b'</series>')
+        # the first 10 series of a.xml are complete
+        with open(os.path.join(self.tmpdir, "a.xml"), 'wb') as f:
+            f.write(source[:end] + b'<series>')
+        paths = [os.path.join(self.tmpdir, name)
+                 for name in ["a.xml", "b.xml"]]
+        ingest = PiXmlIngest(paths, max_workers=2, chunk_size=1000)
+        result = list(ingest)
+        self.assertEqual({paths[1]}, {path for path, _, _ in result})
+        self.assertEqual(8785, sum(len(df) for _, _, df in result))
+        self.assertEqual(3, len(ingest.reports))
+        self.assertIn('XMLSyntaxError', ingest.reports[0].error)
+        self.assertEqual([], ingest.reports[0].missing)
+        # b.xml is read twice: its own 15 series, then the 10 of a.xml
+        self.assertEqual([15, 10], [r.series for r in ingest.reports[1:]])
+
+    def test_stop_early(self):
+        """The workers stop if the consumer does."""
+        ingest = PiXmlIngest(os.path.join(self.tmpdir, '*.xml'),
+                             max_workers=2, chunk_size=100)
+        for i, _ in enumerate(ingest):
+            if i == 2:
+                break
+        self.assertEqual([], ingest.reports)
+
+    def test_next_owners(self):
+        """The pairs that a file failed to read go to the next file."""
+        pairs = [[1, 2, 3], [2], None, [2, 3]]
+        self.assertEqual(({1: {2}, 3: {3}}, {1}),
+                         next_owners(pairs, {1, 2, 3}, 0, 'first'))
+        self.assertEqual(({3: {2, 3}}, {1}),
+                         next_owners(pairs, {1, 2, 3}, 0, 'first', {0, 1}))
+        self.assertEqual(({1: {2}}, set()),
+                         next_owners(pairs, {2}, 3, 'last'))
+
+    def test_skip_sets(self):
+        """The pairs that other files win are skipped."""
+        pairs = [[1, 2], None, [2, 3], [3]]
+        self.assertEqual([set(), set(), {2}, {3}],
+                         skip_sets(pairs, 'first'))
+        self.assertEqual([{2}, set(), {3}, set()],
+                         skip_sets(pairs, 'last'))
+        with self.assertRaises(ValueError):
+            PiXmlIngest([], policy='any')
@@ -0,0 +1,76 @@
+import unittest
+
+import pandas as pd
+import pytz
+
+from tslib.readers import ListReader
+
+
+class TestListReader(unittest.TestCase):
+
+    def test_get_series_01(self):
+        """Missing keys become None."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01T00:00:00Z', 'value': 1.0, 'c': 'x'},
+            {'datetime': '2020-01-01T00:15:00Z', 'value': 2.0},
+        ]}]
+        uuid, df = next(ListReader(serieslist).get_series())
+        self.assertEqual('a', uuid)
+        self.assertEqual(['value', 'c'], df.columns.tolist())
+        # None, or NaN if pandas infers a string dtype (pandas 3)
+        self.assertEqual('x', df['c'].iloc[0])
+        self.assertTrue(pd.isna(df['c'].iloc[1]))
+        self.assertEqual(pytz.UTC, df.index.tz)
+
+    def test_get_series_02(self):
+        """Duplicate datetimes are merged, the last value wins."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01T00:00:00Z', 'value': 1, 'c': 'x'},
+            {'datetime': '2020-01-01T00:15:00Z', 'value': 2},
+            {'datetime': '2020-01-01T00:00:00Z', 'value': 3},
+        ]}]
+        _, df = next(ListReader(serieslist).get_series())
+        self.assertEqual([3, 2], df['value'].tolist())
+        self.assertEqual('x', df['c'].iloc[0])
+        self.assertTrue(pd.isna(df['c'].iloc[1]))
+
+    def test_get_series_03(self):
+        """Fractional seconds, also mixed with whole seconds."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01T00:00:00.5Z', 'value': 1},
+            {'datetime': '2020-01-01T00:00:01.000250Z', 'value': 2},
+        ]}, {'uuid': 'b', 'events': [
+            {'datetime': '2020-01-01T00:00:00.5Z', 'value': 1},
+            {'datetime': '2020-01-01T00:00:01Z', 'value': 2},
+        ]}]
+        (_, df1), (_, df2) = ListReader(serieslist).get_series()
+        self.assertEqual(500000, df1.index[0].microsecond)
+        self.assertEqual(250, df1.index[1].microsecond)
+        self.assertEqual(df1.index[0], df2.index[0])
+        self.assertEqual(1, df2.index[1].second)
+        self.assertEqual('us', df1.index.unit)
+
+    def test_get_series_05(self):
+        """Datetimes parsed one by one have the same resolution."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01T00:00:00.5Z', 'value': 1},
+            {'datetime': '2020-1-1T0:0:1Z', 'value': 2},
+        ]}]
+        _, df = next(ListReader(serieslist).get_series())
+        self.assertEqual('us', df.index.unit)
+
+    def test_get_series_04(self):
+        """Invalid datetimes are rejected."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01 00:00:00Z', 'value': 1},
+        ]}]
+        self.assertRaises(
+            ValueError, list, ListReader(serieslist).get_series())
+
+    def test_get_series_06(self):
+        """A UTC offset is rejected, also where the widths match."""
+        serieslist = [{'uuid': 'a', 'events': [
+            {'datetime': '2020-01-01T00:00:00+01:00Z', 'value': 1},
+        ]}]
+        self.assertRaises(
+            ValueError, list, ListReader(serieslist).get_series())
@@ -0,0 +1,99 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+from tslib.readers import ParquetReader
+from tslib.readers import PiXmlReader
+from tslib.writers import ParquetWriter
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Two series, of which only the first has comments
+MIXED = b'''<?xml version="1.0" encoding="UTF-8"?>
+<TimeSeries xmlns="http://www.wldelft.nl/fews/PI" version="1.2">
+<timeZone>1.0</timeZone>
+<series>
+<header><type>instantaneous</type><locationId>A</locationId>
+<parameterId>P</parameterId><timeStep unit="nonequidistant"/>
+<missVal>-999.0</missVal></header>
+<event date="2020-01-01" time="00:00:00" value="1.0" comment="a"/>
+<event date="2020-01-02" time="00:00:00" value="2.0" comment="b"/>
+</series>
+<series>
+<header><type>instantaneous</type><locationId>B</locationId>
+<parameterId>P</parameterId><timeStep unit="nonequidistant"/>
+<missVal>-999.0</missVal></header>
+<event date="2020-01-01" time="00:00:00" value="3.0" flag="2"/>
+<event date="2020-01-02" time="00:00:00" value="4.0" flag="2"/>
+</series>
+</TimeSeries>
+'''
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestParquetReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.parquet')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, chunks):
+        with ParquetWriter(self.path) as writer:
+            for md, df in chunks:
+                writer.set_series(md, df)
+
+    def test_bulk_get_series_01(self):
+        """The chunks read back equal those written."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        expected = list(PiXmlReader(source).bulk_get_series(chunk_size=3000))
+        self.write(expected)
+        result = list(ParquetReader(self.path).bulk_get_series())
+        self.assertEqual(len(expected), len(result))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertTrue(md1.equals(md2))
+            self.assertTrue(df1.equals(df2))
+            self.assertEqual(df1.index.dtypes.tolist(),
+                             df2.index.dtypes.tolist())
+
+    def test_bulk_get_series_02(self):
+        """Only the requested columns are read."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        self.write(PiXmlReader(source).bulk_get_series(chunk_size=1))
+        for md, df in ParquetReader(self.path).bulk_get_series(['value']):
+            self.assertEqual(['value'], df.columns.tolist())
+            self.assertEqual(['code', 'location_code', 'timestamp'],
+                             df.index.names)
+
+    def test_bulk_get_series_03(self):
+        """Compact chunks having other attributes fit the same schema."""
+        reader = PiXmlReader(io.BytesIO(MIXED))
+        expected = list(reader.bulk_get_series(chunk_size=2, compact=True))
+        self.assertEqual([['comment', 'value'], ['flag', 'value']],
+                         [df.columns.tolist() for _, df in expected])
+        self.write(expected)
+        result = list(ParquetReader(self.path).bulk_get_series())
+        self.assertEqual(len(expected), len(result))
+        for (_, df1), (_, df2) in zip(expected, result):
+            self.assertEqual(df1.columns.tolist(), df2.columns.tolist())
+            for column in df1.columns:
+                self.assertEqual(df1[column].tolist(), df2[column].tolist())
+        self.assertEqual('Int32', str(result[1][1]['flag'].dtype))
+        # the columns of the first chunk are not required in the others
+        self.write(reversed(expected))
+        result = list(ParquetReader(self.path).bulk_get_series(['flag']))
+        self.assertEqual([['flag'], []],
+                         [df.columns.tolist() for _, df in result])
+        # columns that the schema does not have are not dropped silently
+        with self.assertRaises(ValueError):
+            self.write(expected + [(expected[0][0],
+                                    expected[0][1].assign(extra=1))])
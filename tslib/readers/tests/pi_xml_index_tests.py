@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from tslib.readers import PiXmlReader
+from tslib.readers import PiXmlIndex
+from tslib.readers.pi_xml_index import sidecar_path
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestPiXmlIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def copy(self, name):
+        path = os.path.join(self.tmpdir, name)
+        shutil.copy(os.path.join(DATA_DIR, name), path)
+        return path
+
+    def test_build(self):
+        """Every series has an entry, with the header metadata."""
+        source = self.copy("time_series.xml")
+        index = PiXmlIndex.build(source)
+        metadata = [md for md, _ in PiXmlReader(source).get_series()]
+        self.assertEqual(len(metadata), len(index.series))
+        entry = index.series[7]
+        self.assertEqual('CL::second::1::86400', entry['code'])
+        self.assertEqual('3201', entry['location_code'])
+        self.assertEqual('CL', entry['parameter_id'])
+        self.assertEqual('2010-01-01T00:00:00', entry['start'])
+        self.assertEqual('2010-01-01T00:00:00', entry['end'])
+        self.assertEqual(1, entry['event_count'])
+        with open(source, 'rb') as f:
+            f.seek(entry['offset'])
+            element = f.read(entry['length'])
+        self.assertTrue(element.startswith(b'<series>'))
+        self.assertTrue(element.endswith(b'</series>'))
+
+    def test_sidecar(self):
+        """The index is saved next to the file and rebuilt if stale."""
+        source = self.copy("GDresults_dam.xml")
+        index = PiXmlIndex.load(source)
+        self.assertTrue(os.path.exists(sidecar_path(source)))
+        with mock.patch.object(PiXmlIndex, 'build',
+                               side_effect=AssertionError):
+            self.assertEqual(index.series, PiXmlIndex.load(source).series)
+        os.utime(source, ns=(0, 0))
+        self.assertEqual(0, PiXmlIndex.load(source).mtime_ns)
+
+    def test_read_series(self):
+        """A single series equals the one of get_series."""
+        source = self.copy("time_series.xml")
+        for use_mmap in (False, True):
+            with PiXmlReader(source, use_mmap=use_mmap) as reader:
+                for expected_md, expected_df in reader.get_series():
+                    header = expected_md['header']
+                    md, df = reader.read_series(
+                        '{}::second::1::86400'.format(header['parameterId']),
+                        header['locationId'])
+                    self.assertEqual(expected_md, md)
+                    self.assertTrue(expected_df.equals(df))
+        with self.assertRaises(KeyError):
+            reader.read_series('CL::second::1::86400', '3201_PS2')
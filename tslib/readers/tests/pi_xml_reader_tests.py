@@ -1,7 +1,28 @@
+import asyncio
+import io
+import json
 import os
+import tempfile
 import unittest
+from datetime import datetime
 
+import numpy as np
+import pandas as pd
+import pytz
+import xmltodict
+from lxml import etree
+
+from tslib.readers import PiXmlIndex
 from tslib.readers import PiXmlReader
+from tslib.readers.pi_xml_reader import FIXED_WIDTH_EVENTS
+from tslib.readers.pi_xml_reader import HEADER_FIELDS
+from tslib.readers.pi_xml_reader import SERIES
+from tslib.readers.pi_xml_reader import element_to_dict
+from tslib.readers.pi_xml_reader import header_fields
+from tslib.readers.pi_xml_reader import load_marks
+from tslib.readers.pi_xml_reader import parse_event_datetimes
+from tslib.readers.pi_xml_reader import save_marks
+from tslib.readers.ts_reader import aiterate
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
@@ -75,6 +96,87 @@ class TestPiXmlReader(unittest.TestCase):
         for md, df in reader.get_series():
             self.assertEqual(None, df)
 
+    def test_parse_pi_xml_10(self):
+        """Stop parsing at the first series if there is no timeZone."""
+        with open(os.path.join(DATA_DIR, "no_tz.xml"), 'rb') as f:
+            xml = f.read()
+        start = xml.index(b'<series>')
+        end = xml.index(b'</TimeSeries>')
+        source = io.BytesIO(xml[:end] + 1000 * xml[start:end] + xml[end:])
+        reader = PiXmlReader(source)
+        self.assertEqual(None, reader.get_tz())
+        self.assertLess(source.tell(), len(source.getvalue()) / 10)
+
+    def test_parse_pi_xml_11(self):
+        """Filter series and events, and select attributes."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        result = list(reader.get_series(
+            parameters=['KWEL', 'Q'], locations=['3201', '3201_PS2'],
+            start=datetime(2009, 3, 1), end='2009-04-01T00:00:00',
+            attributes=[]))
+        self.assertEqual(
+            [('KWEL', '3201'), ('Q', '3201_PS2')],
+            [(md['header']['parameterId'], md['header']['locationId'])
+             for md, _ in result])
+        for _, df in result:
+            self.assertEqual(31, len(df))
+            self.assertEqual(['value'], df.columns.tolist())
+        with self.assertRaises(ValueError):
+            next(reader.get_series(attributes=['flags']))
+
+    def test_parse_pi_xml_12(self):
+        """Read the events after the high-water marks only."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        expected = {md['header']['parameterId'] + md['header']['locationId']:
+                    df for md, df in reader.get_series()}
+        marks = {}
+        self.assertEqual(25, len(list(reader.get_new_series(marks))))
+        self.assertEqual('2010-01-01T00:00:00',
+                         marks[('CL::second::1::86400', '3201')])
+        self.assertEqual([], list(reader.get_new_series(marks)))
+
+        marks[('Q::second::1::86400', '3201_PS1')] = '2009-12-29T00:00:00'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'marks.json')
+            save_marks(marks, path)
+            marks = load_marks(path)
+        marks[('KWEL::second::1::86400', '3201')] = datetime(2009, 12, 30)
+        result = list(reader.get_new_series(marks))
+        self.assertEqual(2, len(result))
+        for md, df in result:
+            key = md['header']['parameterId'] + md['header']['locationId']
+            self.assertTrue(expected[key].iloc[-len(df):].equals(df))
+        self.assertEqual([2, 3], [len(df) for _, df in result])
+        self.assertEqual('2010-01-01T00:00:00',
+                         marks[('KWEL::second::1::86400', '3201')])
+
+    def test_parse_pi_xml_13(self):
+        """Headers are converted as by xmltodict, without serializing."""
+        headers = []
+        for name in os.listdir(DATA_DIR):
+            for _, series in etree.iterparse(
+                    os.path.join(DATA_DIR, name), tag=SERIES):
+                headers.append(series[0])
+        xml = b"""<pi:TimeSeries xmlns:pi="http://www.wldelft.nl/fews/PI"
+            xmlns:q="urn:q"><pi:series><pi:header a="1" xml:lang="nl">
+            <!-- comment --><pi:lat> 52.1 </pi:lat><x q:y="2">t<b/>u</x>
+            <x/><q:z xmlns:r="urn:r"><r:w>1</r:w></q:z><x>3</x>
+            </pi:header></pi:series></pi:TimeSeries>"""
+        prefixed = etree.fromstring(xml)[0][0]
+        for header in headers + [prefixed]:
+            expected = xmltodict.parse(etree.tostring(header))
+            self.assertEqual(json.dumps(expected),
+                             json.dumps(element_to_dict(header)))
+        for header in headers:
+            expected = xmltodict.parse(etree.tostring(header))['header']
+            self.assertEqual(
+                {key: expected[key] for key in HEADER_FIELDS
+                 if key in expected},
+                header_fields(header))
+        self.assertEqual({'lat': '52.1'}, header_fields(prefixed))
+
 
 class BulkTestPiXmlReader(unittest.TestCase):
 
@@ -130,3 +232,325 @@ class BulkTestPiXmlReader(unittest.TestCase):
         reader = PiXmlReader(source)
         for md, df in reader.bulk_get_series(chunk_size=5):
             self.assertEqual(None, df)
+
+    def test_parse_pi_xml_10(self):
+        """Bulk values equal those of get_series, missVal included."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        reader = PiXmlReader(source)
+        _, expected = next(reader.get_series())
+        _, df = next(reader.bulk_get_series(chunk_size=3))
+        self.assertEqual(3, len(df))
+        np.testing.assert_array_equal(expected['value'][:3], df['value'])
+        self.assertEqual(2.0, df['flag'].iloc[0])
+        values = np.concatenate([
+            df['value'].values for _, df in reader.bulk_get_series(4)])
+        np.testing.assert_array_equal(expected['value'], values)
+        self.assertEqual(2, np.isnan(values).sum())
+
+    def test_parse_pi_xml_11(self):
+        """The compact layout has the same data, but smaller dtypes."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        reader = PiXmlReader(source)
+        expected = list(reader.bulk_get_series(chunk_size=1))
+        result = list(reader.bulk_get_series(chunk_size=1, compact=True))
+        self.assertEqual(len(expected), len(result))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertTrue(md1.equals(md2))
+            self.assertEqual(df1.index.tolist(), df2.index.tolist())
+            self.assertEqual(['comment', 'flag', 'user', 'value'],
+                             df2.columns.tolist())
+            np.testing.assert_array_equal(df1['value'], df2['value'])
+        # the categories are those of the whole file (so far)
+        self.assertEqual(2, len(df2.index.levels[1]))
+
+    def test_parse_pi_xml_12(self):
+        """Flags become a nullable Int32 in the compact layout."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        md, df = next(reader.bulk_get_series(chunk_size=5, compact=True))
+        self.assertEqual('Int32', str(df['flag'].dtype))
+        self.assertEqual([2] * 5, df['flag'].tolist())
+
+    def test_parse_pi_xml_13(self):
+        """Filter series and events, and select attributes."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        codes = ['KWEL::second::1::86400', 'CL::second::1::86400']
+        # 2009-12-31 23:00 UTC is 2010-01-01 00:00 in the file (GMT+1)
+        start = datetime(2009, 12, 31, 23, tzinfo=pytz.UTC)
+        md, df = next(reader.bulk_get_series(
+            codes=codes, start=start, attributes=['flag']))
+        self.assertEqual(['KWEL', 'CL', 'KWEL', 'KWEL', 'KWEL'],
+                         md['pru'].tolist())
+        self.assertEqual(5, len(df))
+        self.assertEqual(['flag', 'value'], df.columns.tolist())
+        self.assertEqual({'2010-01-01'}, set(
+            df.index.get_level_values('timestamp').strftime('%Y-%m-%d')))
+        md, df = next(reader.bulk_get_series(
+            compact=True, locations=['3201'], end='2009-01-02T00:00:00',
+            attributes=['comment']))
+        # the CL series has no events before 2010
+        self.assertEqual(9, len(df))
+        self.assertEqual(['value'], df.columns.tolist())
+
+    def test_parse_pi_xml_14(self):
+        """Chunks can be limited by a memory budget."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        chunks = list(reader.bulk_get_series(chunk_bytes=100000))
+        self.assertGreater(len(chunks), 2)
+        for _, df in chunks:
+            self.assertLessEqual(df.attrs['memory_usage'], 100000)
+        self.assertEqual(8785, sum(len(df) for _, df in chunks))
+        # the index levels count as well, in any layout
+        categories = PiXmlIndex.build(source).categories()
+        for compact, fixed in [(False, None), (True, None),
+                               (False, categories), (True, categories)]:
+            chunks = list(reader.bulk_get_series(
+                chunk_bytes=5000, compact=compact, categories=fixed))
+            for _, df in chunks:
+                self.assertLessEqual(df.attrs['memory_usage'], 5000)
+                self.assertEqual(
+                    df.memory_usage(deep=True).sum(),
+                    df.attrs['memory_usage'])
+            self.assertEqual(8785, sum(len(df) for _, df in chunks))
+
+    def test_parse_pi_xml_15(self):
+        """Series are not divided over chunks, if so desired."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        _, expected = next(reader.bulk_get_series())
+        chunks = list(reader.bulk_get_series(
+            chunk_size=1000, split_series=False))
+        self.assertEqual(12, len(chunks))
+        self.assertEqual(25, sum(len(md) for md, _ in chunks))
+        for md, df in chunks:
+            self.assertLessEqual(len(df), 1000)
+            self.assertEqual(
+                list(zip(md['code'], md['location_code'])),
+                df.index.droplevel('timestamp').unique().tolist())
+        values = np.concatenate([df['value'].values for _, df in chunks])
+        np.testing.assert_array_equal(expected['value'].values, values)
+        # a series larger than chunk_size gets a chunk of its own
+        chunks = list(reader.bulk_get_series(
+            chunk_size=100, split_series=False))
+        self.assertEqual([366, 366], [len(df) for _, df in chunks[:2]])
+
+    def test_parse_pi_xml_16(self):
+        """Chunks having the same categories can be concatenated."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        _, expected = next(reader.bulk_get_series())
+        categories = PiXmlIndex.build(source).categories()
+        for compact in [False, True]:
+            chunks = list(reader.bulk_get_series(
+                chunk_size=1000, compact=compact, categories=categories))
+            df = pd.concat([df for _, df in chunks])
+            for level in ['code', 'location_code']:
+                self.assertEqual(categories[level],
+                                 df.index.levels[df.index.names.index(
+                                     level)].categories.tolist())
+            self.assertEqual(expected.index.tolist(), df.index.tolist())
+        categories['code'] = categories['code'][1:]
+        with self.assertRaises(ValueError):
+            list(reader.bulk_get_series(categories=categories))
+
+
+class ParallelTestPiXmlReader(unittest.TestCase):
+
+    def test_parallel_get_series(self):
+        """The series equal those of get_series, also if unordered."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        reader = PiXmlReader(source)
+        expected = list(reader.get_series())
+        result = list(reader.parallel_get_series(
+            max_workers=2, batch_bytes=1))
+        self.assertEqual(len(expected), len(result))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertEqual(md1, md2)
+            self.assertTrue(df1.equals(df2))
+        result = list(reader.parallel_get_series(
+            max_workers=2, batch_bytes=1, ordered=False))
+        self.assertEqual(len(expected), len(result))
+
+    def test_parallel_bulk_get_series(self):
+        """The chunks equal those of bulk_get_series."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        expected = list(reader.bulk_get_series(chunk_size=1000))
+        for ordered in (True, False):
+            result = list(reader.parallel_bulk_get_series(
+                chunk_size=1000, max_workers=2, ordered=ordered))
+            self.assertEqual(len(expected), len(result))
+            for (md1, df1), (md2, df2) in zip(expected, result):
+                self.assertTrue(md1.equals(md2))
+                self.assertTrue(df1.equals(df2))
+                self.assertEqual(df1.index.levels[2].tz,
+                                 df2.index.levels[2].tz)
+
+
+class MmapTestPiXmlReader(unittest.TestCase):
+
+    def test_get_tz(self):
+        """The timeZone is found in the mapped bytes."""
+        for name, expected in [("time_series.xml", 1.0),
+                               ("empty_tz.xml", 0.0),
+                               ("no_tz.xml", None)]:
+            source = os.path.join(DATA_DIR, name)
+            with PiXmlReader(source, use_mmap=True) as reader:
+                self.assertEqual(expected, reader.get_tz())
+
+    def test_get_series(self):
+        """The map is shared by repeated parses."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        expected = list(PiXmlReader(source).get_series())
+        with PiXmlReader(source, use_mmap=True) as reader:
+            for _ in range(2):
+                result = list(reader.get_series())
+                self.assertEqual(len(expected), len(result))
+                for (md1, df1), (md2, df2) in zip(expected, result):
+                    self.assertEqual(md1, md2)
+                    self.assertTrue(df1.equals(df2))
+        self.assertIsNone(reader.mmap)
+
+    def test_bulk_get_series(self):
+        """Chunks equal those of an unmapped source."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        expected = list(PiXmlReader(source).bulk_get_series(1000))
+        with PiXmlReader(source, use_mmap=True) as reader:
+            result = list(reader.bulk_get_series(1000))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertTrue(md1.equals(md2))
+            self.assertTrue(df1.equals(df2))
+
+
+class ParseTestPiXmlReader(unittest.TestCase):
+
+    def test_parse(self):
+        """A single parse yields the results of all three methods."""
+        for name in ["GDresults_dam.xml", "empty_tz.xml", "no_events.xml",
+                     "no_tz.xml", "read.PI.timezone.missVal.xml",
+                     "time_series.xml"]:
+            source = os.path.join(DATA_DIR, name)
+            reader = PiXmlReader(source)
+            series, chunks, tzs = [], [], []
+            tz = reader.parse(
+                on_series=lambda md, df: series.append((md, df)),
+                on_chunk=lambda md, df: chunks.append((md, df)),
+                on_tz=tzs.append, chunk_size=1000)
+            self.assertEqual([reader.get_tz()], tzs)
+            self.assertEqual(reader.get_tz(), tz)
+            expected = list(reader.get_series())
+            self.assertEqual(len(expected), len(series))
+            for (md1, df1), (md2, df2) in zip(expected, series):
+                self.assertEqual(md1, md2)
+                if df1 is None:
+                    self.assertIsNone(df2)
+                else:
+                    self.assertTrue(df1.equals(df2))
+            expected = list(reader.bulk_get_series(chunk_size=1000))
+            self.assertEqual(len(expected), len(chunks))
+            for (md1, df1), (md2, df2) in zip(expected, chunks):
+                self.assertTrue(md1.equals(md2))
+                self.assertTrue(df1.equals(df2))
+
+    def test_parse_once(self):
+        """A file object is parsed once, without rewinding it."""
+        with open(os.path.join(DATA_DIR, "time_series.xml"), 'rb') as f:
+            source = io.BytesIO(f.read())
+        rows = []
+        tz = PiXmlReader(source).parse(
+            on_chunk=lambda md, df: rows.append(len(df)),
+            parameters=['KWEL'])
+        self.assertEqual(1.0, tz)
+        self.assertEqual([1464], rows)
+
+
+class DatetimesTestPiXmlReader(unittest.TestCase):
+
+    def test_parse_event_datetimes_01(self):
+        """Fixed-width dates and times equal those of pandas."""
+        index = pd.date_range(
+            '1899-12-31 22:00', '2101-01-01', freq='7333min')
+        dates = index.strftime('%Y-%m-%d').tolist()
+        times = index.strftime('%H:%M:%S').tolist()
+        result = parse_event_datetimes(dates, times)
+        self.assertEqual(np.int64, result.dtype)
+        self.assertEqual(index.as_unit('ns').asi8.tolist(), result.tolist())
+
+    def test_parse_event_datetimes_02(self):
+        """Other formats are parsed by the general parser."""
+        # few events are parsed one by one anyway
+        for n in [1, FIXED_WIDTH_EVENTS]:
+            result = parse_event_datetimes(
+                ['2012-10-16'] * 2 * n, ['12:00:00', '12:00:00.5'] * n)
+            self.assertEqual(
+                pd.DatetimeIndex(['2012-10-16 12:00',
+                                  '2012-10-16 12:00:00.5'] * n).as_unit(
+                                      'ns').asi8.tolist(),
+                result.tolist())
+            # a short and a long date are not taken for two proper dates
+            with self.assertRaises(ValueError):
+                parse_event_datetimes(['2012-10-1', '2012-10-166'] * n,
+                                      ['12:00:00', '12:00:00'] * n)
+            for date, time in [('2012-13-16', '12:00:00'),
+                               ('2013-02-29', '12:00:00'),
+                               ('2012-10-16', '12:61:00')]:
+                with self.assertRaises(ValueError):
+                    parse_event_datetimes([date] * n, [time] * n)
+
+    def test_parse_event_datetimes_03(self):
+        """No events have no datetimes."""
+        self.assertEqual([], parse_event_datetimes([], []).tolist())
+
+
+class AsyncTestPiXmlReader(unittest.IsolatedAsyncioTestCase):
+
+    async def test_aget_series(self):
+        """The series equal those of get_series."""
+        source = os.path.join(DATA_DIR, "GDresults_dam.xml")
+        reader = PiXmlReader(source)
+        expected = list(reader.get_series())
+        result = [item async for item in reader.aget_series()]
+        self.assertEqual(len(expected), len(result))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertEqual(md1, md2)
+            self.assertTrue(df1.equals(df2))
+
+    async def test_abulk_get_series(self):
+        """The chunks equal those of bulk_get_series, arguments included."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        expected = list(reader.bulk_get_series(1000, locations=['3201']))
+        result = [item async for item in reader.abulk_get_series(
+            1000, locations=['3201'], queue_size=1)]
+        self.assertEqual(len(expected), len(result))
+        for (md1, df1), (md2, df2) in zip(expected, result):
+            self.assertTrue(md1.equals(md2))
+            self.assertTrue(df1.equals(df2))
+
+    async def test_stop_early(self):
+        """The background thread stops if the consumer does."""
+        produced = []
+
+        def numbers():
+            while True:
+                produced.append(len(produced))
+                yield produced[-1]
+
+        iterator = aiterate(numbers, queue_size=1)
+        async for number in iterator:
+            if number == 2:
+                break
+        await iterator.aclose()
+        count = len(produced)
+        self.assertLess(count, 10)
+        await asyncio.sleep(0.01)
+        self.assertEqual(count, len(produced))
+
+    async def test_error(self):
+        """An error of the parser is raised by the iterator."""
+        reader = PiXmlReader(io.BytesIO(b'<TimeSeries>'))
+        with self.assertRaises(etree.XMLSyntaxError):
+            async for _ in reader.aget_series():
+                pass
@@ -1,3 +1,7 @@
+import asyncio
+import threading
+
+
 class TimeSeriesReader(object):
 
     def get_series(self):
@@ -5,3 +9,77 @@ class TimeSeriesReader(object):
 
     def bulk_get_series(self):
         raise NotImplementedError
+
+    def aget_series(self, *args, queue_size=2, **kwargs):
+        """Return an asynchronous iterator over `get_series`.
+
+        Usage:
+
+        async for metadata, dataframe in reader.aget_series():
+            await store(metadata, dataframe)
+
+        The series are parsed in a background thread, which runs ahead of
+        the consumer by at most queue_size items. The other arguments are
+        passed to `get_series`.
+        """
+        return aiterate(self.get_series, *args, queue_size=queue_size,
+                        **kwargs)
+
+    def abulk_get_series(self, *args, queue_size=2, **kwargs):
+        """Return an asynchronous iterator over `bulk_get_series`.
+
+        See `aget_series`.
+        """
+        return aiterate(self.bulk_get_series, *args, queue_size=queue_size,
+                        **kwargs)
+
+
+async def aiterate(function, *args, queue_size=2, **kwargs):
+    """Iterate over function(*args, **kwargs) in a background thread.
+
+    The items are passed through a bounded queue: the thread waits while
+    the queue is full, so that no more than queue_size items are kept in
+    memory. Exceptions are raised in the consumer. If the consumer stops
+    early, the thread stops after the item that it is producing.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item, error=None):
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(
+                queue.put((item, error)), loop).result()
+
+    def produce():
+        try:
+            iterator = function(*args, **kwargs)
+            for item in iterator:
+                if stop.is_set():
+                    break
+                put(item)
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        except BaseException as error:
+            put(None, error)
+        else:
+            put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Make room for a put that may be waiting, then wait for the end.
+        while not queue.empty():
+            queue.get_nowait()
+        await loop.run_in_executor(None, thread.join)
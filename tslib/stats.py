@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Stats(object):
+    """Per-stage wall time, counts and peaks of a reader or writer.
+
+    Pass a Stats object to `PiXmlReader`, `PiXmlWriter` or
+    `PiXmlStreamWriter` to have it filled. Usage:
+
+    stats = Stats()
+    reader = PiXmlReader(source, stats=stats)
+    for metadata, dataframe in reader.bulk_get_series():
+        pass
+    print(stats.to_prometheus())
+
+    Stages are timed by a pair of calls, which are cheap enough to be
+    made per series (but not per event):
+
+    started = stats.clock()
+    ...
+    started = stats.add_time('parse', started)
+
+    Without a Stats object, readers and writers use `NULL_STATS`, which
+    does nothing at all.
+
+    """
+    enabled = True
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.peaks = {}
+
+    def clock(self):
+        """Return the current time, to be passed to `add_time`."""
+        return time.perf_counter()
+
+    def add_time(self, stage, started):
+        """Add the time since started to a stage and return the time."""
+        now = time.perf_counter()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - started
+        return now
+
+    def count(self, name, n=1):
+        """Add n to a counter."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def peak(self, name, value):
+        """Keep the maximum of the values of name."""
+        if value > self.peaks.get(name, value - 1):
+            self.peaks[name] = value
+
+    def clear(self):
+        self.seconds.clear()
+        self.counts.clear()
+        self.peaks.clear()
+
+    def to_dict(self):
+        """Return the stats as a (JSON serializable) dict."""
+        return {
+            'seconds': dict(self.seconds),
+            'counts': dict(self.counts),
+            'peaks': dict(self.peaks),
+        }
+
+    def to_prometheus(self, prefix='tslib', labels=None):
+        """Return the stats in the Prometheus text exposition format.
+
+        Stage times become the counter `<prefix>_stage_seconds_total`
+        with a `stage` label, counts the counters `<prefix>_<name>_total`
+        and peaks the gauges `<prefix>_<name>`.
+        """
+        lines = []
+        name = '{}_stage_seconds_total'.format(prefix)
+        if self.seconds:
+            lines.append('# TYPE {} counter'.format(name))
+        for stage, seconds in sorted(self.seconds.items()):
+            lines.append('{}{} {!r}'.format(
+                name, _labels(labels, stage=stage), seconds))
+        for kind, suffix, values in [('counter', '_total', self.counts),
+                                     ('gauge', '', self.peaks)]:
+            for key, value in sorted(values.items()):
+                name = '{}_{}{}'.format(prefix, key, suffix)
+                lines.append('# TYPE {} {}'.format(name, kind))
+                lines.append('{}{} {!r}'.format(
+                    name, _labels(labels), value))
+        return ''.join(line + '\n' for line in lines)
+
+    def log(self, level=logging.INFO, log=None, **fields):
+        """Log the stats as a single JSON object (a structured log line).
+
+        Extra fields, e.g. the source, are added to the object.
+        """
+        record = dict(fields, **self.to_dict())
+        (log or logger).log(level, '%s', json.dumps(record, sort_keys=True))
+
+
+class NullStats(Stats):
+    """Stats that are not kept, for a close to zero overhead."""
+    enabled = False
+
+    def clock(self):
+        return 0.0
+
+    def add_time(self, stage, started):
+        return 0.0
+
+    def count(self, name, n=1):
+        pass
+
+    def peak(self, name, value):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+def _labels(labels, **extra):
+    labels = dict(labels or {}, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items())) + '}'
@@ -0,0 +1,95 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tslib.aggregation import Resampler
+from tslib.aggregation import resample
+from tslib.readers import PiXmlReader
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'readers', 'tests', 'data'
+)
+
+HOW = ['mean', 'min', 'max', 'sum', 'count', 'last']
+
+
+class TestResampler(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = PiXmlReader(os.path.join(DATA_DIR, "time_series.xml"))
+        _, self.dataframe = next(self.reader.bulk_get_series())
+
+    def assertFrameEqual(self, expected, result):
+        self.assertEqual(expected.index.tolist(), result.index.tolist())
+        np.testing.assert_allclose(expected.values.astype(float),
+                                   result.values.astype(float))
+
+    def test_resample(self):
+        """The result equals that of a resample per series."""
+        for closed, label, origin in [
+                ('left', 'left', 'epoch'), ('right', 'right', 'epoch'),
+                ('left', 'left', 'start_day'), ('right', 'left', 'start'),
+                ('left', 'right', '2000-01-01 03:00+01:00')]:
+            result = resample(self.dataframe, '7D', HOW, closed=closed,
+                              label=label, origin=origin).sort_index()
+            for (code, location_code), group in self.dataframe.groupby(
+                    level=['code', 'location_code'], observed=True):
+                series = group['value'].droplevel([0, 1])
+                # in hours, for days are not fixed to pandas 3
+                resampler = series.resample('168h', closed=closed,
+                                            label=label, origin=origin)
+                expected = resampler.agg(HOW)
+                # bins without events are not in the result
+                expected = expected[resampler.size() > 0]
+                np.testing.assert_allclose(
+                    expected.values.astype(float),
+                    result.loc[(code, location_code)].values.astype(float))
+
+    def test_chunks(self):
+        """Bins that continue in the next chunk are combined."""
+        expected = resample(self.dataframe, '7D', HOW)
+        chunks = self.reader.bulk_get_series(chunk_size=100)
+        result = pd.concat(list(Resampler('7D', HOW).chunks(chunks)))
+        self.assertFrameEqual(expected, result)
+        # the origin of a series holds in the next chunks
+        expected = resample(self.dataframe, '7D', HOW, origin='start')
+        chunks = self.reader.bulk_get_series(chunk_size=100)
+        result = pd.concat(list(Resampler(
+            '7D', HOW, origin='start').chunks(chunks)))
+        self.assertFrameEqual(expected, result)
+
+    def test_unsorted(self):
+        """Events do not need to be sorted by time."""
+        expected = resample(self.dataframe, '30D', HOW).sort_index()
+        result = resample(self.dataframe.iloc[::-1], '30D', HOW)
+        self.assertFrameEqual(expected, result.sort_index())
+
+    def test_max_flag(self):
+        """Events having a higher flag are left out."""
+        dataframe = self.dataframe.copy()
+        dataframe['flag'] = 0.0
+        dataframe.iloc[::2, dataframe.columns.get_loc('flag')] = 6.0
+        expected = resample(self.dataframe.iloc[1::2], '1D', ['count'])
+        result = resample(dataframe, '1D', ['count'], max_flag=5)
+        self.assertEqual(len(self.dataframe), len(result))
+        self.assertEqual(expected['count'].sum(), result['count'].sum())
+
+    def test_missing(self):
+        """Missing values are left out, empty bins have a NaN mean."""
+        dataframe = self.dataframe.iloc[:3].copy()
+        dataframe['value'] = [1.0, np.nan, np.nan]
+        result = resample(dataframe, '1D', ['mean', 'count', 'sum'])
+        self.assertEqual([1, 0, 0], result['count'].tolist())
+        self.assertEqual([1.0, 0.0, 0.0], result['sum'].tolist())
+        self.assertTrue(np.isnan(result['mean'].iloc[1]))
+
+    def test_frequency(self):
+        """Only fixed frequencies are supported."""
+        with self.assertRaises(ValueError):
+            Resampler('MS')
+        with self.assertRaises(ValueError):
+            Resampler('1D', how=['median'])
+        with self.assertRaises(ValueError):
+            Resampler('1D', origin='end')
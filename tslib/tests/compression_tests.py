@@ -0,0 +1,116 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from tslib.compression import DecompressingReader
+from tslib.compression import compress
+from tslib.compression import source_compression
+from tslib.compression import zstandard
+from tslib.readers import PiXmlIngest
+from tslib.readers import PiXmlReader
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'readers', 'tests', 'data'
+)
+
+COMPRESSIONS = ['gzip', 'zstd'] if zstandard is not None else ['gzip']
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(DATA_DIR, "time_series.xml")
+        with open(self.source, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def compressed(self, compression):
+        path = os.path.join(self.tmpdir, 'time_series.xml.' + compression)
+        with open(path, 'wb') as f:
+            f.write(compress(self.data, compression))
+        return path
+
+    def test_source_compression(self):
+        """Compression is recognized by the first bytes."""
+        self.assertIsNone(source_compression(self.source))
+        self.assertIsNone(source_compression(io.BytesIO(self.data)))
+        for compression in COMPRESSIONS:
+            path = self.compressed(compression)
+            self.assertEqual(compression, source_compression(path))
+            with open(path, 'rb') as f:
+                self.assertEqual(compression, source_compression(f))
+                self.assertEqual(0, f.tell())
+
+    def test_decompressing_reader(self):
+        """The decompressed bytes equal the original ones."""
+        for compression in COMPRESSIONS:
+            path = self.compressed(compression)
+            with DecompressingReader(path, block_size=1000) as f:
+                self.assertEqual(self.data[:10], f.read(10))
+                self.assertEqual(self.data[10:], f.read())
+                self.assertEqual(len(self.data), f.tell())
+                self.assertEqual(b'', f.read(10))
+
+    def test_close_early(self):
+        """The thread stops if the consumer does not read to the end."""
+        path = self.compressed('gzip')
+        f = DecompressingReader(path, queue_size=1, block_size=100)
+        f.read(10)
+        f.close()
+        self.assertFalse(f._thread.is_alive())
+
+    def test_corrupt(self):
+        """Errors of the thread are raised by read."""
+        data = compress(self.data, 'gzip')
+        with DecompressingReader(data[:len(data) // 2]) as f:
+            with self.assertRaises(EOFError):
+                f.read()
+
+    def test_reader(self):
+        """A compressed source is read as if it was not."""
+        reader = PiXmlReader(self.source)
+        _, expected = next(reader.bulk_get_series())
+        series = list(reader.get_series())
+        for compression in COMPRESSIONS:
+            path = self.compressed(compression)
+            sources = [path, open(path, 'rb')]
+            for source in sources:
+                reader = PiXmlReader(source)
+                self.assertEqual(1.0, reader.get_tz())
+                if not isinstance(source, str):
+                    source.seek(0)
+                _, df = next(reader.bulk_get_series())
+                self.assertTrue(expected.equals(df))
+            sources[1].close()
+            for (md1, df1), (md2, df2) in zip(
+                    series, PiXmlReader(path).get_series()):
+                self.assertEqual(md1, md2)
+                self.assertTrue(df1.equals(df2))
+
+    def test_mmap(self):
+        """A compressed source cannot be memory-mapped."""
+        with self.assertRaises(ValueError):
+            PiXmlReader(self.compressed('gzip'), use_mmap=True)
+
+    def test_ingest(self):
+        """Compressed files can be ingested."""
+        path = self.compressed('gzip')
+        ingest = PiXmlIngest([self.source, path], policy='last',
+                             max_workers=1)
+        chunks = list(ingest)
+        self.assertEqual({path}, {p for p, _, _ in chunks})
+        self.assertEqual([None, None], [r.error for r in ingest.reports])
+        self.assertEqual(8785, ingest.reports[1].rows)
+
+    def test_gzip_module(self):
+        """The output of the gzip module can be read."""
+        path = os.path.join(self.tmpdir, 'time_series.xml.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(self.data)
+        self.assertEqual(1.0, PiXmlReader(path).get_tz())
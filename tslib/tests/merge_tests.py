@@ -0,0 +1,112 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from tslib.merge import PiXmlMerge
+from tslib.readers import PiXmlReader
+from tslib.writers import PiXmlWriter
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'readers', 'tests', 'data'
+)
+
+
+def merged(merge):
+    """Return the concatenated chunks of a merge."""
+    return pd.concat([df for _, df in merge.chunks()])
+
+
+class TestPiXmlMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.first = os.path.join(DATA_DIR, "time_series.xml")
+        _, self.expected = next(PiXmlReader(self.first).bulk_get_series())
+        # The second file has other values and a worse flag for the
+        # events of June 2009 only.
+        self.second = os.path.join(self.tmpdir, 'second.xml')
+        writer = PiXmlWriter(1.0)
+        for md, df in PiXmlReader(self.first).get_series():
+            df = df[(df.index >= '2009-06-01') & (df.index < '2009-07-01')]
+            df = df.assign(value=df['value'] + 100, flag=6)
+            writer.set_series(md, df)
+        with open(self.second, 'wb') as out:
+            writer.write(out)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertMerged(self, expected, result):
+        self.assertEqual(expected.index.tolist(), result.index.tolist())
+        np.testing.assert_array_equal(expected['value'], result['value'])
+        np.testing.assert_array_equal(expected['flag'], result['flag'])
+
+    def second_wins(self):
+        """Return the expected result if the second file wins."""
+        expected = self.expected.copy()
+        timestamps = expected.index.get_level_values('timestamp')
+        june = (timestamps >= '2009-06-01') & (timestamps < '2009-07-01')
+        expected.loc[june, 'value'] += 100
+        expected.loc[june, 'flag'] = 6
+        return expected
+
+    def test_single_file(self):
+        """The merge of a single file is the file."""
+        result = merged(PiXmlMerge(self.first))
+        self.assertMerged(self.expected, result)
+        self.assertEqual(['flag', 'value'], list(result.columns))
+        self.assertEqual(str(self.expected.index.levels[2].tz),
+                         str(result.index.levels[2].tz))
+
+    def test_policies(self):
+        """The winner of a conflict depends on the policy."""
+        paths = [self.first, self.second]
+        self.assertMerged(self.second_wins(),
+                          merged(PiXmlMerge(paths, policy='last')))
+        self.assertMerged(self.expected,
+                          merged(PiXmlMerge(paths, policy='first')))
+        self.assertMerged(self.expected,
+                          merged(PiXmlMerge(paths, policy='best_flag')))
+        self.assertMerged(self.second_wins(),
+                          merged(PiXmlMerge(paths[::-1], policy='first')))
+
+    def test_runs(self):
+        """The result does not depend on the number of runs and blocks."""
+        merge = PiXmlMerge([self.second, self.first, self.second],
+                           run_rows=1000, block_rows=97)
+        result = pd.concat([df for _, df in merge.chunks(chunk_size=1234)])
+        self.assertMerged(self.second_wins(), result)
+
+    def test_chunks(self):
+        """Chunks have the metadata of their series and equal categories."""
+        chunks = list(PiXmlMerge(self.first).chunks(chunk_size=1000))
+        self.assertEqual(9, len(chunks))
+        categories = chunks[0][1].index.levels[0].categories.tolist()
+        for metadata, df in chunks:
+            self.assertEqual(
+                categories, df.index.levels[0].categories.tolist())
+            self.assertEqual(
+                sorted(set(df.index.get_level_values(0))),
+                sorted(metadata['code'].unique()))
+
+    def test_write(self):
+        """The merged file can be read back."""
+        out = io.BytesIO()
+        PiXmlMerge([self.first, self.second], policy='last').write(out)
+        out.seek(0)
+        reader = PiXmlReader(out)
+        self.assertEqual(1.0, reader.get_tz())
+        out.seek(0)
+        metadata, result = next(reader.bulk_get_series())
+        self.assertEqual(25, len(metadata))
+        self.assertMerged(self.second_wins(), result)
+
+    def test_policy(self):
+        """Unknown policies are refused."""
+        with self.assertRaises(ValueError):
+            PiXmlMerge(self.first, policy='best')
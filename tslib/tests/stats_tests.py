@@ -0,0 +1,73 @@
+import io
+import json
+import logging
+import os
+import unittest
+
+from tslib.readers import PiXmlReader
+from tslib.stats import NULL_STATS
+from tslib.stats import Stats
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'readers', 'tests', 'data'
+)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_bulk_get_series(self):
+        """A reader fills the stats of its stages."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        stats = Stats()
+        reader = PiXmlReader(source, stats=stats)
+        chunks = list(reader.bulk_get_series(chunk_size=5000))
+        self.assertEqual({'parse', 'header', 'events', 'dataframe',
+                          'tz_localize'}, set(stats.seconds))
+        self.assertEqual({'series': 25, 'events': 8785, 'chunks': 2,
+                          'bytes_read': os.path.getsize(source)},
+                         stats.counts)
+        self.assertEqual(
+            max(df.attrs['memory_usage'] for _, df in chunks),
+            stats.peaks['peak_chunk_bytes'])
+
+    def test_get_series(self):
+        """Also if the source is a file object."""
+        with open(os.path.join(DATA_DIR, "GDresults_dam.xml"), 'rb') as f:
+            source = io.BytesIO(f.read())
+        stats = Stats()
+        list(PiXmlReader(source, stats=stats).get_series())
+        self.assertEqual(2, stats.counts['series'])
+        self.assertEqual(len(source.getvalue()), stats.counts['bytes_read'])
+        self.assertIn('header', stats.seconds)
+
+    def test_disabled(self):
+        """Without stats, nothing is kept."""
+        source = os.path.join(DATA_DIR, "time_series.xml")
+        reader = PiXmlReader(source)
+        self.assertIs(NULL_STATS, reader.stats)
+        list(reader.bulk_get_series())
+        self.assertEqual({}, NULL_STATS.to_dict()['counts'])
+
+    def test_export(self):
+        """Stats can be exported as Prometheus text or a JSON log line."""
+        stats = Stats()
+        started = stats.clock()
+        stats.add_time('parse', started)
+        stats.count('series', 2)
+        stats.peak('peak_chunk_bytes', 10)
+        stats.peak('peak_chunk_bytes', 5)
+        text = stats.to_prometheus(labels={'source': 'a "b".xml'})
+        lines = text.splitlines()
+        self.assertEqual('# TYPE tslib_stage_seconds_total counter', lines[0])
+        self.assertTrue(lines[1].startswith(
+            'tslib_stage_seconds_total'
+            '{source="a \\"b\\".xml",stage="parse"} '))
+        self.assertEqual('tslib_series_total{source="a \\"b\\".xml"} 2',
+                         lines[3])
+        self.assertEqual('tslib_peak_chunk_bytes{source="a \\"b\\".xml"} 10',
+                         lines[5])
+        with self.assertLogs('tslib.stats', logging.INFO) as logs:
+            stats.log(source='a.xml')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual('a.xml', record['source'])
+        self.assertEqual({'series': 2}, record['counts'])
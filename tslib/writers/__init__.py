@@ -1,2 +1,4 @@
 # package
 from tslib.writers.pi_xml_writer import PiXmlWriter  # NOQA
+from tslib.writers.pi_xml_writer import PiXmlStreamWriter  # NOQA
+from tslib.writers.parquet_writer import ParquetWriter  # NOQA
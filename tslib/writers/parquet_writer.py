@@ -0,0 +1,144 @@
+# (c) Nelen & Schuurmans, see LICENSE.rst.
+
+import json
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+from .ts_writer import TimeSeriesWriter
+
+# The key of the chunk metadata in the key-value metadata of the file.
+METADATA_KEY = b'tslib'
+
+# The key of the columns of the chunks in the key-value metadata.
+COLUMNS_KEY = b'tslib_columns'
+
+# The optional columns (and their dtypes) of compact chunks, which have
+# them only if they have any such values, see `PiXmlReader.bulk_get_series`
+OPTIONAL_COLUMNS = [
+    ('comment', object),
+    ('flag_source', object),
+    ('flag', 'Int32'),
+    ('user', object),
+]
+
+
+class ParquetWriter(TimeSeriesWriter):
+    """Write the chunks of `PiXmlReader.bulk_get_series` to Parquet.
+
+    Every (metadata, dataframe) chunk becomes a row group. The MultiIndex
+    (code, location_code, timestamp), the categorical levels and the time
+    zone are preserved, so that `ParquetReader` returns the same chunks.
+    The metadata dataframes are stored as JSON in the file metadata.
+
+    All row groups have the columns of the schema, which is that of the
+    first chunk plus the optional columns that it does not have. A chunk
+    gets null columns for those that it does not have (e.g. the compact
+    chunks without any comments), and its own columns are stored in the
+    file metadata, so that they are read back as such.
+    Usage:
+
+    with ParquetWriter('cache.parquet') as writer:
+        for metadata, dataframe in reader.bulk_get_series():
+            writer.set_series(metadata, dataframe)
+
+    """
+
+    def __init__(self, where, compression='snappy'):
+        """docstring
+
+        Keyword arguments:
+        where -- path or (binary) file object
+        compression -- the Parquet compression codec (default 'snappy')
+
+        """
+        if pq is None:
+            raise ImportError("ParquetWriter requires pyarrow")
+        self.where = where
+        self.compression = compression
+        self.schema = None
+        self.metadata = []
+        self.columns = []
+        self._writer = None
+
+    def set_series(self, metadata, dataframe):
+        """Write a (metadata, dataframe) chunk as a row group.
+
+        Raises:
+            ValueError: if the chunk has a column that the schema has not
+        """
+        if self._writer is None:
+            template = with_columns(dataframe.iloc[:0], OPTIONAL_COLUMNS)
+            self.schema = bulk_schema(pa.Schema.from_pandas(template))
+            self._writer = pq.ParquetWriter(
+                self.where, self.schema, compression=self.compression)
+        extra = set(dataframe.columns) - set(self.schema.names)
+        if extra:
+            raise ValueError("columns not in the schema of the first "
+                             "chunk: {}".format(sorted(extra)))
+        columns = dataframe.columns.tolist()
+        # the dtypes of the null columns are cast to those of the schema
+        dataframe = with_columns(dataframe, [
+            (name, object) for name in self.schema.names
+            if name not in columns and name not in dataframe.index.names])
+        table = pa.Table.from_pandas(
+            dataframe, schema=self.schema, preserve_index=True)
+        self._writer.write_table(table, row_group_size=max(len(table), 1))
+        self.metadata.append(metadata.to_dict(orient='records'))
+        self.columns.append(columns)
+
+    def close(self):
+        """Write the chunk metadata and the Parquet footer."""
+        if self._writer is None:
+            return
+        self._writer.add_key_value_metadata({
+            METADATA_KEY: json.dumps(self.metadata),
+            COLUMNS_KEY: json.dumps(self.columns),
+        })
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def with_columns(dataframe, columns):
+    """Return the dataframe with null columns for those it does not have.
+
+    Args:
+        columns: (name, dtype) tuples
+    """
+    missing = {
+        name: pd.array([None] * len(dataframe), dtype=dtype)
+        for name, dtype in columns if name not in dataframe.columns
+    }
+    if not missing:
+        return dataframe
+    return dataframe.assign(**missing)
+
+
+def bulk_schema(schema):
+    """Return a schema that fits all chunks of a file.
+
+    The schema is derived from that of the first chunk, but columns
+    without any values in that chunk become strings and categorical
+    levels get room for more categories.
+
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(
+                pa.dictionary(pa.int32(), field.type.value_type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
@@ -1,7 +1,15 @@
+from contextlib import ExitStack
+
 from lxml import etree
+import numpy as np
+import pandas as pd
 import pytz
 import xmltodict
 
+from tslib.compression import compress
+from tslib.compression import compressor
+from tslib.stats import NULL_STATS
+
 from .ts_writer import TimeSeriesWriter
 
 
@@ -14,6 +22,17 @@ nsmap = {None: DNS, 'xsi': XSI}
 DATE_FMT = '%Y-%m-%d'
 TIME_FMT = '%H:%M:%S'
 
+# Characters to be escaped in (double-quoted) attribute values.
+ESCAPE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    '\t': '&#9;',
+    '\n': '&#10;',
+    '\r': '&#13;',
+})
+
 
 def set_datetime(md, df):
     md['header']['startDate']['@date'] = df.index[0].strftime(DATE_FMT)
@@ -22,50 +41,247 @@ def set_datetime(md, df):
     md['header']['endDate']['@time'] = df.index[-1].strftime(TIME_FMT)
 
 
+def series_element(metadata, dataframe, tz, stats=NULL_STATS):
+    """Return a `series` element for a (metadata, dataframe) tuple.
+
+    The events are written in time zone tz, or as they are if tz is None.
+    """
+    started = stats.clock()
+    series = etree.Element('series')
+
+    if not dataframe.empty:
+        if tz is not None:
+            dataframe = dataframe.tz_convert(tz)
+        set_datetime(metadata, dataframe)
+
+    header = xmltodict.unparse(metadata)
+    header = bytes(bytearray(header, encoding='utf-8'))
+    header = etree.XML(header)
+    series.append(header)
+    started = stats.add_time('header', started)
+    stats.count('series')
+
+    if dataframe.empty:
+        return series
+
+    # Serialize the events column by column instead of row by row and
+    # let libxml2 build the elements in one go. The attribute values are
+    # exactly those of str(row[col]) for the rows of dataframe.iterrows()
+    # (which is why the common dtype of dataframe.values is used).
+    columns = dataframe.columns.tolist()
+    miss_val = metadata['header'].get('missVal')
+    values = dataframe.values
+    dates, times = format_datetimes(dataframe.index)
+    strings = [dates.tolist(), times.tolist()]
+
+    for j, col in enumerate(columns):
+        column = values[:, j]
+        dtype = dataframe.dtypes.iloc[j]
+        if column.dtype == object and isinstance(dtype, np.dtype) and \
+                dtype.kind in 'biuf':
+            # A NumPy column that has been upcast to object: the Python
+            # numbers of the original column have the same strings, but
+            # are faster. Nullable (extension) columns may hold pd.NA.
+            attribute = list(map(str, dataframe.iloc[:, j].values.tolist()))
+        elif column.dtype.kind == 'f' and column.dtype.itemsize < 8:
+            # The Python float of e.g. a float32 has more digits.
+            attribute = list(map(str, column))
+        elif column.dtype.kind in 'biuf':
+            attribute = list(map(str, column.tolist()))
+        else:
+            attribute = [str(v).translate(ESCAPE) for v in column]
+        if col == 'value' and miss_val is not None:
+            for i in np.flatnonzero(pd.isna(column)):
+                attribute[i] = str(miss_val).translate(ESCAPE)
+        strings.append(attribute)
+
+    started = stats.add_time('format', started)
+
+    template = '<event date="%s" time="%s"{}/>'.format(
+        ''.join(' {}="%s"'.format(col) for col in columns))
+    events = etree.fromstring(
+        '<series>{}</series>'.format(
+            ''.join(map(template.__mod__, zip(*strings)))))
+    series.extend(events)
+    stats.add_time('events', started)
+    stats.count('events', len(dataframe))
+
+    return series
+
+
+def format_datetimes(index):
+    """Return the dates and times of a DatetimeIndex as arrays of strings.
+
+    The result equals that of index.strftime(DATE_FMT) and
+    index.strftime(TIME_FMT), but is computed by NumPy.
+
+    """
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    stamps = index.values.astype('datetime64[s]').astype('U19')
+    chars = stamps.view('U1').reshape(-1, 19)
+    dates = np.ascontiguousarray(chars[:, :10]).view('U10').ravel()
+    times = np.ascontiguousarray(chars[:, 11:]).view('U8').ravel()
+    return dates, times
+
+
+def tell(out):
+    """Return the position of a file object, or None if unsupported."""
+    try:
+        return out.tell()
+    except (AttributeError, OSError):
+        return None
+
+
 class PiXmlWriter(TimeSeriesWriter):
     """docstring"""
 
-    def __init__(self, offset_in_hours=0.0):
+    def __init__(self, offset_in_hours=0.0, stats=None):
         """docstring
 
         Keyword arguments:
         offset_in_hours -- fixed offset in hours from UTC (default 0.0)
+        stats -- a `tslib.stats.Stats` to be filled (default None)
 
         Most time zones are offset from UTC by a whole number of hours,
         but a few are offset by 30 or 45 minutes. Pass `None` to omit
-        the optional timeZone element in the resulting xml.
+        the optional timeZone element in the resulting xml. The events
+        are then written in the time zone of their dataframe.
+
+        The stats get the time of the stages of a series (header, format
+        and events) and of writing, and the number of series, events and
+        bytes written.
 
         """
+        self.stats = stats or NULL_STATS
         self.root = etree.Element('TimeSeries', nsmap=nsmap)
         self.root.attrib['{%s}schemaLocation' % XSI] = "%s %s" % (DNS, XSD)
         self.root.attrib['version'] = '1.2'
+        self.tz = None
         if offset_in_hours is not None:
             etree.SubElement(self.root, 'timeZone').text = str(offset_in_hours)
             self.tz = pytz.FixedOffset(offset_in_hours * 60)
 
     def set_series(self, metadata, dataframe):
         """docstring"""
-        series = etree.SubElement(self.root, 'series')
+        self.root.append(
+            series_element(metadata, dataframe, self.tz, self.stats))
+
+    def write(self, out, pretty_print=True, compression=None, level=None):
+        """docstring
 
-        if not dataframe.empty:
-            dataframe.tz_convert(self.tz, copy=False)
-            set_datetime(metadata, dataframe)
+        Keyword arguments:
+        pretty_print -- indent the elements (default True)
+        compression -- 'gzip' or 'zstd' to compress the xml (default None)
+        level -- the compression level, see `tslib.compression.compressor`
 
-        header = xmltodict.unparse(metadata)
-        header = bytes(bytearray(header, encoding='utf-8'))
-        header = etree.XML(header)
-        series.append(header)
+        """
+        started = self.stats.clock()
+        xml = etree.tostring(self.root, pretty_print=pretty_print)
+        if compression is not None:
+            xml = compress(xml, compression, level)
+        out.write(xml)
+        self.stats.add_time('write', started)
+        self.stats.count('bytes_written', len(xml))
 
-        if dataframe.empty:
-            return
 
-        for idx, row in dataframe.iterrows():
-            event = etree.SubElement(series, 'event')
-            event.attrib['date'] = idx.strftime(DATE_FMT)
-            event.attrib['time'] = idx.strftime(TIME_FMT)
-            for col in dataframe.columns.tolist():
-                event.attrib[col] = str(row[col])
+class PiXmlStreamWriter(TimeSeriesWriter):
+    """Write a PI XML document incrementally to a binary file object.
 
-    def write(self, out, pretty_print=True):
-        """docstring"""
-        out.write(etree.tostring(self.root, pretty_print=pretty_print))
+    Contrary to `PiXmlWriter`, which keeps the complete document in
+    memory until `write` is called, every series is serialized and
+    flushed to `out` as soon as it is set. Memory usage therefore
+    does not depend on the size of the export. Usage:
+
+    with open('export.xml', 'wb') as out:
+        with PiXmlStreamWriter(out, offset_in_hours=1.0) as writer:
+            for metadata, dataframe in series:
+                writer.set_series(metadata, dataframe)
+
+    """
+
+    def __init__(self, out, offset_in_hours=0.0, pretty_print=True,
+                 stats=None, compression=None, level=None):
+        """docstring
+
+        Keyword arguments:
+        offset_in_hours -- fixed offset in hours from UTC (default 0.0)
+        pretty_print -- indent the series elements (default True)
+        stats -- a `tslib.stats.Stats` to be filled (default None)
+        compression -- 'gzip' or 'zstd' to compress the output (default
+            None). The compressed stream is finished by `close`.
+        level -- the compression level, see `tslib.compression.compressor`
+
+        See `PiXmlWriter` for the meaning of `offset_in_hours` and stats.
+        Bytes written are only counted if `out` supports `tell`. They are
+        the compressed bytes, if compressed.
+
+        """
+        self.out = out
+        self.compression = compression
+        self.level = level
+        self.stats = stats or NULL_STATS
+        self.offset_in_hours = offset_in_hours
+        self.pretty_print = pretty_print
+        self.tz = None
+        if offset_in_hours is not None:
+            self.tz = pytz.FixedOffset(offset_in_hours * 60)
+        self._stack = None
+        self._xf = None
+        self._position = None
+
+    def open(self):
+        """Write the TimeSeries start tag and the optional timeZone."""
+        self._position = tell(self.out) if self.stats.enabled else None
+        self._stack = ExitStack()
+        out = self.out
+        if self.compression is not None:
+            # closed (i.e. finished) after the TimeSeries end tag
+            out = self._stack.enter_context(
+                compressor(out, self.compression, self.level))
+        self._xf = self._stack.enter_context(
+            etree.xmlfile(out, encoding='UTF-8'))
+        self._xf.write_declaration()
+        self._stack.enter_context(self._xf.element(
+            'TimeSeries',
+            attrib={
+                '{%s}schemaLocation' % XSI: "%s %s" % (DNS, XSD),
+                'version': '1.2',
+            },
+            nsmap=nsmap,
+        ))
+        if self.offset_in_hours is not None:
+            timezone = etree.Element('timeZone')
+            timezone.text = str(self.offset_in_hours)
+            self._xf.write(timezone, pretty_print=self.pretty_print)
+        self._xf.flush()
+
+    def set_series(self, metadata, dataframe):
+        """Serialize a series and flush it to the output stream."""
+        if self._xf is None:
+            self.open()
+        element = series_element(metadata, dataframe, self.tz, self.stats)
+        started = self.stats.clock()
+        self._xf.write(element, pretty_print=self.pretty_print)
+        self._xf.flush()
+        self.stats.add_time('write', started)
+
+    def close(self):
+        """Write the TimeSeries end tag. The output stream stays open.
+
+        If compressed, the compressed stream is finished as well.
+        """
+        if self._xf is None:
+            self.open()
+        self._stack.close()
+        self._stack = None
+        self._xf = None
+        if self._position is not None:
+            self.stats.count('bytes_written', tell(self.out) - self._position)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
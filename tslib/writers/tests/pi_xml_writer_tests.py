@@ -0,0 +1,239 @@
+import gzip
+import io
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from tslib.compression import source_compression
+from tslib.compression import zstandard
+from tslib.readers import PiXmlReader
+from tslib.stats import Stats
+from tslib.writers import PiXmlStreamWriter
+from tslib.writers import PiXmlWriter
+from tslib.writers.pi_xml_writer import DATE_FMT
+from tslib.writers.pi_xml_writer import TIME_FMT
+from tslib.writers.pi_xml_writer import format_datetimes
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, 'readers', 'tests', 'data'
+)
+
+
+def read(source):
+    """Return (metadata, dataframe) tuples having a UTC index."""
+    result = []
+    for md, df in PiXmlReader(source).get_series():
+        if df.index.tz is None:
+            df = df.tz_localize('UTC')
+        result.append((md, df.tz_convert('UTC')))
+    return result
+
+
+def header():
+    """Return the metadata of a series, as much as the writers need."""
+    return {'header': {
+        'startDate': {'@date': '', '@time': ''},
+        'endDate': {'@date': '', '@time': ''},
+    }}
+
+
+class TestPiXmlStreamWriter(unittest.TestCase):
+
+    def test_write_01(self):
+        """Streamed series can be read back."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        out = io.BytesIO()
+        with PiXmlStreamWriter(out, offset_in_hours=1.0) as writer:
+            for md, df in read(source):
+                writer.set_series(md, df)
+        out.seek(0)
+        reader = PiXmlReader(out)
+        self.assertEqual(1.0, reader.get_tz())
+        out.seek(0)
+        for (md1, df1), (md2, df2) in zip(read(source), read(out)):
+            self.assertEqual(md1['header']['locationId'],
+                             md2['header']['locationId'])
+            self.assertTrue(df1['value'].equals(df2['value']))
+
+    def test_write_02(self):
+        """Each series is flushed as soon as it is set."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        out = io.BytesIO()
+        writer = PiXmlStreamWriter(out)
+        writer.open()
+        size = len(out.getvalue())
+        for md, df in read(source):
+            writer.set_series(md, df)
+            self.assertGreater(len(out.getvalue()), size)
+            size = len(out.getvalue())
+        writer.close()
+        self.assertTrue(out.getvalue().rstrip().endswith(b'</TimeSeries>'))
+
+    def test_write_03(self):
+        """The same series are written as by PiXmlWriter."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        writer = PiXmlWriter(1.0)
+        for md, df in read(source):
+            writer.set_series(md, df)
+        out1 = io.BytesIO()
+        writer.write(out1)
+        out2 = io.BytesIO()
+        with PiXmlStreamWriter(out2, offset_in_hours=1.0) as writer:
+            for md, df in read(source):
+                writer.set_series(md, df)
+        out1.seek(0)
+        out2.seek(0)
+        for (md1, df1), (md2, df2) in zip(read(out1), read(out2)):
+            self.assertEqual(md1, md2)
+            self.assertTrue(df1.equals(df2))
+
+    def test_write_04(self):
+        """The stats of the writer are filled."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        out = io.BytesIO()
+        stats = Stats()
+        with PiXmlStreamWriter(out, stats=stats) as writer:
+            for md, df in read(source):
+                writer.set_series(md, df)
+        self.assertEqual({'header', 'format', 'events', 'write'},
+                         set(stats.seconds))
+        self.assertEqual(len(out.getvalue()), stats.counts['bytes_written'])
+        self.assertEqual(len(read(source)), stats.counts['series'])
+
+    def test_write_05(self):
+        """The output can be compressed."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        compressions = ['gzip'] if zstandard is None else ['gzip', 'zstd']
+        for compression in compressions:
+            out = io.BytesIO()
+            with PiXmlStreamWriter(out, offset_in_hours=1.0,
+                                   compression=compression) as writer:
+                for md, df in read(source):
+                    writer.set_series(md, df)
+            self.assertEqual(compression, source_compression(out.getvalue()))
+            out.seek(0)
+            for (md1, df1), (md2, df2) in zip(read(source), read(out)):
+                self.assertEqual(md1['header']['locationId'],
+                                 md2['header']['locationId'])
+                self.assertTrue(df1['value'].equals(df2['value']))
+
+    def test_write_06(self):
+        """Without an offset, there is no timeZone and no conversion."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        out = io.BytesIO()
+        with PiXmlStreamWriter(out, offset_in_hours=None) as writer:
+            for md, df in PiXmlReader(source).get_series():
+                writer.set_series(md, df)
+        out.seek(0)
+        self.assertIsNone(PiXmlReader(out).get_tz())
+        out.seek(0)
+        for (md1, df1), (md2, df2) in zip(PiXmlReader(source).get_series(),
+                                          PiXmlReader(out).get_series()):
+            self.assertTrue(df1['value'].tz_localize(None).equals(
+                df2['value']))
+
+
+class TestPiXmlWriter(unittest.TestCase):
+
+    def test_format_datetimes(self):
+        """Dates and times equal those of strftime."""
+        index = pd.date_range(
+            '1969-12-31 23:00', periods=100, freq='7333s', tz='Etc/GMT-1')
+        dates, times = format_datetimes(index)
+        self.assertEqual(index.strftime(DATE_FMT).tolist(), dates.tolist())
+        self.assertEqual(index.strftime(TIME_FMT).tolist(), times.tolist())
+
+    def test_set_series_01(self):
+        """Missing values are written as missVal."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        writer = PiXmlWriter(2.0)
+        for md, df in read(source):
+            writer.set_series(md, df)
+        events = writer.root[1].findall('event')
+        self.assertEqual(10, len(events))
+        self.assertEqual('-999.0', events[5].attrib['value'])
+        self.assertEqual('24.0', events[6].attrib['value'])
+        self.assertEqual('2', events[6].attrib['flag'])
+
+    def test_set_series_02(self):
+        """Attribute values are escaped."""
+        comment = 'a "quoted" <&>\ncomment'
+        df = pd.DataFrame(
+            {'value': [1.5], 'comment': [comment]},
+            index=pd.DatetimeIndex(['2020-01-01 12:00'], tz='UTC'),
+        )
+        md = {'header': {
+            'startDate': {'@date': '', '@time': ''},
+            'endDate': {'@date': '', '@time': ''},
+        }}
+        writer = PiXmlWriter()
+        writer.set_series(md, df)
+        event = writer.root[1][1]
+        self.assertEqual('2020-01-01', event.attrib['date'])
+        self.assertEqual('12:00:00', event.attrib['time'])
+        self.assertEqual('1.5', event.attrib['value'])
+        self.assertEqual(comment, event.attrib['comment'])
+
+    def test_set_series_03(self):
+        """Without an offset, the events are written as they are."""
+        df = pd.DataFrame(
+            {'value': [1.5]},
+            index=pd.DatetimeIndex(['2020-01-01 12:00'], tz='Etc/GMT-2'),
+        )
+        md = {'header': {
+            'startDate': {'@date': '', '@time': ''},
+            'endDate': {'@date': '', '@time': ''},
+        }}
+        writer = PiXmlWriter(None)
+        writer.set_series(md, df)
+        self.assertEqual('series', writer.root[0].tag)
+        event = writer.root[0][1]
+        self.assertEqual('2020-01-01', event.attrib['date'])
+        self.assertEqual('12:00:00', event.attrib['time'])
+
+    def test_set_series_04(self):
+        """A missing value of a nullable column is written as <NA>."""
+        df = pd.DataFrame(
+            {'value': [1.5, 2.5],
+             'flag': pd.array([1, None], dtype='Int32')},
+            index=pd.DatetimeIndex(['2020-01-01 12:00', '2020-01-01 13:00'],
+                                   tz='UTC'),
+        )
+        writer = PiXmlWriter()
+        writer.set_series(header(), df)
+        events = writer.root[1].findall('event')
+        self.assertEqual(['1', '<NA>'], [e.attrib['flag'] for e in events])
+        self.assertIn(b'flag="&lt;NA&gt;"', etree.tostring(writer.root))
+
+    def test_set_series_05(self):
+        """The values are those of DataFrame.iterrows, of any dtype."""
+        index = pd.DatetimeIndex(['2020-01-01 12:00', '2020-01-01 13:00'],
+                                 tz='UTC')
+        value = np.array([0.1, np.nan], dtype=np.float32)
+        for df in [
+                pd.DataFrame({'value': value}, index=index),
+                pd.DataFrame({'value': value, 'flag': [1, 2]}, index=index),
+                pd.DataFrame({'value': value, 'comment': ['a', 'b']},
+                             index=index),
+        ]:
+            writer = PiXmlWriter()
+            writer.set_series(header(), df)
+            events = writer.root[1].findall('event')
+            for col in df.columns:
+                self.assertEqual(
+                    [str(row[col]) for _, row in df.iterrows()],
+                    [e.attrib[col] for e in events])
+
+    def test_write(self):
+        """The document can be compressed."""
+        source = os.path.join(DATA_DIR, "read.PI.timezone.missVal.xml")
+        writer = PiXmlWriter(1.0)
+        for md, df in read(source):
+            writer.set_series(md, df)
+        out = io.BytesIO()
+        writer.write(out, compression='gzip')
+        self.assertEqual(etree.tostring(writer.root, pretty_print=True),
+                         gzip.decompress(out.getvalue()))